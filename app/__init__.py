@@ -14,7 +14,10 @@ db = SQLAlchemy()
 migrate = Migrate()
 
 # Initialize Slack client
-slack_client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
+slack_client = WebClient(
+    token=os.environ.get("SLACK_BOT_TOKEN"),
+    base_url=os.environ.get("SLACK_API_URL", WebClient.BASE_URL),
+)
 
 
 def create_app():
@@ -36,4 +39,36 @@ def create_app():
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp)
 
+    from app.embeddings import embed_backfill_command, start_embedding_worker
+    from app.job_queue import job_worker_command, requeue_dead_jobs_command
+    from app.metrics import start_gauge_updates
+    from app.retrieval import chunk_backfill_command
+    from app.user_directory import start_user_sync, sync_users_command
+
+    app.cli.add_command(sync_users_command)
+    app.cli.add_command(embed_backfill_command)
+    app.cli.add_command(chunk_backfill_command)
+    app.cli.add_command(job_worker_command)
+    app.cli.add_command(requeue_dead_jobs_command)
+
+    # Fail at startup rather than on the first event
+    if os.environ.get("EVENT_PIPELINE", "threaded") == "async":
+        from app.async_pipeline import check_worker_support
+
+        check_worker_support()
+
+    # Load bot contexts up front so the first Slack event doesn't pay for it
+    if os.environ.get("BOT_CACHE_WARM", "true").lower() == "true":
+        from app.bot_cache import warm_bot_cache
+        from app.routes import logger
+
+        warm_bot_cache(app, logger)
+
+    # Optionally keep the user table in step with the Slack directory
+    start_user_sync(app)
+    # Optionally embed new and edited messages and documents in the background
+    start_embedding_worker(app)
+    # Keep the queue depth gauges on /metrics current
+    start_gauge_updates(app)
+
     return app
@@ -0,0 +1,794 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import aiohttp
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+from sqlalchemy import select, text as sql_text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.models import Message, User
+from app.llm_client import (
+    LLMClientBase,
+    LLMError,
+    RETRYABLE_STATUS_CODES,
+    count_llm_calls,
+)
+from app.admission import admission_scope
+from app.coalesce import coalesce_window, conversation_key, get_coalescer
+from app.dedup import get_dedup_cache, insert_messages
+from app.bot_cache import get_cached_bots, get_router_descriptions
+from app.history import (
+    get_conversation_history,
+    history_cache_enabled,
+    history_length,
+    with_pending,
+)
+from app.metrics import record_event, record_llm_usage, stage
+from app.message_writer import (
+    get_message_writer,
+    pending_messages,
+    write_behind_enabled,
+)
+from app.response_cache import get_response_cache, response_cache_enabled
+from app.retrieval import top_k
+from app.user_directory import (
+    get_user_cache,
+    placeholder_row,
+    profile_row,
+    upsert_users,
+)
+from app.speculation import (
+    guess_bot,
+    record_speculation,
+    remember_answer,
+    speculation_enabled,
+)
+from app.vector_router import record_confidence, record_route
+from app.fan_out import (
+    build_multi_router_request,
+    format_merged_reply,
+    merge_replies,
+    multi_bot_concurrency,
+    multi_bot_deadline,
+    multi_bot_enabled,
+    multi_bot_max,
+    parse_multi_router_response,
+    record_fan_out,
+)
+from app.gpt_utils import (
+    CHAT_MODEL,
+    bot_profiles,
+    build_router_request,
+    choose_bot_by_embedding,
+    format_gpt_request,
+    join_query_context,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLLMClient(LLMClientBase):
+    """
+    aiohttp counterpart of LLMClient with the same retry policy and counters
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            connect_timeout, read_timeout = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=connect_timeout, sock_read=read_timeout
+                ),
+            )
+        return self._session
+
+    async def post(self, path, payload):
+        """
+        POST a JSON payload, retrying transient failures
+
+        Args:
+            path (str): The API path, e.g. "/chat/completions"
+            payload (dict): The request body
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            LLMError: If the request still fails after all retries
+        """
+        url = f"{self.base_url}{path}"
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            headers = status = None
+            try:
+                async with self._get_session().post(
+                    url, headers=self._headers(), json=payload
+                ) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        self._record(path, time.monotonic() - start, attempt, False)
+                        record_llm_usage(path, data)
+                        return data
+                    body = await response.text()
+                    headers, status = response.headers, response.status
+                    error = LLMError(f"Error from OpenAI API: {body}", status)
+                    retryable = status in RETRYABLE_STATUS_CODES
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = LLMError(f"Error connecting to OpenAI API: {str(e)}")
+                retryable = True
+
+            if not retryable or attempt >= self.max_retries:
+                self._record(path, time.monotonic() - start, attempt, True)
+                raise error
+
+            delay = self._backoff(attempt, headers, status)
+            self._log_retry(path, status, delay, attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def chat_completion(self, payload):
+        ticket = await self._admit_async(payload)
+        response = await self.post("/chat/completions", payload)
+        self._settle(ticket, response)
+        return response
+
+    async def embeddings(self, payload):
+        return await self.post("/embeddings", payload)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def async_database_url(url):
+    """Point a postgresql:// URL at the asyncpg driver"""
+    scheme, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgres") else url
+
+
+class AsyncEventPipeline:
+    """
+    Runs Slack event processing on an event loop in a background thread
+
+    The steps match process_slack_event/process_bot_responses, but use
+    aiohttp for the LLM API, slack_sdk's AsyncWebClient and SQLAlchemy's
+    asyncio engine over asyncpg, so waiting on the network doesn't hold an
+    OS thread. The bot cache, router counters and response cache are shared
+    with the threaded path.
+
+    ``submit`` is called from request handlers; it hands the event to the
+    loop without blocking and refuses new work once ``max_in_flight``
+    events are being processed.
+    """
+
+    def __init__(self, flask_app, max_in_flight=1000):
+        self.flask_app = flask_app
+        self.max_in_flight = max_in_flight
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        # Slack user ID -> task resolving it, shared by concurrent events
+        self._user_lookups = {}
+
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the event loop thread and its clients if not already running"""
+        check_worker_support()
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run_loop, name="slack-event-loop", daemon=True
+            )
+            self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # Clients are created on the loop they will be used from
+        database_url = self.flask_app.config["SQLALCHEMY_DATABASE_URI"]
+        self.engine = create_async_engine(
+            async_database_url(database_url),
+            pool_size=int(os.environ.get("ASYNC_DB_POOL_SIZE", "20")),
+            max_overflow=0,
+        )
+        # One event loop can keep far more requests open than a thread pool
+        self.llm = AsyncLLMClient(
+            pool_size=int(os.environ.get("ASYNC_LLM_POOL_SIZE", "100"))
+        )
+        self.slack = AsyncWebClient(
+            token=os.environ.get("SLACK_BOT_TOKEN"),
+            base_url=os.environ.get("SLACK_API_URL", AsyncWebClient.BASE_URL),
+        )
+        self._ready.set()
+        self.loop.run_forever()
+
+    def submit(self, event_data):
+        """
+        Schedule an event for processing without blocking
+
+        Args:
+            event_data (dict): The Slack event payload
+
+        Returns:
+            bool: True if scheduled, False if too many events are in flight
+        """
+        self.start()
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.submitted += 1
+        asyncio.run_coroutine_threadsafe(self._run(event_data), self.loop)
+        return True
+
+    async def _run(self, event_data):
+        try:
+            with stage("event"):
+                await self.process_slack_event(event_data)
+            with self._lock:
+                self.processed += 1
+        except Exception as e:
+            record_event("failed")
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Error processing event: {str(e)}", exc_info=True)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        """
+        Snapshot of in-flight and throughput counters
+
+        Returns:
+            dict: The current pipeline statistics
+        """
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+                "llm": self.llm.stats() if self.loop else {},
+            }
+
+    def shutdown(self):
+        """Close the clients and stop the loop"""
+        if self.loop is None:
+            return
+
+        async def close():
+            await self.llm.close()
+            await self.engine.dispose()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    # Event processing
+
+    async def process_slack_event(self, event_data):
+        """Async equivalent of routes.process_slack_event"""
+        event = event_data.get("event")
+        if not event:
+            logger.info("No event data in the request")
+            return
+        if event.get("type") not in ("message", "app_mention") or event.get("bot_id"):
+            record_event("ignored")
+            logger.info(
+                "Ignoring event: not a user message/app_mention or sent by a bot"
+            )
+            return
+
+        channel_id = event.get("channel")
+        user_id = event.get("user")
+        text = event.get("text", "")
+        ts = event.get("ts")
+        client_msg_id = event.get("client_msg_id")
+
+        with stage("user_lookup"):
+            user_pk = await self._resolve_user_id(user_id)
+        with stage("save_message"):
+            message_id = await self._save_message(
+                dict(
+                    channel=channel_id,
+                    text=text,
+                    timestamp=ts,
+                    user_id=user_pk,
+                    is_bot=False,
+                    client_msg_id=client_msg_id,
+                )
+            )
+        if message_id is None:
+            get_dedup_cache().record_db_conflict()
+            record_event("duplicate")
+            logger.info(f"Duplicate message {client_msg_id or ts}, skipping")
+            return
+
+        burst = None
+        if coalesce_window() > 0:
+            burst = await get_coalescer().collect_async(conversation_key(event), text)
+            if burst is None:
+                record_event("coalesced")
+                logger.info(
+                    f"Message {message_id} joined an open burst, not routing it"
+                )
+                return
+            text = burst.text
+
+        scope = admission_scope(channel_id, user_id, event.get("type"))
+        with scope, count_llm_calls() as llm_calls:
+            await self.process_bot_responses(text, channel_id)
+        if burst is not None:
+            get_coalescer().record_turn(burst, llm_calls[0])
+        record_event("processed")
+
+    async def _resolve_user_id(self, slack_user_id):
+        """Async equivalent of user_directory.resolve_user_id"""
+        cache = get_user_cache()
+        user_pk = cache.get(slack_user_id)
+        if user_pk is not None:
+            return user_pk
+
+        # Events from the same unknown user share one lookup
+        task = self._user_lookups.get(slack_user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_user_id(slack_user_id))
+            self._user_lookups[slack_user_id] = task
+            task.add_done_callback(
+                lambda _: self._user_lookups.pop(slack_user_id, None)
+            )
+        else:
+            cache.record_coalesced()
+        return await asyncio.shield(task)
+
+    async def _load_user_id(self, slack_user_id):
+        table = User.__table__
+        # Committed on its own so events waiting on this lookup can
+        # reference the row from their own transactions
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                select(table.c.id).where(table.c.slack_user_id == slack_user_id)
+            )
+            user_pk = result.scalar()
+            if user_pk is None:
+                get_user_cache().record_slack_lookup()
+                try:
+                    user_info = await self.slack.users_info(user=slack_user_id)
+                    row = profile_row(slack_user_id, user_info["user"])
+                except SlackApiError as e:
+                    logger.error(f"Error fetching user info: {e}")
+                    row = placeholder_row(slack_user_id)
+                # Another worker process may have inserted it meanwhile
+                result = await conn.execute(upsert_users([row]))
+                user_pk = result.first().id
+        get_user_cache().put(slack_user_id, user_pk)
+        return user_pk
+
+    async def _save_message(self, values):
+        """Async equivalent of message_writer.save_message"""
+        if write_behind_enabled():
+            writer = get_message_writer(self.flask_app)
+            message_id, written = await asyncio.to_thread(writer.submit, values)
+            if writer.durable and not await asyncio.wrap_future(written):
+                return None
+            return message_id
+
+        async with self.engine.begin() as conn:
+            return (await conn.execute(insert_messages([values]))).scalar()
+
+    async def _embed(self, text, cache):
+        # One embedding per message, shared by the cache, router and retrieval
+        if "embedding" not in cache:
+            data = {
+                "model": os.environ.get(
+                    "OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"
+                ),
+                "input": text,
+            }
+            response = await self.llm.embeddings(data)
+            cache["embedding"] = response["data"][0]["embedding"]
+        return cache["embedding"]
+
+    async def _route_by_embedding(self, text, all_bots, cache):
+        if os.environ.get("VECTOR_ROUTER_ENABLED", "true").lower() != "true":
+            return None
+        profiles = bot_profiles(all_bots)
+        if profiles is None:
+            return None
+        try:
+            query_embedding = await self._embed(text, cache)
+        except LLMError as e:
+            logger.warning(f"Embedding router failed, falling back to LLM: {str(e)}")
+            record_route("llm_fallback_error")
+            return None
+        return choose_bot_by_embedding(query_embedding, all_bots, profiles, logger)
+
+    async def _route(self, text, all_bots, cache):
+        router_data = await self._route_by_embedding(text, all_bots, cache)
+        if router_data is not None:
+            return router_data
+        return await self._route_with_llm(text, all_bots)
+
+    async def _route_with_llm(self, text, all_bots):
+        router_prompt = build_router_request(text, get_router_descriptions(all_bots))
+        try:
+            response = await self.llm.chat_completion(router_prompt)
+        except LLMError as e:
+            logger.error(str(e))
+            return None
+        return json.loads(response["choices"][0]["message"]["content"])
+
+    async def _route_with_speculation(self, text, channel_id, all_bots, cache):
+        """Async equivalent of gpt_utils.route_with_speculation"""
+        router_data = await self._route_by_embedding(text, all_bots, cache)
+        if router_data is not None:
+            return router_data, None
+
+        # _route_by_embedding leaves the embedding in the cache when it got one
+        guess = guess_bot(channel_id, all_bots, cache.get("embedding"))
+        if guess is None:
+            record_speculation("no_guess")
+            return await self._route_with_llm(text, all_bots), None
+
+        bot = next(bot for bot in all_bots if bot.id == guess)
+        start = self.loop.time()
+        speculative = asyncio.ensure_future(self._ask(text, channel_id, bot, cache))
+        speculative.add_done_callback(_consume_exception)
+        router_data = await self._route_with_llm(text, all_bots)
+        routed_at = self.loop.time()
+        if router_data is None or router_data["bot_id"] != guess:
+            speculative.cancel()
+            record_speculation("misses")
+            logger.info(
+                f"Speculative answer from bot {guess} cancelled, router picked "
+                f"{router_data['bot_id'] if router_data else None}"
+            )
+            return router_data, None
+
+        try:
+            answer = await speculative
+        except Exception as e:
+            record_speculation("failed")
+            logger.warning(f"Speculative answer failed, asking again: {str(e)}")
+            return router_data, None
+
+        # In series the answer would take its own time on top of routing; in
+        # parallel the shorter of the two is hidden behind the longer
+        saved = min(routed_at - start, self.loop.time() - start)
+        record_speculation("hits", saved)
+        logger.info(f"Speculative answer from bot {guess} kept, saved {saved:.2f}s")
+        return router_data, answer
+
+    async def _route_to_bots(self, text, all_bots, cache):
+        """Async equivalent of gpt_utils.route_to_bots"""
+        router_data = await self._route_by_embedding(text, all_bots, cache)
+        if router_data is not None:
+            return [router_data]
+
+        router_prompt = build_multi_router_request(
+            text, get_router_descriptions(all_bots), multi_bot_max(), CHAT_MODEL
+        )
+        try:
+            response = await self.llm.chat_completion(router_prompt)
+        except LLMError as e:
+            logger.error(str(e))
+            return []
+        return parse_multi_router_response(
+            response["choices"][0]["message"]["content"],
+            {bot.id: bot for bot in all_bots},
+        )
+
+    async def _query_context(self, text, bot, cache):
+        if (
+            os.environ.get("CHUNK_RETRIEVAL_ENABLED", "true").lower() != "true"
+            or not bot.has_chunks
+        ):
+            return bot.context
+        try:
+            query_embedding = await self._embed(text, cache)
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    sql_text(
+                        "SELECT content FROM document_chunk "
+                        "WHERE bot_id = :bot_id AND embedding IS NOT NULL "
+                        "ORDER BY embedding <=> CAST(:query AS vector) LIMIT :k"
+                    ),
+                    {
+                        "bot_id": bot.id,
+                        "query": str(list(query_embedding)),
+                        "k": top_k(),
+                    },
+                )
+                chunks = [row.content for row in result]
+        except Exception as e:
+            logger.warning(f"Chunk retrieval failed, using full context: {str(e)}")
+            return bot.context
+        return join_query_context(chunks, bot.unchunked_context)
+
+    async def _past_messages(self, bot_id, channel_id):
+        if history_cache_enabled():
+            messages = get_conversation_history().get(channel_id, bot_id)
+            if messages is not None:
+                return messages
+
+        pending = pending_messages(channel_id, bot_id)
+        table = Message.__table__
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(table.c.id, table.c.is_bot, table.c.text)
+                .where(table.c.bot_id == bot_id, table.c.channel == channel_id)
+                .order_by(table.c.created_at.desc())
+                .limit(history_length())
+            )
+            rows = with_pending(result.all(), pending)
+        if history_cache_enabled():
+            return get_conversation_history().hydrate(channel_id, bot_id, rows)
+        return rows
+
+    def _cached_bots(self):
+        with self.flask_app.app_context():
+            return get_cached_bots()
+
+    async def process_bot_responses(self, text, channel_id):
+        """Async equivalent of gpt_utils.process_bot_responses"""
+        # The cache is almost always warm, so this rarely touches the DB
+        all_bots = await asyncio.to_thread(self._cached_bots)
+        bots_by_id = {bot.id: bot for bot in all_bots}
+        cache = {}
+
+        hit = None
+        if response_cache_enabled():
+            with stage("cache_lookup"):
+                hit = await self._lookup_cached_response(
+                    text, channel_id, bots_by_id, cache
+                )
+
+        if hit is not None:
+            bot_id, bot_name, bot_response, _ = hit
+        else:
+            speculative_answer = None
+            with stage("route"):
+                if multi_bot_enabled():
+                    routes = await self._route_to_bots(text, all_bots, cache)
+                elif speculation_enabled():
+                    router_data, speculative_answer = (
+                        await self._route_with_speculation(
+                            text, channel_id, all_bots, cache
+                        )
+                    )
+                    routes = [router_data] if router_data is not None else []
+                else:
+                    router_data = await self._route(text, all_bots, cache)
+                    routes = [router_data] if router_data is not None else []
+            if not routes:
+                return
+            for router_data in routes:
+                record_confidence(router_data["confidence"])
+            if len(routes) > 1:
+                await self._fan_out(text, channel_id, routes, bots_by_id, cache)
+                return
+
+            router_data = routes[0]
+            bot_id = router_data["bot_id"]
+            bot_name = router_data["bot_name"]
+            logger.info(
+                f"Selected bot: {bot_name} (ID: {bot_id}) with confidence: "
+                f"{router_data['confidence']}"
+            )
+
+            bot_response = speculative_answer
+            if bot_response is None:
+                with stage("answer"):
+                    bot_response = await self._ask(
+                        text, channel_id, bots_by_id[bot_id], cache
+                    )
+            await self._store_cached_response(
+                text, channel_id, bot_id, bot_name, bot_response, cache
+            )
+
+        await self._publish(channel_id, [(bot_id, bot_name, bot_response)])
+
+    async def _lookup_cached_response(self, text, channel_id, bots_by_id, cache):
+        # Like gpt_utils.lookup_cached_response, a failure is just a miss. The
+        # similarity scan is plain Python, so it runs off the event loop
+        try:
+            query_embedding = await self._embed(text, cache)
+            hit = await asyncio.to_thread(
+                get_response_cache().lookup, channel_id, query_embedding
+            )
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {str(e)}")
+            return None
+        if hit is None or hit[0] not in bots_by_id:
+            return None
+        return hit
+
+    async def _store_cached_response(
+        self, text, channel_id, bot_id, bot_name, answer, cache
+    ):
+        # The answer is still posted if it can't be cached
+        if not response_cache_enabled():
+            return
+        try:
+            embedding = await self._embed(text, cache)
+            get_response_cache().store(channel_id, bot_id, bot_name, embedding, answer)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {str(e)}")
+
+    async def _ask(self, text, channel_id, bot, cache):
+        context, past_messages = await asyncio.gather(
+            self._query_context(text, bot, cache),
+            self._past_messages(bot.id, channel_id),
+        )
+        data = format_gpt_request(
+            text, context, bot.name, past_messages, bot.token_budget
+        )
+        response = await self.llm.chat_completion(data)
+        return response["choices"][0]["message"]["content"]
+
+    async def _publish(self, channel_id, answers):
+        """
+        Post answers to Slack as one message and save each of them
+
+        Args:
+            channel_id (str): The Slack channel ID
+            answers (list): (bot_id, bot_name, answer text) tuples
+        """
+        if len(answers) == 1:
+            _, bot_name, bot_response = answers[0]
+            text = f"*{bot_name}*: {bot_response}"
+        else:
+            text = format_merged_reply(
+                [(bot_name, answer) for _, bot_name, answer in answers]
+            )
+        with stage("slack_post"):
+            slack_response = await self.slack.chat_postMessage(
+                channel=channel_id, text=text
+            )
+
+        for bot_id, _, bot_response in answers:
+            with stage("save_reply"):
+                message_id = await self._save_message(
+                    dict(
+                        channel=channel_id,
+                        text=bot_response,
+                        timestamp=slack_response.get("ts"),
+                        bot_id=bot_id,
+                        is_bot=True,
+                    )
+                )
+            if history_cache_enabled():
+                get_conversation_history().append(
+                    channel_id, bot_id, message_id, True, bot_response
+                )
+            remember_answer(channel_id, bot_id)
+
+    async def _fan_out(self, text, channel_id, routes, bots_by_id, cache):
+        """Async equivalent of gpt_utils.fan_out_responses"""
+        logger.info(f"Asking {len(routes)} bots: {[r['bot_name'] for r in routes]}")
+        record_fan_out("fan_outs")
+        merged = merge_replies()
+        semaphore = asyncio.Semaphore(multi_bot_concurrency())
+
+        async def ask(router_data):
+            async with semaphore:
+                bot = bots_by_id[router_data["bot_id"]]
+                with stage("answer"):
+                    return await self._ask(text, channel_id, bot, cache)
+
+        tasks = {asyncio.ensure_future(ask(route)): route for route in routes}
+        deadline = self.loop.time() + multi_bot_deadline()
+        pending = set(tasks)
+        answers = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(deadline - self.loop.time(), 0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                for task in done:
+                    route = tasks[task]
+                    if task.exception() is not None:
+                        record_fan_out("failed")
+                        logger.error(
+                            f"Bot {route['bot_name']} failed to answer: "
+                            f"{str(task.exception())}"
+                        )
+                        continue
+                    answer = (route["bot_id"], route["bot_name"], task.result())
+                    answers.append(answer)
+                    record_fan_out("replies")
+                    if not merged:
+                        await self._publish(channel_id, [answer])
+        finally:
+            for task in pending:
+                task.cancel()
+        if pending:
+            record_fan_out("timed_out", len(pending))
+            logger.warning(f"{len(pending)} bot answers missed the deadline")
+
+        if merged and answers:
+            # Keep the router's order rather than arrival order
+            order = [route["bot_id"] for route in routes]
+            answers.sort(key=lambda answer: order.index(answer[0]))
+            await self._publish(channel_id, answers)
+
+
+def _consume_exception(task):
+    # A discarded speculative answer may have failed; that's not worth a
+    # "Task exception was never retrieved" warning
+    if not task.cancelled():
+        task.exception()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def check_worker_support():
+    """
+    Refuse to run under gevent's monkey-patching
+
+    The pipeline runs a real asyncio loop on an OS thread, with asyncpg and
+    aiohttp; gevent's patched threading and sockets break that. Run gunicorn
+    with gthread workers instead (gunicorn.conf.py picks them for
+    EVENT_PIPELINE=async).
+
+    Raises:
+        RuntimeError: If gevent has patched threading
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return
+    if monkey.is_module_patched("threading"):
+        raise RuntimeError(
+            "EVENT_PIPELINE=async can't run under gevent workers; "
+            "use GUNICORN_WORKER_CLASS=gthread"
+        )
+
+
+def get_async_pipeline(flask_app):
+    """
+    Get the process-wide async pipeline, creating it on first use
+
+    Args:
+        flask_app: The Flask application, used for config and app contexts
+
+    Returns:
+        AsyncEventPipeline: The shared pipeline
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = AsyncEventPipeline(
+                    flask_app,
+                    max_in_flight=int(os.environ.get("ASYNC_MAX_IN_FLIGHT", "1000")),
+                )
+    return _pipeline
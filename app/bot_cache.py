@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from sqlalchemy.orm import selectinload
+from app.models import SlackBot
+from app.retrieval import chunked_document_ids, unchunked_text
+from app.vector_router import build_bot_profile
+
+
+class CachedBot:
+    """Everything the router and ask_gpt need about a bot, detached from the DB"""
+
+    def __init__(self, bot, chunked_ids):
+        self.id = bot.id
+        self.name = bot.name
+        self.token_budget = bot.token_budget
+        self.context = " ".join([doc.content for doc in bot.documents])
+        self.description = f"- Bot {bot.id} ({bot.name}): {self.context[:200]}..."
+        self.profile = build_bot_profile(bot.documents)
+        self.has_chunks = any(doc.id in chunked_ids for doc in bot.documents)
+        # Documents added before chunking existed go into the prompt whole
+        self.unchunked_context = unchunked_text(bot.documents, chunked_ids)
+
+    def __repr__(self):
+        return f"<CachedBot {self.name}>"
+
+
+_lock = threading.Lock()
+_bots = None
+_loaded_at = 0.0
+_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+
+def cache_ttl():
+    """
+    Seconds before the cache is reloaded even without an invalidation
+
+    Invalidation only reaches the process that handled the admin request, so
+    the TTL bounds how stale other gunicorn workers can be.
+    """
+    return float(os.environ.get("BOT_CACHE_TTL", "60"))
+
+
+def _load_all():
+    bots = SlackBot.query.options(selectinload(SlackBot.documents)).all()
+    chunked_ids = chunked_document_ids()
+    return {bot.id: CachedBot(bot, chunked_ids) for bot in bots}
+
+
+def get_cached_bots():
+    """
+    Get all bots with their contexts, loading them on first use or expiry
+
+    Returns:
+        list: CachedBot entries ordered by bot ID
+    """
+    global _bots, _loaded_at
+    with _lock:
+        if _bots is not None and time.monotonic() - _loaded_at < cache_ttl():
+            _stats["hits"] += 1
+            return [_bots[bot_id] for bot_id in sorted(_bots)]
+        _stats["misses"] += 1
+
+    bots = _load_all()
+    with _lock:
+        _bots = bots
+        _loaded_at = time.monotonic()
+        return [bots[bot_id] for bot_id in sorted(bots)]
+
+
+def get_cached_bot(bot_id):
+    """
+    Get one bot from the cache
+
+    Args:
+        bot_id (int): The database ID of the bot
+
+    Returns:
+        CachedBot: The bot, or None if it doesn't exist
+    """
+    for bot in get_cached_bots():
+        if bot.id == bot_id:
+            return bot
+    return None
+
+
+def get_router_descriptions(bots):
+    """The bot list shown to the LLM router, one line per bot"""
+    return "\n".join(bot.description for bot in bots)
+
+
+def refresh_bot(bot_id):
+    """
+    Rebuild one bot's entry after its documents or details change
+
+    Args:
+        bot_id (int): The database ID of the bot, removed if it no longer exists
+    """
+    if bot_id is None:
+        return
+    bot_id = int(bot_id)
+    bot = (
+        SlackBot.query.options(selectinload(SlackBot.documents))
+        .filter_by(id=bot_id)
+        .first()
+    )
+    entry = None
+    if bot is not None:
+        entry = CachedBot(bot, chunked_document_ids(bot_id))
+
+    with _lock:
+        _stats["refreshes"] += 1
+        if _bots is None:
+            # Nothing cached yet; the next read does a full load
+            return
+        if entry is None:
+            _bots.pop(bot_id, None)
+        else:
+            _bots[bot_id] = entry
+
+
+def warm_bot_cache(app, logger):
+    """Load the cache at startup so the first message doesn't pay for it"""
+    try:
+        with app.app_context():
+            bots = get_cached_bots()
+        logger.info(f"Warmed bot cache with {len(bots)} bots")
+    except Exception as e:
+        # Tables may not exist yet, e.g. while init_db is running
+        logger.warning(f"Could not warm bot cache: {str(e)}")
+
+
+def bot_cache_stats():
+    """
+    Snapshot of the cache counters
+
+    Returns:
+        dict: Hit/miss/refresh counters and the number of cached bots
+    """
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["cached_bots"] = len(_bots) if _bots is not None else 0
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+    return snapshot
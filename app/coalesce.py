@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import threading
+
+
+class Burst:
+    """Messages from one conversation that will be answered as one turn"""
+
+    __slots__ = ("key", "texts", "started_at", "last_at")
+
+    def __init__(self, key, text, now):
+        self.key = key
+        self.texts = [text]
+        self.started_at = now
+        self.last_at = now
+
+    @property
+    def text(self):
+        return "\n".join(self.texts)
+
+
+class BurstCoalescer:
+    """
+    Per-conversation debounce for user messages
+
+    The first message of a burst leads it: it waits until the conversation
+    has been quiet for ``window`` seconds (but no longer than ``max_wait``
+    after it arrived), then routes and answers every message that arrived
+    meanwhile as one turn. Those later messages join the burst and skip the
+    pipeline; their rows are saved as usual by the caller.
+
+    The leader holds its worker while it waits, so the window should stay
+    short compared to an answer.
+    """
+
+    def __init__(self, window=1.5, max_wait=5.0):
+        self.window = window
+        self.max_wait = max_wait
+        self._bursts = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "messages": 0,
+            "turns": 0,
+            "merged": 0,
+            "llm_calls_saved": 0,
+        }
+
+    def join(self, key, text):
+        """
+        Add a message to its conversation's open burst, or open one
+
+        Args:
+            key (tuple): Identifies the conversation, e.g. (channel, thread, user)
+            text (str): The message text
+
+        Returns:
+            Burst: The new burst if the caller leads it, or None if the message
+                joined a burst someone else will answer
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._stats["messages"] += 1
+            burst = self._bursts.get(key)
+            if burst is not None:
+                burst.texts.append(text)
+                burst.last_at = now
+                self._stats["merged"] += 1
+                return None
+            burst = self._bursts[key] = Burst(key, text, now)
+            return burst
+
+    def remaining(self, burst):
+        """
+        Seconds the leader should still wait; closes the burst once it is due
+
+        Returns:
+            float: Time left, or 0 when no more messages can join
+        """
+        with self._lock:
+            deadline = min(
+                burst.last_at + self.window, burst.started_at + self.max_wait
+            )
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._bursts.get(burst.key) is burst:
+                del self._bursts[burst.key]
+                self._stats["turns"] += 1
+            return 0
+
+    def collect(self, key, text):
+        """
+        Debounce a message on a worker thread
+
+        Returns:
+            Burst: The closed burst to answer, or None if the message joined
+                another one
+        """
+        burst = self.join(key, text)
+        remaining = self.remaining(burst) if burst is not None else 0
+        while remaining > 0:
+            time.sleep(remaining)
+            remaining = self.remaining(burst)
+        return burst
+
+    async def collect_async(self, key, text):
+        """Like collect, for the event loop"""
+        burst = self.join(key, text)
+        remaining = self.remaining(burst) if burst is not None else 0
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            remaining = self.remaining(burst)
+        return burst
+
+    def record_turn(self, burst, llm_calls):
+        """
+        Count the LLM calls a merged turn saved
+
+        Each message folded into the turn would otherwise have gone through
+        the pipeline on its own, costing about as many calls as the turn did.
+
+        Args:
+            burst (Burst): The answered burst
+            llm_calls (int): LLM calls made while answering it
+        """
+        with self._lock:
+            self._stats["llm_calls_saved"] += (len(burst.texts) - 1) * llm_calls
+
+    def stats(self):
+        """
+        Snapshot of the coalescing counters
+
+        Returns:
+            dict: Messages seen, turns answered, messages merged into another
+                turn and the estimated LLM calls that saved
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["open"] = len(self._bursts)
+            snapshot["window"] = self.window
+        return snapshot
+
+
+def coalesce_window():
+    """Seconds of quiet that end a burst; 0 answers every message on its own"""
+    return float(os.environ.get("MESSAGE_COALESCE_WINDOW", "0"))
+
+
+def conversation_key(event):
+    """Messages from one user in one channel or thread make one conversation"""
+    return (event.get("channel"), event.get("thread_ts"), event.get("user"))
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """
+    Get the process-wide burst coalescer, creating it on first use
+
+    Returns:
+        BurstCoalescer: The shared coalescer
+    """
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = BurstCoalescer(
+                    window=coalesce_window(),
+                    max_wait=float(os.environ.get("MESSAGE_COALESCE_MAX_WAIT", "5")),
+                )
+    return _coalescer
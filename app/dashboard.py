@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.orm import load_only
+from app import db
+from app.models import User, SlackBot, Message, Document
+
+# Tables estimated above this many rows are counted from planner statistics
+EXACT_COUNT_LIMIT = 10000
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_summary = None
+_loaded_at = 0.0
+
+
+def dashboard_ttl():
+    return float(os.environ.get("DASHBOARD_CACHE_TTL", "30"))
+
+
+def dashboard_window_hours():
+    return int(os.environ.get("DASHBOARD_WINDOW_HOURS", "24"))
+
+
+def table_count(model):
+    """
+    Row count that stays cheap however big the table is
+
+    Args:
+        model: The mapped class to count
+
+    Returns:
+        tuple: (count, True if exact or False if a planner estimate)
+    """
+    estimate = db.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+        {"t": f'"{model.__tablename__}"'},
+    ).scalar()
+    # reltuples is -1 until the table has been vacuumed or analyzed
+    if estimate is None or estimate < EXACT_COUNT_LIMIT:
+        return db.session.query(func.count(model.id)).scalar(), True
+    return estimate, False
+
+
+def build_summary():
+    """
+    Run the dashboard's aggregate queries
+
+    The per-hour breakdowns only read the last DASHBOARD_WINDOW_HOURS of
+    messages through the created_at index, so their cost depends on recent
+    traffic rather than on the size of the table.
+
+    Returns:
+        dict: Table counts and per-hour message counts by bot and channel
+    """
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    hours = [
+        now - timedelta(hours=i) for i in range(dashboard_window_hours() - 1, -1, -1)
+    ]
+    since = hours[0]
+
+    # One pass over the window, grouped finely enough for every breakdown
+    hour = func.date_trunc("hour", Message.created_at).label("hour")
+    rows = (
+        db.session.query(
+            hour, Message.is_bot, Message.bot_id, Message.channel, func.count()
+        )
+        .filter(Message.created_at >= since)
+        .group_by(hour, Message.is_bot, Message.bot_id, Message.channel)
+        .all()
+    )
+
+    per_bot = {hour: {} for hour in hours}
+    user_messages = {hour: 0 for hour in hours}
+    per_channel = {hour: {} for hour in hours}
+    channel_totals = {}
+    for hour, is_bot, bot_id, channel, count in rows:
+        if is_bot:
+            bots_in_hour = per_bot.setdefault(hour, {})
+            bots_in_hour[bot_id] = bots_in_hour.get(bot_id, 0) + count
+        else:
+            user_messages[hour] = user_messages.get(hour, 0) + count
+        channels_in_hour = per_channel.setdefault(hour, {})
+        channels_in_hour[channel] = channels_in_hour.get(channel, 0) + count
+        channel_totals[channel] = channel_totals.get(channel, 0) + count
+    top_channels = sorted(channel_totals, key=channel_totals.get, reverse=True)[:5]
+
+    bots = (
+        SlackBot.query.options(load_only(SlackBot.id, SlackBot.name))
+        .order_by(SlackBot.name)
+        .all()
+    )
+    return {
+        "generated_at": datetime.utcnow(),
+        "counts": {
+            "users": table_count(User),
+            "bots": table_count(SlackBot),
+            "messages": table_count(Message),
+            "documents": table_count(Document),
+        },
+        "hours": hours,
+        "bots": [(bot.id, bot.name) for bot in bots],
+        "per_bot": per_bot,
+        "user_messages": user_messages,
+        "channels": top_channels,
+        "per_channel": per_channel,
+    }
+
+
+def get_dashboard_summary():
+    """
+    Get the dashboard summary, rebuilding it at most once per TTL
+
+    While one request rebuilds an expired summary, the others keep serving
+    the previous one instead of running the aggregates again.
+
+    Returns:
+        dict: See build_summary
+    """
+    global _summary, _loaded_at
+    with _lock:
+        if _summary is not None and time.monotonic() - _loaded_at < dashboard_ttl():
+            return _summary
+        stale = _summary
+
+    if not _refresh_lock.acquire(blocking=stale is None):
+        return stale
+    try:
+        with _lock:
+            if _summary is not None and time.monotonic() - _loaded_at < dashboard_ttl():
+                return _summary
+        summary = build_summary()
+        with _lock:
+            _summary = summary
+            _loaded_at = time.monotonic()
+        return summary
+    finally:
+        _refresh_lock.release()
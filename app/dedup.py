@@ -0,0 +1,157 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import and_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models import Message
+
+
+class DedupCache:
+    """
+    Bounded LRU set of recently seen Slack event keys with a TTL
+
+    Catches Slack's retry deliveries in memory so they never reach the
+    database. The unique indexes on Message are the backstop for duplicates
+    that land on another worker process or after an entry has expired.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "memory_hits": 0, "db_conflicts": 0}
+
+    def check_and_add(self, keys):
+        """
+        Atomically test whether any key was seen recently, remembering them if not
+
+        Args:
+            keys (list): Identifiers for one event; None entries are ignored
+
+        Returns:
+            bool: True if the event is a duplicate
+        """
+        keys = [key for key in keys if key]
+        now = time.monotonic()
+        with self._lock:
+            self._stats["checked"] += 1
+            for key in keys:
+                expires_at = self._entries.get(key)
+                if expires_at is not None and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return True
+
+            for key in keys:
+                self._entries[key] = now + self.ttl
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return False
+
+    def discard(self, keys):
+        """Forget keys, e.g. when an event was refused and Slack should retry it"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def record_db_conflict(self):
+        with self._lock:
+            self._stats["db_conflicts"] += 1
+
+    def stats(self):
+        """
+        Snapshot of the dedup counters
+
+        Returns:
+            dict: Checked/duplicate counters and the number of remembered keys
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+        return snapshot
+
+
+def event_keys(event_data):
+    """
+    The identifiers that mark a Slack event payload as already seen
+
+    Args:
+        event_data (dict): The Slack event payload
+
+    Returns:
+        list: Keys for the event ID, client message ID and channel/timestamp
+    """
+    event = event_data.get("event") or {}
+    keys = []
+    if event_data.get("event_id"):
+        keys.append(f"event:{event_data['event_id']}")
+    if event.get("client_msg_id"):
+        keys.append(f"client_msg:{event['client_msg_id']}")
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"ts:{event['channel']}:{event['ts']}")
+    return keys
+
+
+def insert_messages(rows):
+    """
+    Build an insert for messages that skips duplicates in one statement
+
+    The partial unique indexes on client_msg_id and (channel, timestamp)
+    make a retried delivery of a user message conflict, in which case no
+    row is returned for it. Bot messages never conflict.
+
+    Args:
+        rows (list): Column values for each Message row, all with the same keys
+
+    Returns:
+        Insert: An INSERT ... ON CONFLICT DO NOTHING RETURNING id statement
+    """
+    table = Message.__table__
+    return pg_insert(table).values(rows).on_conflict_do_nothing().returning(table.c.id)
+
+
+def select_conflicting_message(values):
+    """
+    Build a select for the saved user message an insert of ``values`` hit
+
+    Args:
+        values (dict): Column values of a user Message row
+
+    Returns:
+        Select: A SELECT of the conflicting row's id
+    """
+    table = Message.__table__
+    if values.get("client_msg_id"):
+        condition = table.c.client_msg_id == values["client_msg_id"]
+    else:
+        condition = and_(
+            table.c.channel == values["channel"],
+            table.c.timestamp == values["timestamp"],
+            table.c.is_bot.is_(False),
+        )
+    return select(table.c.id).where(condition)
+
+
+_dedup_cache = None
+_dedup_cache_lock = threading.Lock()
+
+
+def get_dedup_cache():
+    """
+    Get the process-wide dedup cache, creating it on first use
+
+    Returns:
+        DedupCache: The shared cache
+    """
+    global _dedup_cache
+    if _dedup_cache is None:
+        with _dedup_cache_lock:
+            if _dedup_cache is None:
+                _dedup_cache = DedupCache(
+                    max_entries=int(os.environ.get("DEDUP_CACHE_SIZE", "10000")),
+                    ttl=float(os.environ.get("DEDUP_CACHE_TTL", "3600")),
+                )
+    return _dedup_cache
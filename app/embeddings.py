@@ -0,0 +1,340 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_, text
+from app import db
+from app.llm_client import get_llm_client
+from app.locks import EMBEDDING_WORKER_LOCK_ID, advisory_lock
+from app.models import Document, Message
+from app.prompt_budget import count_tokens, encode, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tables the worker keeps embedded, and the column holding each one's text
+TARGETS = {
+    "messages": (Message, "text"),
+    "documents": (Document, "content"),
+}
+
+# Store vectors for a whole batch in one statement. The md5 check skips rows
+# whose text changed after it was read, so a stale vector is never saved.
+UPDATE_SQL = """
+UPDATE {table} AS t
+SET embedding = CAST(v.embedding AS vector), embedding_hash = v.hash{extra}
+FROM unnest(
+    CAST(:ids AS integer[]), CAST(:embeddings AS text[]), CAST(:hashes AS text[])
+) AS v(id, embedding, hash)
+WHERE t.id = v.id AND md5(t.{column}) = v.hash
+"""
+
+
+def embedding_model():
+    return os.environ.get("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+def embedding_batch_size():
+    """Rows read per pass and the most inputs sent in one request"""
+    return int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+
+
+def embedding_batch_tokens():
+    """The most tokens sent in one request"""
+    return int(os.environ.get("EMBEDDING_BATCH_TOKENS", "100000"))
+
+
+def content_hash(content):
+    # Matches Postgres' md5() of the same text
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+class EmbeddingReport:
+    """Counters for one backfill or worker pass, with throughput rates"""
+
+    def __init__(self):
+        self.rows = 0
+        self.embedded = 0
+        self.reused = 0
+        self.unchanged = 0
+        self.empty = 0
+        self.tokens = 0
+        self.requests = 0
+        self.seconds = 0.0
+
+    def add(self, other):
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        report = dict(vars(self))
+        report["rows_per_second"] = self.rows / self.seconds if self.seconds else 0.0
+        report["tokens_per_second"] = (
+            self.tokens / self.seconds if self.seconds else 0.0
+        )
+        return report
+
+    def __str__(self):
+        report = self.as_dict()
+        return (
+            f"{self.rows} rows ({self.embedded} embedded, {self.reused} reused, "
+            f"{self.unchanged} unchanged, {self.empty} empty) in {self.requests} "
+            f"requests, {self.tokens} tokens in {self.seconds:.1f}s: "
+            f"{report['rows_per_second']:.1f} rows/s, "
+            f"{report['tokens_per_second']:.0f} tokens/s"
+        )
+
+
+def find_stale(target, after_id, limit):
+    """
+    Rows whose embedding is missing or may be out of date, in ID order
+
+    Messages need one until embedding_hash is set (edits clear it);
+    documents also need one when they were updated after being embedded.
+
+    Args:
+        target (str): A key of TARGETS
+        after_id (int): Only rows with a larger ID, for paging
+        limit (int): The most rows to return
+
+    Returns:
+        list: Rows with ``id``, ``content`` and ``embedding_hash``
+    """
+    model, column = TARGETS[target]
+    query = db.session.query(
+        model.id, getattr(model, column).label("content"), model.embedding_hash
+    ).filter(model.id > after_id)
+    if model is Document:
+        query = query.filter(
+            or_(
+                Document.embedding_hash.is_(None),
+                Document.embedded_at.is_(None),
+                Document.updated_at > Document.embedded_at,
+            )
+        )
+    else:
+        query = query.filter(model.embedding_hash.is_(None))
+    return query.order_by(model.id).limit(limit).all()
+
+
+def plan_requests(inputs, max_inputs, max_tokens):
+    """
+    Group inputs into requests under an input count and token budget
+
+    Args:
+        inputs (list): (hash, text, tokens) tuples
+        max_inputs (int): The most inputs per request
+        max_tokens (int): The most tokens per request
+
+    Returns:
+        list: Lists of inputs, one per request
+    """
+    requests = []
+    current, current_tokens = [], 0
+    for item in inputs:
+        tokens = item[2]
+        if current and (
+            len(current) >= max_inputs or current_tokens + tokens > max_tokens
+        ):
+            requests.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        requests.append(current)
+    return requests
+
+
+def request_embeddings(batch):
+    """
+    Embed one planned request
+
+    Returns:
+        tuple: ({hash: vector}, tokens used)
+    """
+    response = get_llm_client().embeddings(
+        {"model": embedding_model(), "input": [content for _, content, _ in batch]}
+    )
+    items = sorted(response["data"], key=lambda item: item["index"])
+    vectors = {digest: item["embedding"] for (digest, _, _), item in zip(batch, items)}
+    usage = response.get("usage") or {}
+    return vectors, usage.get("total_tokens", sum(tokens for _, _, tokens in batch))
+
+
+def embed_rows(target, rows, report, concurrency=1):
+    """
+    Embed a page of rows and store the vectors
+
+    Rows with the same text share one input. Documents whose content hash
+    still matches are only marked as embedded; empty text is marked with
+    no vector, since the API rejects it.
+
+    Args:
+        target (str): A key of TARGETS
+        rows (list): Rows from find_stale
+        report (EmbeddingReport): Counters to update
+        concurrency (int): How many requests to have in flight at once
+    """
+    model, column = TARGETS[target]
+    model_name = embedding_model()
+    max_input_tokens = int(os.environ.get("EMBEDDING_MAX_INPUT_TOKENS", "8000"))
+
+    unchanged = []
+    by_hash = {}
+    inputs = []
+    for row in rows:
+        digest = content_hash(row.content)
+        if digest == row.embedding_hash:
+            unchanged.append(row.id)
+            continue
+        if digest in by_hash:
+            by_hash[digest].append(row.id)
+            continue
+        by_hash[digest] = [row.id]
+        if row.content.strip():
+            tokens = encode(row.content, model_name)
+            count = count_tokens(row.content, model_name, tokens)
+            content = truncate_tokens(row.content, model_name, max_input_tokens, tokens)
+            inputs.append((digest, content, min(count, max_input_tokens)))
+
+    requests = plan_requests(inputs, embedding_batch_size(), embedding_batch_tokens())
+    vectors = {}
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for batch_vectors, tokens in executor.map(request_embeddings, requests):
+            vectors.update(batch_vectors)
+            report.tokens += tokens
+            report.requests += 1
+
+    ids, embeddings, hashes = [], [], []
+    for digest, row_ids in by_hash.items():
+        vector = vectors.get(digest)
+        for row_id in row_ids:
+            ids.append(row_id)
+            embeddings.append(str(vector) if vector is not None else None)
+            hashes.append(digest)
+        if vector is None:
+            report.empty += len(row_ids)
+        else:
+            report.embedded += 1
+            report.reused += len(row_ids) - 1
+
+    if ids:
+        extra = ", embedded_at = timezone('utc', now())" if model is Document else ""
+        db.session.execute(
+            text(
+                UPDATE_SQL.format(table=model.__tablename__, column=column, extra=extra)
+            ),
+            {"ids": ids, "embeddings": embeddings, "hashes": hashes},
+        )
+    if unchanged:
+        db.session.execute(
+            text(
+                "UPDATE document SET embedded_at = timezone('utc', now()) "
+                "WHERE id = ANY(:ids)"
+            ),
+            {"ids": unchanged},
+        )
+        report.unchanged += len(unchanged)
+    db.session.commit()
+    report.rows += len(rows)
+
+
+def embed_pending(targets=None, limit=None, concurrency=None, report=None):
+    """
+    Embed every row whose embedding is missing or stale
+
+    Args:
+        targets (list, optional): Keys of TARGETS; defaults to all of them
+        limit (int, optional): Stop after about this many rows per table
+        concurrency (int, optional): Requests in flight at once; defaults to
+            EMBEDDING_CONCURRENCY
+        report (EmbeddingReport, optional): Counters to add to
+
+    Returns:
+        EmbeddingReport: What was done, and how fast
+    """
+    report = report or EmbeddingReport()
+    concurrency = concurrency or int(os.environ.get("EMBEDDING_CONCURRENCY", "2"))
+    page_size = embedding_batch_size() * concurrency
+    start = time.monotonic()
+    try:
+        for target in targets or TARGETS:
+            after_id, done = 0, 0
+            while limit is None or done < limit:
+                size = page_size if limit is None else min(page_size, limit - done)
+                rows = find_stale(target, after_id, size)
+                if not rows:
+                    break
+                embed_rows(target, rows, report, concurrency)
+                after_id = rows[-1].id
+                done += len(rows)
+    finally:
+        report.seconds += time.monotonic() - start
+    return report
+
+
+_totals = EmbeddingReport()
+_totals_lock = threading.Lock()
+
+
+def embedding_stats():
+    """
+    Totals for this process's embedding worker
+
+    Returns:
+        dict: Row/token/request counters and throughput
+    """
+    with _totals_lock:
+        return _totals.as_dict()
+
+
+def start_embedding_worker(app):
+    """
+    Embed new and changed rows every EMBEDDING_WORKER_INTERVAL seconds
+
+    Runs in a daemon thread. Each worker process starts one, but the
+    advisory lock lets only one of them work at a time.
+
+    Returns:
+        threading.Thread: The worker thread, or None when it is disabled
+    """
+    interval = float(os.environ.get("EMBEDDING_WORKER_INTERVAL", "0"))
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    with advisory_lock(EMBEDDING_WORKER_LOCK_ID) as locked:
+                        if locked:
+                            report = embed_pending()
+                            with _totals_lock:
+                                _totals.add(report)
+                            if report.rows:
+                                logger.info(f"Embedded {report}")
+            except Exception as e:
+                logger.error(f"Embedding worker failed: {str(e)}", exc_info=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="embedding-worker", daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command("embed-backfill")
+@click.option("--only", type=click.Choice(list(TARGETS)), help="Only embed this table")
+@click.option("--limit", type=int, help="Stop after about this many rows per table")
+@click.option("--concurrency", type=int, help="Requests in flight at once")
+@with_appcontext
+def embed_backfill_command(only, limit, concurrency):
+    """Embed messages and documents whose embeddings are missing or stale"""
+    total = EmbeddingReport()
+    for target in [only] if only else TARGETS:
+        report = embed_pending([target], limit=limit, concurrency=concurrency)
+        click.echo(f"{target}: {report}")
+        total.add(report)
+    click.echo(f"total: {total}")
@@ -0,0 +1,179 @@
+import os
+import gzip
+import json
+import time
+import zlib
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EventRecorder:
+    """
+    Appends Slack event payloads to a gzip-compressed NDJSON capture file
+
+    Each line is ``{"t": arrival time, "payload": {...}}``, plus ``"retry"``
+    for Slack's redeliveries. ``record`` only queues the payload; a
+    background thread compresses and writes batches, flushing after each so
+    the file stays readable if the process dies. Recording stops for good
+    once the file reaches ``max_bytes``, and payloads are dropped rather than
+    queued past ``max_queue``, so a capture never slows down or outgrows the
+    host.
+
+    Workers are usually stopped without closing the file, and a gzip stream
+    left open can't be appended to, so each recorder writes a new file: if
+    ``path`` exists, a numbered one next to it. The size limit applies to
+    each file. See load_capture for reading a capture back.
+    """
+
+    def __init__(self, path, max_bytes, max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.full = False
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {"recorded": 0, "dropped": 0, "bytes": 0}
+
+    def record(self, payload, retry=None):
+        """
+        Queue an event payload for the capture
+
+        Args:
+            payload (dict): The request body as Slack sent it
+            retry (str, optional): The X-Slack-Retry-Num header, if any
+        """
+        if self.full:
+            return
+        entry = {"t": time.time(), "payload": payload}
+        if retry:
+            entry["retry"] = int(retry)
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._stats["dropped"] += 1
+                return
+            self._queue.append(entry)
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="event-capture", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = unused_path(self.path)
+        with open(self.path, "xb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as compressed:
+                while True:
+                    with self._cond:
+                        while not self._queue:
+                            self._cond.wait()
+                        batch = list(self._queue)
+                        self._queue.clear()
+                    for entry in batch:
+                        line = json.dumps(entry, separators=(",", ":")) + "\n"
+                        compressed.write(line.encode())
+                    compressed.flush(zlib.Z_SYNC_FLUSH)
+                    with self._cond:
+                        self._stats["recorded"] += len(batch)
+                        self._stats["bytes"] = raw.tell()
+                    if raw.tell() >= self.max_bytes:
+                        break
+        self._stop(os.path.getsize(self.path))
+
+    def _stop(self, size):
+        with self._cond:
+            self.full = True
+            self._stats["dropped"] += len(self._queue)
+            self._queue.clear()
+            self._stats["bytes"] = size
+        logger.warning(
+            f"Event capture {self.path} reached {size} bytes, no longer recording"
+        )
+
+    def stats(self):
+        """
+        Snapshot of the capture counters
+
+        Returns:
+            dict: Events recorded and dropped, file size and whether it is full
+        """
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["queued"] = len(self._queue)
+        snapshot["path"] = self.path
+        snapshot["full"] = self.full
+        return snapshot
+
+
+def load_capture(path):
+    """
+    Read a capture file back, in recording order
+
+    A capture whose recorder was never closed ends without a gzip trailer;
+    everything flushed before that is still returned.
+
+    Args:
+        path (str): The capture file
+
+    Yields:
+        dict: Entries with "t", "payload" and, for redeliveries, "retry"
+    """
+    with gzip.open(path, "rt") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except EOFError:
+            logger.info(f"Capture {path} has no gzip trailer, read to its last flush")
+
+
+def unused_path(path):
+    """``path``, or the first of path-1.ext, path-2.ext, ... that doesn't exist"""
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition(".")
+    candidate, number = path, 0
+    while os.path.exists(candidate):
+        number += 1
+        candidate = os.path.join(directory, f"{stem}-{number}{dot}{extension}")
+    return candidate
+
+
+def capture_enabled():
+    return bool(os.environ.get("EVENT_CAPTURE_PATH"))
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_event_recorder():
+    """
+    Get the process-wide event recorder, creating it on first use
+
+    EVENT_CAPTURE_PATH may contain "{pid}" so that each gunicorn worker
+    writes its own file.
+
+    Returns:
+        EventRecorder: The shared recorder
+    """
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                path = os.environ.get("EVENT_CAPTURE_PATH", "")
+                _recorder = EventRecorder(
+                    path.format(pid=os.getpid()),
+                    max_bytes=int(
+                        float(os.environ.get("EVENT_CAPTURE_MAX_MB", "100"))
+                        * 1024
+                        * 1024
+                    ),
+                )
+    return _recorder
@@ -0,0 +1,170 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class EventWorkerPool:
+    """
+    Fixed-size pool of worker threads fed from a bounded in-memory queue.
+
+    Slack events are handed to the pool instead of each getting its own
+    thread, so the number of concurrent DB connections and OpenAI requests
+    never exceeds ``concurrency``. When the queue is full, ``submit`` returns
+    False and the caller decides how to push back on Slack.
+    """
+
+    def __init__(self, concurrency=4, max_queue_size=100, name="slack-event"):
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started = False
+
+        # Stats
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def start(self):
+        """Start the worker threads if they are not already running"""
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(
+                    target=self._worker, name=f"{self.name}-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+            logger.info(
+                f"Started {self.concurrency} {self.name} workers "
+                f"(queue size {self.max_queue_size})"
+            )
+
+    def submit(self, fn, *args):
+        """
+        Queue a job without blocking
+
+        Args:
+            fn (callable): The function to run on a worker thread
+            *args: Positional arguments for ``fn``
+
+        Returns:
+            bool: True if the job was queued, False if the queue is full
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((fn, args, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            logger.warning(
+                f"{self.name} queue full ({self.max_queue_size}), rejecting job"
+            )
+            return False
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+
+            fn, args, enqueued_at = job
+            wait = time.monotonic() - enqueued_at
+            with self._lock:
+                self.busy += 1
+                self.total_wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+            try:
+                fn(*args)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"Error in {self.name} worker: {str(e)}", exc_info=True)
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                self._queue.task_done()
+
+    def shutdown(self, wait=True):
+        """Stop the workers once the jobs already queued have drained"""
+        with self._lock:
+            if not self._started:
+                return
+            threads = list(self._threads)
+            self._threads = []
+            self._started = False
+
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def stats(self):
+        """
+        Snapshot of queue depth, throughput and wait-time stats
+
+        Returns:
+            dict: The current pool statistics
+        """
+        with self._lock:
+            started = self.processed + self.failed + self.busy
+            return {
+                "concurrency": self.concurrency,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self._queue.qsize(),
+                "busy_workers": self.busy,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+                "avg_wait_seconds": (
+                    self.total_wait_seconds / started if started else 0.0
+                ),
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+_event_pool = None
+_event_pool_lock = threading.Lock()
+
+
+def get_event_pool():
+    """
+    Get the process-wide pool for Slack events, creating it on first use
+
+    The pool is created lazily so that each gunicorn worker process gets its
+    own threads after forking.
+
+    Returns:
+        EventWorkerPool: The shared event pool
+    """
+    global _event_pool
+    if _event_pool is None:
+        with _event_pool_lock:
+            if _event_pool is None:
+                _event_pool = EventWorkerPool(
+                    concurrency=int(os.environ.get("EVENT_WORKER_CONCURRENCY", "4")),
+                    max_queue_size=int(os.environ.get("EVENT_QUEUE_SIZE", "100")),
+                )
+    return _event_pool
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+logger = logging.getLogger(__name__)
+
+# Fan-out counters, exposed on /stats
+_stats_lock = threading.Lock()
+_stats = {
+    "fan_outs": 0,
+    "replies": 0,
+    "failed": 0,
+    "timed_out": 0,
+}
+
+
+def multi_bot_enabled():
+    return os.environ.get("MULTI_BOT_ENABLED", "false").lower() == "true"
+
+
+def multi_bot_max():
+    """The most bots that answer one message"""
+    return int(os.environ.get("MULTI_BOT_MAX", "2"))
+
+
+def multi_bot_threshold():
+    """The router confidence a second (or later) bot needs to answer too"""
+    return float(os.environ.get("MULTI_BOT_THRESHOLD", "0.5"))
+
+
+def multi_bot_concurrency():
+    """How many of one message's bots are asked at the same time"""
+    return int(os.environ.get("MULTI_BOT_CONCURRENCY", "2"))
+
+
+def multi_bot_deadline():
+    """Seconds after which answers that haven't arrived are dropped"""
+    return float(os.environ.get("MULTI_BOT_DEADLINE", "30"))
+
+
+def merge_replies():
+    """Whether the answers go out as one Slack message instead of one each"""
+    return os.environ.get("MULTI_BOT_REPLY", "separate").lower() == "merged"
+
+
+def record_fan_out(outcome, count=1):
+    """Increment one of the fan-out counters"""
+    with _stats_lock:
+        _stats[outcome] += count
+
+
+def fan_out_stats():
+    """
+    Snapshot of the fan-out counters
+
+    Returns:
+        dict: Messages answered by several bots, and what happened to the answers
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def build_multi_router_request(text, bot_descriptions, max_bots, model):
+    """
+    Build the Chat Completions request body for a router that may pick several bots
+
+    Args:
+        text (str): The user's message text
+        bot_descriptions (str): One line per bot describing its specialty
+        max_bots (int): The most bots to pick
+        model (str): The chat model
+
+    Returns:
+        dict: The request body
+    """
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": f"""You are a router that determines which specialized bots should respond to a user query.
+                You have access to the following bots:
+                {bot_descriptions}
+
+                Analyze the user's query and determine which bots are suited to respond.
+                Pick one bot unless the query clearly spans several specialties, and never more than {max_bots}.
+
+                Return a JSON object with a "bots" field: a list, best suited first, of objects with the following fields:
+                - bot_id: The ID of the bot that should respond (integer)
+                - bot_name: The name of the bot that should respond (string)
+                - confidence: Confidence level (0-1) that this bot should answer (number)
+                """,
+            },
+            {"role": "user", "content": text},
+        ],
+        "response_format": {"type": "json_object"},
+    }
+
+
+def parse_multi_router_response(content, bots_by_id, max_bots=None, threshold=None):
+    """
+    Turn the multi-bot router's answer into the bots that should respond
+
+    The best-suited bot always answers; the others only when the router is
+    at least ``threshold`` confident about them. Unknown or repeated bots
+    are dropped.
+
+    Args:
+        content (str): The router's JSON reply
+        bots_by_id (dict): Bot ID -> CachedBot
+        max_bots (int, optional): Defaults to MULTI_BOT_MAX
+        threshold (float, optional): Defaults to MULTI_BOT_THRESHOLD
+
+    Returns:
+        list: Router data dicts (bot_id, bot_name, confidence), best first
+    """
+    max_bots = max_bots or multi_bot_max()
+    threshold = multi_bot_threshold() if threshold is None else threshold
+
+    data = json.loads(content)
+    candidates = data.get("bots", [data]) if isinstance(data, dict) else []
+    routes = []
+    for candidate in candidates:
+        try:
+            bot_id = int(candidate["bot_id"])
+            confidence = float(candidate.get("confidence", 0))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if bot_id not in bots_by_id or any(r["bot_id"] == bot_id for r in routes):
+            continue
+        routes.append(
+            {
+                "bot_id": bot_id,
+                "bot_name": bots_by_id[bot_id].name,
+                "confidence": confidence,
+            }
+        )
+    routes.sort(key=lambda route: route["confidence"], reverse=True)
+    return routes[:1] + [
+        route for route in routes[1:max_bots] if route["confidence"] >= threshold
+    ]
+
+
+def format_merged_reply(answers):
+    """
+    One Slack message holding several bots' answers
+
+    Args:
+        answers (list): (bot_name, answer) tuples in the order to show them
+
+    Returns:
+        str: The message text
+    """
+    return "\n\n".join(f"*{bot_name}*: {answer}" for bot_name, answer in answers)
+
+
+def answer_concurrently(routes, ask, publish, concurrency=None, deadline=None):
+    """
+    Ask several bots at once and publish the answers that arrive in time
+
+    Args:
+        routes (list): Router data dicts for the bots to ask
+        ask (callable): route -> answer text; runs on a worker thread
+        publish (callable): list of (route, answer) -> None; called once per
+            answer as it arrives, or once with all of them when replies are merged
+        concurrency (int, optional): Defaults to MULTI_BOT_CONCURRENCY
+        deadline (float, optional): Seconds to wait; defaults to MULTI_BOT_DEADLINE
+
+    Returns:
+        list: The (route, answer) pairs that were published
+    """
+    concurrency = concurrency or multi_bot_concurrency()
+    deadline = multi_bot_deadline() if deadline is None else deadline
+    merged = merge_replies()
+    record_fan_out("fan_outs")
+
+    answers = []
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(routes))), thread_name_prefix="fan-out"
+    )
+    # Each answer runs in a copy of the caller's context, so per-event
+    # counters (see llm_client.count_llm_calls) still see its calls
+    futures = {
+        executor.submit(copy_context().run, ask, route): route for route in routes
+    }
+    start = time.monotonic()
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            route = futures[future]
+            try:
+                answer = future.result()
+            except Exception as e:
+                record_fan_out("failed")
+                logger.error(f"Bot {route['bot_name']} failed to answer: {str(e)}")
+                continue
+            answers.append((route, answer))
+            record_fan_out("replies")
+            if not merged:
+                publish([(route, answer)])
+    except TimeoutError:
+        late = len(routes) - len(answers) - _count_failed(futures)
+        record_fan_out("timed_out", late)
+        logger.warning(
+            f"{late} bot answers missed the {deadline}s deadline "
+            f"({time.monotonic() - start:.1f}s)"
+        )
+    finally:
+        # Answers still running finish in the background and are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if merged and answers:
+        # Keep the router's order rather than arrival order
+        answers.sort(key=lambda pair: routes.index(pair[0]))
+        publish(answers)
+    return answers
+
+
+def _count_failed(futures):
+    return sum(
+        1
+        for future in futures
+        if future.done() and not future.cancelled() and future.exception() is not None
+    )
@@ -1,13 +1,53 @@
 import os
-import requests
 import json
-from app.models import Message, User
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import lru_cache
+from app.models import Document, Message
+from app.retrieval import (
+    chunked_document_ids,
+    has_chunks,
+    retrieve_chunks,
+    unchunked_text,
+)
+from flask import current_app
+from app.fan_out import (
+    answer_concurrently,
+    build_multi_router_request,
+    format_merged_reply,
+    multi_bot_enabled,
+    multi_bot_max,
+    parse_multi_router_response,
+)
+from app.llm_client import LLMError, get_llm_client
+from app.speculation import (
+    guess_bot,
+    record_speculation,
+    remember_answer,
+    speculation_enabled,
+)
+from app.message_writer import save_message
+from app.metrics import stage
+from app.bot_cache import get_cached_bot, get_cached_bots, get_router_descriptions
+from app.history import record_message, recent_messages
+from app.prompt_budget import (
+    CONTEXT_SEPARATOR,
+    default_token_budget,
+    fit_prompt,
+    log_usage,
+)
+from app.response_cache import get_response_cache, response_cache_enabled
+from app.vector_router import pick_bot, record_confidence, record_route
 from slack_sdk.errors import SlackApiError
 
+CHAT_MODEL = "gpt-4o"
 
-def ask_gpt(text, context, bot_name, bot_id=None, channel=None):
+
+def build_gpt_request(text, context, bot_name, bot_id=None, channel=None):
     """
-    Send a request to OpenAI's Chat Completions API
+    Build the Chat Completions request body for a bot's answer
 
     Args:
         text (str): The user's query
@@ -17,49 +57,80 @@ def ask_gpt(text, context, bot_name, bot_id=None, channel=None):
         channel (str, optional): The Slack channel ID
 
     Returns:
-        str: The response from GPT
+        dict: The request body
     """
-    api_key = os.environ.get("OPENAI_API_KEY")
+    # The bot's recent messages in the channel, usually from memory
+    past_messages = []
+    if bot_id and channel:
+        past_messages = recent_messages(bot_id, channel)
 
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    bot = get_cached_bot(bot_id) if bot_id else None
+    token_budget = bot.token_budget if bot is not None else None
+    return format_gpt_request(text, context, bot_name, past_messages, token_budget)
 
-    # Get past 10 messages from this bot in the channel if bot_id and channel are provided
-    conversation_history = ""
-    if bot_id and channel:
-        past_messages = (
-            Message.query.filter_by(bot_id=bot_id, channel=channel)
-            .order_by(Message.created_at.desc())
-            .limit(10)
-            .all()
-        )
 
-        if past_messages:
-            conversation_history = "Recent conversation history:\n"
-            # Reverse to get chronological order
-            for msg in reversed(past_messages):
-                conversation_history += (
-                    f"{'Bot' if msg.is_bot else 'User'}: {msg.text}\n"
-                )
+def format_gpt_request(text, context, bot_name, past_messages, token_budget=None):
+    """
+    Assemble the Chat Completions request body from already-loaded parts
+
+    Args:
+        text (str): The user's query
+        context (str): The context from bot documents
+        bot_name (str): The name of the bot
+        past_messages (list): Recent messages, newest first; anything with
+            ``is_bot`` and ``text`` attributes
+        token_budget (int, optional): Maximum prompt size in tokens; defaults
+            to PROMPT_TOKEN_BUDGET, 0 disables
+
+    Returns:
+        dict: The request body
+    """
+    system_prompt = f"You are an assistant for the bot named {bot_name}. Use the following context to inform your responses, but focus primarily on answering the user's query."
+    context_prefix = "Here is some context information: "
+    acknowledgement = (
+        "I've reviewed this information and am ready to help with your question."
+    )
+    history_header = "Recent conversation history:\n"
+    history_lines = [
+        f"{'Bot' if msg.is_bot else 'User'}: {msg.text}\n"
+        for msg in past_messages or []
+    ]
+
+    # Keep the query, then the newest history, then as much context as fits
+    if token_budget is None:
+        token_budget = default_token_budget()
+    fixed_text = [system_prompt, context_prefix, acknowledgement]
+    if history_lines:
+        fixed_text.append(history_header)
+    text, context, history_lines, usage = fit_prompt(
+        text, context, history_lines, fixed_text, CHAT_MODEL, token_budget
+    )
+    log_usage(bot_name, token_budget, usage)
+
+    conversation_history = ""
+    if history_lines:
+        # Reverse to get chronological order
+        conversation_history = history_header + "".join(reversed(history_lines))
 
     # Combine document context with conversation history
     full_context = (
         f"{context}\n\n{conversation_history}" if conversation_history else context
     )
 
-    data = {
-        "model": "gpt-4o",
+    return {
+        "model": CHAT_MODEL,
         "messages": [
             {
                 "role": "system",
-                "content": f"You are an assistant for the bot named {bot_name}. Use the following context to inform your responses, but focus primarily on answering the user's query.",
+                "content": system_prompt,
             },
             {
                 "role": "user",
-                "content": f"Here is some context information: {full_context}",
+                "content": f"{context_prefix}{full_context}",
             },
             {
                 "role": "assistant",
-                "content": "I've reviewed this information and am ready to help with your question.",
+                "content": acknowledgement,
             },
             {
                 "role": "user",
@@ -68,59 +139,286 @@ def ask_gpt(text, context, bot_name, bot_id=None, channel=None):
         ],
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions",
-        headers=headers,
-        data=json.dumps(data),
-    )
 
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
-    else:
-        raise Exception(f"Error from OpenAI API: {response.text}")
+def ask_gpt(text, context, bot_name, bot_id=None, channel=None):
+    """
+    Send a request to OpenAI's Chat Completions API
+
+    Args:
+        text (str): The user's query
+        context (str): The context from bot documents
+        bot_name (str): The name of the bot
+        bot_id (int, optional): The database ID of the bot
+        channel (str, optional): The Slack channel ID
+
+    Returns:
+        str: The response from GPT
+    """
+    data = build_gpt_request(text, context, bot_name, bot_id, channel)
+    response = get_llm_client().chat_completion(data)
+    return response["choices"][0]["message"]["content"]
 
 
-def process_bot_responses(text, channel_id, user_message, db, slack_client, logger):
+def ask_gpt_stream(text, context, bot_name, bot_id=None, channel=None):
     """
-    Process responses from all bots for a given user message
+    Like ask_gpt, but yield the response text as the model produces it
 
     Args:
-        text (str): The user's message text
+        text (str): The user's query
+        context (str): The context from bot documents
+        bot_name (str): The name of the bot
+        bot_id (int, optional): The database ID of the bot
+        channel (str, optional): The Slack channel ID
+
+    Yields:
+        str: Pieces of the response in order
+    """
+    data = build_gpt_request(text, context, bot_name, bot_id, channel)
+    yield from get_llm_client().stream_chat_completion(data)
+
+
+def post_streaming_response(
+    text, context, bot_name, bot_id, channel_id, slack_client, logger
+):
+    """
+    Post a placeholder to Slack and keep updating it as the answer streams in
+
+    Updates are throttled to one every STREAM_UPDATE_INTERVAL seconds to stay
+    under Slack's chat.update rate limit.
+
+    Args:
+        text (str): The user's query
+        context (str): The context from bot documents
+        bot_name (str): The name of the bot
+        bot_id (int): The database ID of the bot
         channel_id (str): The Slack channel ID
-        user_message (Message): The saved user message object
-        db: The database session
         slack_client: The Slack client
         logger: The logger instance
+
+    Returns:
+        tuple: (full response text, Slack timestamp of the message)
     """
-    from app.models import SlackBot, Message
-    import json
+    interval = float(os.environ.get("STREAM_UPDATE_INTERVAL", "1.0"))
+    start = time.monotonic()
 
-    # Get all bots
-    all_bots = SlackBot.query.all()
-    logger.info(f"Found {len(all_bots)} bots")
+    placeholder = slack_client.chat_postMessage(
+        channel=channel_id, text=f"*{bot_name}*: _thinking..._"
+    )
+    ts = placeholder["ts"]
 
-    # Create a dictionary of bot contexts
-    bot_contexts = {}
-    bot_names = {}
-    for bot in all_bots:
-        documents = bot.documents
-        context = " ".join([doc.content for doc in documents])
-        bot_contexts[bot.id] = context
-        bot_names[bot.id] = bot.name
-
-    # Create a prompt to determine which bot should respond
-    bot_descriptions = "\n".join(
-        [
-            f"- Bot {bot.id} ({bot.name}): {bot_contexts[bot.id][:200]}..."
-            for bot in all_bots
-        ]
+    parts = []
+    first_token_at = None
+    last_update = time.monotonic()
+    try:
+        for delta in ask_gpt_stream(text, context, bot_name, bot_id, channel_id):
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            parts.append(delta)
+            if time.monotonic() - last_update >= interval:
+                try:
+                    slack_client.chat_update(
+                        channel=channel_id,
+                        ts=ts,
+                        text=f"*{bot_name}*: {''.join(parts)}",
+                    )
+                except SlackApiError as e:
+                    # Skip this update; the final one carries the full text
+                    logger.warning(f"Error updating streamed message: {e}")
+                last_update = time.monotonic()
+    except Exception:
+        slack_client.chat_update(
+            channel=channel_id,
+            ts=ts,
+            text=f"*{bot_name}*: Sorry, something went wrong answering this.",
+        )
+        raise
+
+    bot_response = "".join(parts)
+    slack_client.chat_update(
+        channel=channel_id, ts=ts, text=f"*{bot_name}*: {bot_response}"
     )
+    if first_token_at is not None:
+        logger.info(
+            f"Streamed response: first token after {first_token_at - start:.2f}s, "
+            f"complete after {time.monotonic() - start:.2f}s"
+        )
+    return bot_response, ts
+
+
+def get_embeddings(texts):
+    """
+    Get embedding vectors for several pieces of text in one request
+
+    Args:
+        texts (list): The texts to embed
+
+    Returns:
+        list: One embedding vector per input text, in input order
+    """
+    data = {
+        "model": os.environ.get("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+        "input": texts,
+    }
+
+    response = get_llm_client().embeddings(data)
+    items = sorted(response["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in items]
+
+
+def get_embedding(text):
+    """
+    Get an embedding vector for a piece of text from OpenAI's Embeddings API
+
+    Args:
+        text (str): The text to embed
+
+    Returns:
+        list: The embedding vector
+    """
+    return get_embeddings([text])[0]
+
+
+@lru_cache(maxsize=1024)
+def embed_query(text):
+    """
+    Embed a user query, reusing the result when the same text is seen again
+
+    The router and chunk retrieval both need the query embedding, so caching
+    it keeps that to a single API call per message.
+
+    Args:
+        text (str): The user's query
+
+    Returns:
+        tuple: The embedding vector
+    """
+    return tuple(get_embedding(text))
+
+
+def route_with_embeddings(text, all_bots, logger):
+    """
+    Try to pick a bot by comparing the query embedding to each bot's profile
+
+    Args:
+        text (str): The user's message text
+        all_bots (list): All CachedBot entries
+        logger: The logger instance
+
+    Returns:
+        dict: Router data (bot_id, bot_name, confidence), or None to fall back
+            to the LLM router
+    """
+    profiles = bot_profiles(all_bots)
+    if profiles is None:
+        return None
+
+    try:
+        query_embedding = embed_query(text)
+    except Exception as e:
+        logger.warning(f"Embedding router failed, falling back to LLM: {str(e)}")
+        record_route("llm_fallback_error")
+        return None
+
+    return choose_bot_by_embedding(query_embedding, all_bots, profiles, logger)
+
+
+def bot_profiles(all_bots):
+    """
+    Collect every bot's profile vector for the embedding router
+
+    Args:
+        all_bots (list): All CachedBot entries
+
+    Returns:
+        dict: Bot ID -> profile vector, or None if some bot has no profile
+    """
+    profiles = {}
+    for bot in all_bots:
+        profile = bot.profile
+        if profile is None:
+            # A bot without embedded documents can't be scored, so the vector
+            # router would never pick it
+            record_route("llm_fallback_no_profiles")
+            return None
+        profiles[bot.id] = profile
+
+    if not profiles:
+        record_route("llm_fallback_no_profiles")
+        return None
+    return profiles
+
+
+def choose_bot_by_embedding(query_embedding, all_bots, profiles, logger):
+    """
+    Pick a bot from embedding scores, or give up if the top two are too close
+
+    Args:
+        query_embedding (list): The embedding of the user's message
+        all_bots (list): All CachedBot entries
+        profiles (dict): Bot ID -> profile vector
+        logger: The logger instance
+
+    Returns:
+        dict: Router data (bot_id, bot_name, confidence), or None to fall back
+            to the LLM router
+    """
+    bot_id, score, margin = pick_bot(query_embedding, profiles)
+    if bot_id is None:
+        logger.info(
+            f"Embedding router ambiguous (score {score:.3f}, margin {margin:.3f}), "
+            f"falling back to LLM"
+        )
+        record_route("llm_fallback_ambiguous")
+        return None
+
+    record_route("vector_routed")
+    bot_name = next(bot.name for bot in all_bots if bot.id == bot_id)
+    return {"bot_id": bot_id, "bot_name": bot_name, "confidence": score}
+
+
+def route_with_llm(text, bot_descriptions, logger, raise_errors=False):
+    """
+    Ask the chat model which bot should respond
+
+    Args:
+        text (str): The user's message text
+        bot_descriptions (str): One line per bot describing its specialty
+        logger: The logger instance
+        raise_errors (bool): Re-raise an LLMError instead of returning None,
+            so a caller that can retry the event does
 
-    api_key = os.environ.get("OPENAI_API_KEY")
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    Returns:
+        dict: Router data (bot_id, bot_name, confidence), or None on error
+    """
+    router_prompt = build_router_request(text, bot_descriptions)
+
+    # Call OpenAI to determine which bot should respond
+    logger.info("Calling OpenAI API to determine which bot should respond")
+    try:
+        response = get_llm_client().chat_completion(router_prompt)
+    except LLMError as e:
+        logger.error(str(e))
+        if raise_errors:
+            raise
+        return None
 
-    router_prompt = {
-        "model": "gpt-4o",
+    router_response = response["choices"][0]["message"]["content"]
+    return json.loads(router_response)
+
+
+def build_router_request(text, bot_descriptions):
+    """
+    Build the Chat Completions request body for the LLM router
+
+    Args:
+        text (str): The user's message text
+        bot_descriptions (str): One line per bot describing its specialty
+
+    Returns:
+        dict: The request body
+    """
+    return {
+        "model": CHAT_MODEL,
         "messages": [
             {
                 "role": "system",
@@ -142,136 +440,493 @@ def process_bot_responses(text, channel_id, user_message, db, slack_client, logg
         "response_format": {"type": "json_object"},
     }
 
-    try:
-        # Call OpenAI to determine which bot should respond
-        logger.info("Calling OpenAI API to determine which bot should respond")
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            data=json.dumps(router_prompt),
+
+def build_query_context(
+    text, bot_id, full_context, logger, chunked=None, unchunked_context=None
+):
+    """
+    Build the context for a query from the bot's most relevant document chunks
+
+    Args:
+        text (str): The user's query
+        bot_id (int): The database ID of the bot
+        full_context (str): All of the bot's document text, used as a fallback
+        logger: The logger instance
+        chunked (bool, optional): Whether the bot has chunks, if already known
+        unchunked_context (str, optional): The text of the bot's documents
+            that have no chunks, if already known
+
+    Returns:
+        str: The top-k chunks followed by the full text of any documents that
+            haven't been chunked, or the full context if none have been
+    """
+    if os.environ.get("CHUNK_RETRIEVAL_ENABLED", "true").lower() != "true":
+        return full_context
+    if chunked is None:
+        chunked = has_chunks(bot_id)
+    if not chunked:
+        return full_context
+    if unchunked_context is None:
+        unchunked_context = unchunked_text(
+            Document.query.filter_by(bot_id=bot_id).all(),
+            chunked_document_ids(bot_id),
         )
 
-        if response.status_code != 200:
-            logger.error(f"Error from OpenAI API: {response.text}")
-            return
+    try:
+        chunks = retrieve_chunks(bot_id, embed_query(text))
+    except Exception as e:
+        logger.warning(f"Chunk retrieval failed, using full context: {str(e)}")
+        return full_context
+
+    logger.info(f"Retrieved {len(chunks)} chunks for bot {bot_id}")
+    return join_query_context([chunk.content for chunk in chunks], unchunked_context)
 
-        router_response = response.json()["choices"][0]["message"]["content"]
-        router_data = json.loads(router_response)
 
-        logger.info(f"Router response: {router_data}")
+def join_query_context(chunks, unchunked_context):
+    """Retrieved chunks, then the whole text of documents not yet chunked"""
+    if unchunked_context:
+        chunks = chunks + [unchunked_context]
+    return CONTEXT_SEPARATOR.join(chunks)
 
-        # Get the selected bot's information
-        bot_id = router_data["bot_id"]
-        bot_name = router_data["bot_name"]
-        confidence = router_data["confidence"]
 
-        logger.info(
-            f"Selected bot: {bot_name} (ID: {bot_id}) with confidence: {confidence}"
-        )
+def route_message(text, all_bots, logger, raise_errors=False):
+    """
+    Decide which bot should answer, trying the embedding router first
 
-        # Use ask_gpt to get a response from the selected bot with its full context
-        bot_context = bot_contexts[bot_id]
-        bot_response = ask_gpt(text, bot_context, bot_name, bot_id, channel_id)
+    Args:
+        text (str): The user's message text
+        all_bots (list): All CachedBot entries
+        logger: The logger instance
+        raise_errors (bool): Re-raise LLM router failures (see route_with_llm)
 
-        # Format and send the response
-        formatted_response = f"*{bot_name}*: {bot_response}"
+    Returns:
+        dict: Router data (bot_id, bot_name, confidence), or None on error
+    """
+    router_data = None
+    if os.environ.get("VECTOR_ROUTER_ENABLED", "true").lower() == "true":
+        router_data = route_with_embeddings(text, all_bots, logger)
+    if router_data is None:
+        # Create a prompt to determine which bot should respond
+        bot_descriptions = get_router_descriptions(all_bots)
+        router_data = route_with_llm(text, bot_descriptions, logger, raise_errors)
+    return router_data
 
-        slack_response = slack_client.chat_postMessage(
-            channel=channel_id,
-            text=formatted_response,
-            # thread_ts=user_message.timestamp,  # Uncomment to make it a thread reply
-        )
 
-        # Store the bot's response in the database
-        bot_message = Message(
-            channel=channel_id,
-            text=bot_response,
-            timestamp=slack_response.get("ts"),
-            bot_id=bot_id,
-            is_bot=True,
-        )
-        db.session.add(bot_message)
-        db.session.commit()
-        logger.info(f"Bot response saved with ID: {bot_message.id}")
+def lookup_cached_response(text, channel_id, bots_by_id, logger):
+    """
+    Look for a cached answer to a near-identical earlier question
+
+    Args:
+        text (str): The user's message text
+        channel_id (str): The channel the message came from; only answers
+            given in that channel are reused
+        bots_by_id (dict): Bot ID -> CachedBot for the bots that still exist
+        logger: The logger instance
 
+    Returns:
+        tuple: (bot_id, bot_name, answer), or None if there's no usable hit
+    """
+    if not response_cache_enabled():
+        return None
+    try:
+        hit = get_response_cache().lookup(channel_id, embed_query(text))
     except Exception as e:
-        logger.error(
-            f"Error in router process: {str(e)}",
-            exc_info=True,
+        logger.warning(f"Response cache lookup failed: {str(e)}")
+        return None
+    if hit is None:
+        return None
+
+    bot_id, bot_name, answer, similarity = hit
+    if bot_id not in bots_by_id:
+        return None
+    logger.info(f"Response cache hit for bot {bot_name} (similarity {similarity:.3f})")
+    return bot_id, bot_name, answer
+
+
+def store_cached_response(text, channel_id, bot_id, bot_name, answer, logger):
+    """Remember an answer so near-identical questions in the channel can reuse it"""
+    if not response_cache_enabled():
+        return
+    try:
+        get_response_cache().store(
+            channel_id, bot_id, bot_name, embed_query(text), answer
         )
+    except Exception as e:
+        logger.warning(f"Response cache store failed: {str(e)}")
 
 
-def get_or_create_user(user_id, slack_client, db, logger):
+def post_bot_response(bot_response, bot_name, channel_id, slack_client):
     """
-    Get an existing user or create a new one if they don't exist
+    Post a bot's answer to Slack
+
+    Returns:
+        str: The Slack timestamp of the posted message
+    """
+    # Format and send the response
+    formatted_response = f"*{bot_name}*: {bot_response}"
+
+    slack_response = slack_client.chat_postMessage(
+        channel=channel_id,
+        text=formatted_response,
+        # thread_ts=user_message.timestamp,  # Uncomment to make it a thread reply
+    )
+    return slack_response.get("ts")
+
+
+def save_bot_message(bot_response, bot_id, channel_id, response_ts, logger):
+    """
+    Store a bot's answer and write it through to the history buffers
 
     Args:
-        user_id (str): The Slack user ID
-        slack_client: The Slack client
-        db: The database session
+        bot_response (str): The answer text
+        bot_id (int): The database ID of the bot
+        channel_id (str): The Slack channel ID
+        response_ts (str): The Slack timestamp of the posted message
+        logger: The logger instance
+    """
+    values = dict(
+        channel=channel_id,
+        text=bot_response,
+        timestamp=response_ts,
+        bot_id=bot_id,
+        is_bot=True,
+    )
+    bot_message = Message(id=save_message(values), **values)
+    record_message(bot_message)
+    remember_answer(channel_id, bot_id)
+    logger.info(f"Bot response saved with ID: {bot_message.id}")
+
+
+def route_to_bots(text, all_bots, logger, raise_errors=False):
+    """
+    Like route_message, but a message spanning several specialties may get
+    several bots (MULTI_BOT_ENABLED)
+
+    A clear embedding decision still picks one bot; when it is ambiguous,
+    the LLM router may return up to MULTI_BOT_MAX of them.
+
+    Args:
+        text (str): The user's message text
+        all_bots (list): All CachedBot entries
         logger: The logger instance
+        raise_errors (bool): Re-raise LLM router failures (see route_with_llm)
 
     Returns:
-        User: The user object
+        list: Router data dicts (bot_id, bot_name, confidence), best first;
+            empty on error
     """
-    # Check if user exists
-    user = User.query.filter_by(slack_user_id=user_id).first()
+    if os.environ.get("VECTOR_ROUTER_ENABLED", "true").lower() == "true":
+        router_data = route_with_embeddings(text, all_bots, logger)
+        if router_data is not None:
+            return [router_data]
+
+    router_prompt = build_multi_router_request(
+        text, get_router_descriptions(all_bots), multi_bot_max(), CHAT_MODEL
+    )
+    try:
+        response = get_llm_client().chat_completion(router_prompt)
+    except LLMError as e:
+        logger.error(str(e))
+        if raise_errors:
+            raise
+        return []
+    return parse_multi_router_response(
+        response["choices"][0]["message"]["content"],
+        {bot.id: bot for bot in all_bots},
+    )
 
-    # If user doesn't exist, create a new user record
-    if not user:
-        logger.info(f"User {user_id} not found in database, creating new user record")
-        try:
-            # Fetch user info from Slack API
-            user_info = slack_client.users_info(user=user_id)
-            username = user_info["user"]["name"]
-            email = user_info["user"]["profile"].get("email")
 
-            logger.info(f"Creating user with username: {username}, email: {email}")
-            user = User(slack_user_id=user_id, username=username, email=email)
-            db.session.add(user)
-            db.session.commit()
-        except SlackApiError as e:
-            logger.error(f"Error fetching user info: {e}")
-            username = f"user_{user_id}"
-            user = User(slack_user_id=user_id, username=username)
-            db.session.add(user)
-            db.session.commit()
+def fan_out_responses(text, channel_id, routes, bots_by_id, slack_client, logger):
+    """
+    Ask several bots at once, posting each answer as it arrives or all of them
+    merged into one message (MULTI_BOT_REPLY)
+
+    Args:
+        text (str): The user's message text
+        channel_id (str): The Slack channel ID
+        routes (list): Router data dicts for the bots that should answer
+        bots_by_id (dict): Bot ID -> CachedBot
+        slack_client: The Slack client
+        logger: The logger instance
+    """
+    app = current_app._get_current_object()
+
+    def ask(router_data):
+        # Runs on a worker thread, which needs its own app context
+        with app.app_context():
+            bot = bots_by_id[router_data["bot_id"]]
+            with stage("context"):
+                bot_context = build_query_context(
+                    text,
+                    bot.id,
+                    bot.context,
+                    logger,
+                    chunked=bot.has_chunks,
+                    unchunked_context=bot.unchunked_context,
+                )
+            with stage("answer"):
+                return ask_gpt(text, bot_context, bot.name, bot.id, channel_id)
+
+    def publish(answers):
+        with stage("slack_post"):
+            if len(answers) == 1:
+                router_data, bot_response = answers[0]
+                response_ts = post_bot_response(
+                    bot_response, router_data["bot_name"], channel_id, slack_client
+                )
+            else:
+                merged = format_merged_reply(
+                    [
+                        (router_data["bot_name"], answer)
+                        for router_data, answer in answers
+                    ]
+                )
+                response_ts = slack_client.chat_postMessage(
+                    channel=channel_id, text=merged
+                ).get("ts")
+        with stage("save_reply"):
+            for router_data, bot_response in answers:
+                save_bot_message(
+                    bot_response, router_data["bot_id"], channel_id, response_ts, logger
+                )
 
-    return user
+    logger.info(f"Asking {len(routes)} bots: {[r['bot_name'] for r in routes]}")
+    answer_concurrently(routes, ask, publish)
 
 
-def check_duplicate_message(channel_id, ts, client_msg_id, logger):
+def route_with_speculation(
+    text, channel_id, all_bots, bots_by_id, logger, raise_errors=False
+):
     """
-    Check if a message is a duplicate based on client_msg_id or timestamp
+    Like route_message, but start answering as the likeliest bot while the
+    LLM router decides (SPECULATIVE_ANSWERS)
+
+    A clear embedding decision needs no speculation. Otherwise the guessed
+    bot (see speculation.guess_bot) is asked on a worker thread alongside the
+    router call. Its answer is kept if the router picks the same bot; if not,
+    the worker is told to stop, so it skips the completion unless that was
+    already sent, in which case the answer is discarded, and the caller asks
+    the routed bot as usual.
 
     Args:
+        text (str): The user's message text
         channel_id (str): The Slack channel ID
-        ts (str): The message timestamp
-        client_msg_id (str): The client message ID
+        all_bots (list): All CachedBot entries
+        bots_by_id (dict): Bot ID -> CachedBot
         logger: The logger instance
+        raise_errors (bool): Re-raise LLM router failures (see route_with_llm)
 
     Returns:
-        bool: True if duplicate, False otherwise
+        tuple: (router data or None on error, the routed bot's answer or None
+            if it still has to be asked)
+    """
+    query_embedding = None
+    if os.environ.get("VECTOR_ROUTER_ENABLED", "true").lower() == "true":
+        profiles = bot_profiles(all_bots)
+        if profiles is not None:
+            try:
+                query_embedding = embed_query(text)
+            except Exception as e:
+                logger.warning(
+                    f"Embedding router failed, falling back to LLM: {str(e)}"
+                )
+                record_route("llm_fallback_error")
+        if query_embedding is not None:
+            router_data = choose_bot_by_embedding(
+                query_embedding, all_bots, profiles, logger
+            )
+            if router_data is not None:
+                return router_data, None
+
+    guess = guess_bot(channel_id, all_bots, query_embedding)
+    if guess is None:
+        record_speculation("no_guess")
+        router_data = route_with_llm(
+            text, get_router_descriptions(all_bots), logger, raise_errors
+        )
+        return router_data, None
+
+    app = current_app._get_current_object()
+    # The worker starts at once, so a future can't be cancelled; it checks
+    # this instead before paying for a completion
+    stop = threading.Event()
+
+    def ask():
+        # Runs on a worker thread, which needs its own app context
+        with app.app_context():
+            bot = bots_by_id[guess]
+            bot_context = build_query_context(
+                text,
+                bot.id,
+                bot.context,
+                logger,
+                chunked=bot.has_chunks,
+                unchunked_context=bot.unchunked_context,
+            )
+            if stop.is_set():
+                return None, time.monotonic()
+            answer = ask_gpt(text, bot_context, bot.name, bot.id, channel_id)
+            return answer, time.monotonic()
+
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative")
+    future = executor.submit(copy_context().run, ask)
+    executor.shutdown(wait=False)
+
+    try:
+        router_data = route_with_llm(
+            text, get_router_descriptions(all_bots), logger, raise_errors
+        )
+    except LLMError:
+        stop.set()
+        raise
+    routed_at = time.monotonic()
+    if router_data is None or router_data["bot_id"] != guess:
+        stop.set()
+        record_speculation("misses")
+        logger.info(
+            f"Speculative answer from bot {guess} discarded, router picked "
+            f"{router_data['bot_id'] if router_data else None}"
+        )
+        return router_data, None
+
+    try:
+        answer, answered_at = future.result()
+    except Exception as e:
+        record_speculation("failed")
+        logger.warning(f"Speculative answer failed, asking again: {str(e)}")
+        return router_data, None
+
+    # In series the answer would take its own time on top of routing; in
+    # parallel the shorter of the two is hidden behind the longer
+    saved = min(routed_at - start, answered_at - start)
+    record_speculation("hits", saved)
+    logger.info(f"Speculative answer from bot {guess} kept, saved {saved:.2f}s")
+    return router_data, answer
+
+
+def process_bot_responses(
+    text, channel_id, user_message, db, slack_client, logger, raise_errors=False
+):
+    """
+    Process responses from all bots for a given user message
+
+    Args:
+        text (str): The user's message text
+        channel_id (str): The Slack channel ID
+        user_message (Message): The saved user message object
+        db: The database session
+        slack_client: The Slack client
+        logger: The logger instance
+        raise_errors (bool): Re-raise failures after logging them, routing
+            included, so a caller that can retry the event (the job queue)
+            does
     """
-    # Check if this is a duplicate message using client_msg_id (most reliable)
-    if client_msg_id:
-        existing_message = Message.query.filter_by(client_msg_id=client_msg_id).first()
+    # Get all bots with their contexts from the process-wide cache
+    all_bots = get_cached_bots()
+    logger.info(f"Found {len(all_bots)} bots")
+    bots_by_id = {bot.id: bot for bot in all_bots}
+
+    try:
+        # A near-identical question may already have an answer
+        with stage("cache_lookup"):
+            cached = lookup_cached_response(text, channel_id, bots_by_id, logger)
+        if cached is not None:
+            bot_id, bot_name, bot_response = cached
+            with stage("slack_post"):
+                response_ts = post_bot_response(
+                    bot_response, bot_name, channel_id, slack_client
+                )
+        else:
+            streaming = os.environ.get("STREAM_RESPONSES", "false").lower() == "true"
+            speculative_answer = None
+            with stage("route"):
+                if multi_bot_enabled():
+                    routes = route_to_bots(text, all_bots, logger, raise_errors)
+                elif speculation_enabled() and not streaming:
+                    # A streamed answer is posted as it is written, so it can't
+                    # be started before the bot is known
+                    router_data, speculative_answer = route_with_speculation(
+                        text, channel_id, all_bots, bots_by_id, logger, raise_errors
+                    )
+                    routes = [router_data] if router_data is not None else []
+                else:
+                    router_data = route_message(text, all_bots, logger, raise_errors)
+                    routes = [router_data] if router_data is not None else []
+            if not routes:
+                return
+
+            logger.info(f"Router response: {routes}")
+            for router_data in routes:
+                record_confidence(router_data["confidence"])
+            if len(routes) > 1:
+                fan_out_responses(
+                    text, channel_id, routes, bots_by_id, slack_client, logger
+                )
+                return
+
+            # Get the selected bot's information
+            router_data = routes[0]
+            bot_id = router_data["bot_id"]
+            bot_name = router_data["bot_name"]
+            confidence = router_data["confidence"]
 
-        if existing_message:
             logger.info(
-                f"Duplicate message detected with client_msg_id {client_msg_id}, skipping processing"
+                f"Selected bot: {bot_name} (ID: {bot_id}) with confidence: {confidence}"
             )
-            return True
-    # Fallback to timestamp-based deduplication if client_msg_id is not available
-    else:
-        existing_message = Message.query.filter_by(
-            channel=channel_id, timestamp=ts, is_bot=False
-        ).first()
-
-        if existing_message:
-            logger.info(
-                f"Duplicate message detected with timestamp {ts}, skipping processing"
+
+            # Use ask_gpt to get a response from the selected bot with the parts
+            # of its documents most relevant to the query
+            bot = bots_by_id[bot_id]
+            if speculative_answer is not None:
+                bot_response = speculative_answer
+                with stage("slack_post"):
+                    response_ts = post_bot_response(
+                        bot_response, bot_name, channel_id, slack_client
+                    )
+            else:
+                with stage("context"):
+                    bot_context = build_query_context(
+                        text,
+                        bot_id,
+                        bot.context,
+                        logger,
+                        chunked=bot.has_chunks,
+                        unchunked_context=bot.unchunked_context,
+                    )
+                if streaming:
+                    # Answering and posting overlap, so they are one stage
+                    with stage("answer_streamed"):
+                        bot_response, response_ts = post_streaming_response(
+                            text,
+                            bot_context,
+                            bot_name,
+                            bot_id,
+                            channel_id,
+                            slack_client,
+                            logger,
+                        )
+                else:
+                    with stage("answer"):
+                        bot_response = ask_gpt(
+                            text, bot_context, bot_name, bot_id, channel_id
+                        )
+                    with stage("slack_post"):
+                        response_ts = post_bot_response(
+                            bot_response, bot_name, channel_id, slack_client
+                        )
+            store_cached_response(
+                text, channel_id, bot_id, bot_name, bot_response, logger
             )
-            return True
 
-    return False
+        # Store the bot's final response in the database
+        with stage("save_reply"):
+            save_bot_message(bot_response, bot_id, channel_id, response_ts, logger)
+
+    except Exception as e:
+        logger.error(
+            f"Error in router process: {str(e)}",
+            exc_info=True,
+        )
+        if raise_errors:
+            raise
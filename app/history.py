@@ -0,0 +1,291 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque, namedtuple
+from app.message_writer import pending_messages
+from app.models import Message
+
+HistoryEntry = namedtuple("HistoryEntry", ["id", "is_bot", "text"])
+
+
+class ConversationHistory:
+    """
+    Bounded in-memory ring buffers of recent messages per (channel, bot)
+
+    Each buffer mirrors what the history query returns: the newest
+    ``length`` messages for the pair. Buffers are loaded from the database
+    on a miss and then kept current by appending messages as they are
+    saved. Idle pairs are evicted least recently used first once there are
+    more than ``max_channels`` of them or their text exceeds ``max_bytes``.
+    Buffers also expire after ``ttl`` seconds, which bounds how long a
+    message saved by another worker process can be missing.
+    """
+
+    def __init__(
+        self, length=10, max_channels=5000, max_bytes=16 * 1024 * 1024, ttl=300
+    ):
+        self.length = length
+        self.max_channels = max_channels
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._buffers = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "appends": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, channel, bot_id):
+        """
+        Read a pair's history from memory
+
+        On a miss the pair is marked as loading, so messages appended while
+        the caller queries the database are kept and merged by ``hydrate``.
+
+        Args:
+            channel (str): The Slack channel ID
+            bot_id (int): The database ID of the bot
+
+        Returns:
+            list: HistoryEntry items, newest first, or None on a miss
+        """
+        key = (channel, bot_id)
+        now = time.monotonic()
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None and buffer["loaded"]:
+                if now - buffer["loaded_at"] <= self.ttl:
+                    self._buffers.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return list(reversed(buffer["messages"]))
+                self._remove(key)
+                self._stats["expirations"] += 1
+                buffer = None
+
+            self._stats["misses"] += 1
+            if buffer is None:
+                self._store(key, [], loaded=False)
+            return None
+
+    def hydrate(self, channel, bot_id, messages):
+        """
+        Fill a pair's buffer with the result of the history query
+
+        Args:
+            channel (str): The Slack channel ID
+            bot_id (int): The database ID of the bot
+            messages (list): Rows with ``id``, ``is_bot`` and ``text``, newest first
+
+        Returns:
+            list: The buffered HistoryEntry items, newest first
+        """
+        key = (channel, bot_id)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            pending = buffer["messages"] if buffer is not None else []
+            merged = {entry.id: entry for entry in pending}
+            for msg in messages:
+                merged.setdefault(msg.id, HistoryEntry(msg.id, msg.is_bot, msg.text))
+            entries = sorted(merged.values(), key=lambda entry: entry.id)
+            self._remove(key)
+            buffer = self._store(key, entries, loaded=True)
+            return list(reversed(buffer["messages"]))
+
+    def append(self, channel, bot_id, message_id, is_bot, text):
+        """
+        Write a just-saved message through to its pair's buffer
+
+        Pairs that aren't in memory are left alone; their next read loads
+        the message from the database.
+
+        Args:
+            channel (str): The Slack channel ID
+            bot_id (int): The database ID of the bot
+            message_id (int): The saved message's ID
+            is_bot (bool): Whether a bot sent the message
+            text (str): The message text
+        """
+        key = (channel, bot_id)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                return
+            messages = buffer["messages"]
+            if len(messages) == messages.maxlen:
+                # The ring is full; the append below pushes out the oldest
+                dropped = len(messages[0].text)
+                buffer["bytes"] -= dropped
+                self._bytes -= dropped
+            messages.append(HistoryEntry(message_id, is_bot, text))
+            buffer["bytes"] += len(text)
+            self._bytes += len(text)
+            self._buffers.move_to_end(key)
+            self._stats["appends"] += 1
+            self._evict()
+
+    def invalidate(self, channel=None, bot_id=None):
+        """
+        Drop buffers, e.g. after a message is edited or deleted in the admin
+
+        Args:
+            channel (str, optional): Only drop this channel's buffers
+            bot_id (int, optional): Only drop this bot's buffers
+        """
+        with self._lock:
+            stale = [
+                key
+                for key in self._buffers
+                if (channel is None or key[0] == channel)
+                and (bot_id is None or key[1] == bot_id)
+            ]
+            for key in stale:
+                self._remove(key)
+
+    def stats(self):
+        """
+        Snapshot of the history buffer counters
+
+        Returns:
+            dict: Hit/miss/eviction counters, buffer count, size and hit rate
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["channels"] = len(self._buffers)
+            snapshot["bytes"] = self._bytes
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+    def _store(self, key, entries, loaded):
+        messages = deque(entries, maxlen=self.length)
+        buffer = {
+            "messages": messages,
+            "bytes": sum(len(entry.text) for entry in messages),
+            "loaded": loaded,
+            "loaded_at": time.monotonic(),
+        }
+        self._buffers[key] = buffer
+        self._bytes += buffer["bytes"]
+        self._evict()
+        return buffer
+
+    def _evict(self):
+        # Never evict the most recently used buffer, however large it is
+        while len(self._buffers) > 1 and (
+            len(self._buffers) > self.max_channels or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._buffers))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        buffer = self._buffers.pop(key, None)
+        if buffer is not None:
+            self._bytes -= buffer["bytes"]
+
+
+def history_length():
+    return int(os.environ.get("HISTORY_LENGTH", "10"))
+
+
+def history_cache_enabled():
+    return os.environ.get("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_conversation_history():
+    """
+    Get the process-wide conversation history buffers, creating them on first use
+
+    Returns:
+        ConversationHistory: The shared buffers
+    """
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = ConversationHistory(
+                    length=history_length(),
+                    max_channels=int(os.environ.get("HISTORY_CACHE_SIZE", "5000")),
+                    max_bytes=int(
+                        os.environ.get("HISTORY_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+                    ),
+                    ttl=float(os.environ.get("HISTORY_CACHE_TTL", "300")),
+                )
+    return _history
+
+
+def recent_messages(bot_id, channel):
+    """
+    A bot's most recent messages in a channel, from memory when possible
+
+    Args:
+        bot_id (int): The database ID of the bot
+        channel (str): The Slack channel ID
+
+    Returns:
+        list: Messages newest first; anything with ``is_bot`` and ``text``
+    """
+    if not history_cache_enabled():
+        return query_recent_messages(bot_id, channel)
+
+    history = get_conversation_history()
+    messages = history.get(channel, bot_id)
+    if messages is None:
+        messages = history.hydrate(
+            channel, bot_id, query_recent_messages(bot_id, channel)
+        )
+    return messages
+
+
+def query_recent_messages(bot_id, channel):
+    # Pending first: a message leaves it only once it is committed
+    pending = pending_messages(channel, bot_id)
+    rows = (
+        Message.query.filter_by(bot_id=bot_id, channel=channel)
+        .order_by(Message.created_at.desc())
+        .limit(history_length())
+        .all()
+    )
+    return with_pending(rows, pending)
+
+
+def with_pending(rows, pending):
+    """
+    Merge messages the write-behind batcher hasn't written yet into query rows
+
+    Args:
+        rows (list): History query rows, newest first
+        pending (list): Unwritten messages from pending_messages, newest first
+
+    Returns:
+        list: The newest history_length() messages, newest first
+    """
+    if not pending:
+        return rows
+    merged = {row.id: row for row in rows}
+    for message in pending:
+        merged.setdefault(message.id, message)
+    newest = sorted(merged.values(), key=lambda message: message.id, reverse=True)
+    return newest[: history_length()]
+
+
+def record_message(message):
+    """
+    Write a saved bot message through to the history buffers
+
+    Args:
+        message (Message): The committed message
+    """
+    if message.bot_id is None or not history_cache_enabled():
+        return
+    get_conversation_history().append(
+        message.channel, message.bot_id, message.id, message.is_bot, message.text
+    )
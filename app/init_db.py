@@ -1,18 +1,13 @@
-from app import db, create_app
-from app.models import Message, User, SlackBot
+from app import create_app
+from flask_migrate import upgrade
 
 
 def init_database():
-    print("Creating database tables...")
+    print("Applying database migrations...")
     app = create_app()
     with app.app_context():
-        # Create the vector extension first
-        db.session.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-        db.session.commit()
-
-        # Then create tables
-        db.create_all()
-    print("Database tables created successfully!")
+        upgrade()
+    print("Database is up to date!")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,472 @@
+import os
+import select
+import signal
+import socket
+import logging
+import threading
+from collections import namedtuple
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.metrics import record_event, stage
+from app.models import EventJob
+
+logger = logging.getLogger(__name__)
+
+# Postgres NOTIFY channel that wakes idle job workers
+NOTIFY_CHANNEL = "event_jobs"
+
+# A claimed job; ``attempts`` includes the current one
+Job = namedtuple("Job", ["id", "payload", "attempts"])
+
+# Jobs that outlived their visibility timeout on their last attempt
+_EXPIRE = text("""
+    UPDATE event_job
+    SET status = 'dead', locked_until = NULL, locked_by = NULL,
+        last_error = 'Visibility timeout expired on the last attempt'
+    WHERE status = 'running' AND locked_until < now() AND attempts >= :max_attempts
+    """)
+
+# Claim the oldest jobs that are due, skipping ones other workers hold and
+# ones queued behind an unfinished job for the same channel. A running job
+# whose lock has expired is claimed again.
+_CLAIM = text("""
+    UPDATE event_job
+    SET status = 'running', attempts = attempts + 1, locked_by = :worker,
+        locked_until = now() + make_interval(secs => :visibility)
+    WHERE id IN (
+        SELECT id FROM event_job AS job
+        WHERE job.status IN ('queued', 'running')
+          AND (job.status = 'queued' AND job.available_at <= now()
+               OR job.status = 'running' AND job.locked_until < now())
+          AND NOT EXISTS (
+              SELECT 1 FROM event_job AS earlier
+              WHERE earlier.channel = job.channel
+                AND earlier.id < job.id
+                AND earlier.status IN ('queued', 'running')
+          )
+        ORDER BY job.id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, payload, attempts
+    """)
+
+# The worker/attempts guard leaves a job alone once another worker has
+# claimed it again after this one's lock expired
+_COMPLETE = text("""
+    DELETE FROM event_job
+    WHERE id = :id AND locked_by = :worker AND attempts = :attempts
+    RETURNING channel
+    """)
+
+_FAIL = text("""
+    UPDATE event_job
+    SET status = CASE WHEN attempts >= :max_attempts THEN 'dead' ELSE 'queued' END,
+        available_at = now() + make_interval(secs => :delay),
+        locked_until = NULL, locked_by = NULL, last_error = :error
+    WHERE id = :id AND locked_by = :worker AND attempts = :attempts
+    RETURNING status, channel
+    """)
+
+_EXTEND = text("""
+    UPDATE event_job
+    SET locked_until = now() + make_interval(secs => :visibility)
+    WHERE id = ANY(:ids) AND locked_by = :worker AND status = 'running'
+    """)
+
+# Wake other workers when a finished job unblocks its channel's next one
+_NOTIFY_IF_CHANNEL_PENDING = text("""
+    SELECT pg_notify(:notify, '')
+    WHERE EXISTS (
+        SELECT 1 FROM event_job WHERE channel = :channel AND status = 'queued'
+    )
+    """)
+
+
+class JobQueue:
+    """
+    Durable queue of Slack events in the event_job table
+
+    Web workers ``enqueue`` each event in its own transaction and NOTIFY
+    idle job workers. Job workers ``claim`` with SELECT ... FOR UPDATE SKIP
+    LOCKED, so any number of them can share the table, and process at most
+    one job per channel at a time, oldest first. A claimed job is locked for
+    ``visibility_timeout`` seconds; workers ``extend`` the lock while they
+    work, so a job whose worker died is claimed again once it expires. A
+    failed job is retried after an exponential backoff, and after
+    ``max_attempts`` it is kept with status "dead" for inspection and
+    ``requeue_dead``. Finished jobs are deleted.
+
+    Delivery is at least once: a job whose lock expired mid-run may be
+    processed again.
+    """
+
+    def __init__(
+        self, visibility_timeout=60, max_attempts=5, retry_delay=5, max_retry_delay=300
+    ):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+    def enqueue(self, event_data):
+        """
+        Queue a Slack event payload
+
+        Args:
+            event_data (dict): The Slack event payload
+
+        Returns:
+            bool: True once the event is stored (or already was), False if
+                the database couldn't take it
+        """
+        event = event_data.get("event") or {}
+        statement = (
+            pg_insert(EventJob.__table__)
+            .values(
+                event_id=event_data.get("event_id"),
+                channel=event.get("channel"),
+                payload=event_data,
+            )
+            .on_conflict_do_nothing()
+            .returning(EventJob.__table__.c.id)
+        )
+        try:
+            with db.engine.begin() as conn:
+                job_id = conn.execute(statement).scalar()
+                if job_id is not None:
+                    conn.execute(
+                        text("SELECT pg_notify(:notify, '')"),
+                        {"notify": NOTIFY_CHANNEL},
+                    )
+        except SQLAlchemyError as e:
+            logger.error(f"Could not queue event: {str(e)}")
+            return False
+        if job_id is None:
+            record_event("duplicate")
+            logger.info(f"Event {event_data.get('event_id')} is already queued")
+        return True
+
+    def claim(self, worker, limit=1):
+        """
+        Lock the next jobs that are due for ``worker``
+
+        Args:
+            worker (str): Identifies the claiming worker
+            limit (int): At most this many jobs, never two for one channel
+
+        Returns:
+            list: Job tuples in queue order, empty if nothing is due
+        """
+        with db.engine.begin() as conn:
+            conn.execute(_EXPIRE, {"max_attempts": self.max_attempts})
+            rows = conn.execute(
+                _CLAIM,
+                {
+                    "worker": worker,
+                    "visibility": self.visibility_timeout,
+                    "limit": limit,
+                },
+            ).all()
+        return sorted((Job(*row) for row in rows), key=lambda job: job.id)
+
+    def complete(self, job, worker):
+        """Delete a job that was processed"""
+        with db.engine.begin() as conn:
+            channel = conn.execute(
+                _COMPLETE,
+                {"id": job.id, "worker": worker, "attempts": job.attempts},
+            ).scalar()
+            if channel is not None:
+                conn.execute(
+                    _NOTIFY_IF_CHANNEL_PENDING,
+                    {"notify": NOTIFY_CHANNEL, "channel": channel},
+                )
+
+    def fail(self, job, worker, error):
+        """
+        Schedule a retry of a job that raised, or dead-letter it
+
+        Returns:
+            str: The job's new status, "queued" or "dead", or None if another
+                worker has claimed it since
+        """
+        delay = min(self.retry_delay * 2 ** (job.attempts - 1), self.max_retry_delay)
+        with db.engine.begin() as conn:
+            row = conn.execute(
+                _FAIL,
+                {
+                    "id": job.id,
+                    "worker": worker,
+                    "attempts": job.attempts,
+                    "max_attempts": self.max_attempts,
+                    "delay": delay,
+                    "error": error,
+                },
+            ).first()
+            if row is not None and row.status == "dead":
+                conn.execute(
+                    _NOTIFY_IF_CHANNEL_PENDING,
+                    {"notify": NOTIFY_CHANNEL, "channel": row.channel},
+                )
+        return row.status if row is not None else None
+
+    def extend(self, job_ids, worker):
+        """Push back the visibility timeout of jobs ``worker`` is running"""
+        with db.engine.begin() as conn:
+            conn.execute(
+                _EXTEND,
+                {
+                    "ids": list(job_ids),
+                    "worker": worker,
+                    "visibility": self.visibility_timeout,
+                },
+            )
+
+    def requeue_dead(self):
+        """
+        Give dead-lettered jobs a fresh set of attempts
+
+        Returns:
+            int: How many jobs were requeued
+        """
+        with db.engine.begin() as conn:
+            count = conn.execute(
+                text(
+                    "UPDATE event_job SET status = 'queued', attempts = 0, "
+                    "available_at = now() WHERE status = 'dead'"
+                )
+            ).rowcount
+            conn.execute(
+                text("SELECT pg_notify(:notify, '')"), {"notify": NOTIFY_CHANNEL}
+            )
+        return count
+
+    def stats(self):
+        """
+        Snapshot of the job table
+
+        Returns:
+            dict: Jobs queued, running and dead, and the age in seconds of
+                the oldest queued job
+        """
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT status, count(*) AS jobs, "
+                    "extract(epoch FROM now() - min(created_at)) AS oldest "
+                    "FROM event_job GROUP BY status"
+                )
+            ).all()
+        snapshot = {"queued": 0, "running": 0, "dead": 0, "oldest_queued_seconds": 0.0}
+        for row in rows:
+            snapshot[row.status] = row.jobs
+            if row.status == "queued":
+                snapshot["oldest_queued_seconds"] = float(row.oldest)
+        snapshot["max_attempts"] = self.max_attempts
+        return snapshot
+
+
+class JobWorker:
+    """
+    Processes queued events on ``concurrency`` threads until stopped
+
+    Idle threads sleep until a NOTIFY on NOTIFY_CHANNEL or
+    ``poll_interval`` seconds pass; polling alone is enough if
+    notifications are lost. A heartbeat thread extends the locks of running
+    jobs. ``stop`` lets running jobs finish.
+    """
+
+    def __init__(self, app, job_queue, concurrency=4, poll_interval=5.0):
+        self.app = app
+        self.queue = job_queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+
+    def run(self):
+        """Process jobs until ``stop`` is called, then wait for running ones"""
+        threads = [
+            threading.Thread(target=self._listen, name="job-listen", daemon=True),
+            threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True),
+        ]
+        workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        for thread in threads + workers:
+            thread.start()
+        logger.info(f"Job worker {self.name} started {self.concurrency} threads")
+        for thread in workers:
+            thread.join()
+        logger.info(
+            f"Job worker {self.name} stopped after {self.processed} jobs "
+            f"({self.failed} failed)"
+        )
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    jobs = self.queue.claim(self.name)
+            except Exception as e:
+                logger.error(f"Could not claim jobs: {str(e)}")
+                self._stopping.wait(self.poll_interval)
+                continue
+            if not jobs:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            for job in jobs:
+                self._process(job)
+
+    def _process(self, job):
+        from app.routes import process_slack_event
+
+        with self._lock:
+            self._running[job.id] = job
+        try:
+            # A failure to answer raises too, so the job is retried; the
+            # retry finds the message already saved and answers it
+            with self.app.app_context(), stage("event"):
+                process_slack_event(
+                    job.payload, redelivered=job.attempts > 1, raise_errors=True
+                )
+        except Exception as e:
+            record_event("failed")
+            logger.error(
+                f"Job {job.id} failed on attempt {job.attempts}: {str(e)}",
+                exc_info=True,
+            )
+            self._finish(job, f"{type(e).__name__}: {e}")
+        else:
+            self._finish(job, None)
+
+    def _finish(self, job, error):
+        try:
+            with self.app.app_context():
+                if error is None:
+                    self.queue.complete(job, self.name)
+                elif self.queue.fail(job, self.name, error) == "dead":
+                    record_event("dead_lettered")
+                    logger.error(f"Job {job.id} dead-lettered")
+        except Exception as e:
+            # The lock expires and another worker picks the job up
+            logger.error(f"Could not finish job {job.id}: {str(e)}")
+        finally:
+            with self._lock:
+                del self._running[job.id]
+                if error is None:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+            # The channel's next job may be due now
+            self._wake.set()
+
+    def _heartbeat(self):
+        interval = self.queue.visibility_timeout / 3
+        while not self._stopping.wait(interval):
+            with self._lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                with self.app.app_context():
+                    self.queue.extend(job_ids, self.name)
+            except Exception as e:
+                logger.warning(f"Could not extend job locks: {str(e)}")
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    engine = db.engine
+                conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                with conn:
+                    conn.execute(text(f"LISTEN {NOTIFY_CHANNEL}"))
+                    connection = conn.connection.driver_connection
+                    while not self._stopping.is_set():
+                        ready, _, _ = select.select(
+                            [connection], [], [], self.poll_interval
+                        )
+                        if ready:
+                            connection.poll()
+                            connection.notifies.clear()
+                            self._wake.set()
+                    conn.execute(text(f"UNLISTEN {NOTIFY_CHANNEL}"))
+            except Exception as e:
+                logger.warning(f"Job notifications unavailable, polling: {str(e)}")
+                self._stopping.wait(self.poll_interval)
+
+
+def queue_enabled():
+    return os.environ.get("EVENT_PIPELINE", "threaded") == "queue"
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Get the process-wide job queue, creating it on first use
+
+    Returns:
+        JobQueue: The shared queue
+    """
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(
+                    visibility_timeout=float(
+                        os.environ.get("JOB_VISIBILITY_TIMEOUT", "60")
+                    ),
+                    max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "5")),
+                    retry_delay=float(os.environ.get("JOB_RETRY_DELAY", "5")),
+                    max_retry_delay=float(os.environ.get("JOB_MAX_RETRY_DELAY", "300")),
+                )
+    return _job_queue
+
+
+@click.command("job-worker")
+@click.option("--concurrency", type=int, help="Jobs processed at once")
+@click.option("--metrics-port", type=int, help="Serve /metrics on this port")
+@with_appcontext
+def job_worker_command(concurrency, metrics_port):
+    """Process Slack events queued with EVENT_PIPELINE=queue"""
+    from flask import current_app
+    from app.metrics import start_metrics_server
+
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    worker = JobWorker(
+        current_app._get_current_object(),
+        get_job_queue(),
+        concurrency=concurrency or int(os.environ.get("JOB_WORKER_CONCURRENCY", "4")),
+        poll_interval=float(os.environ.get("JOB_POLL_INTERVAL", "5")),
+    )
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.run()
+
+
+@click.command("requeue-dead-jobs")
+@with_appcontext
+def requeue_dead_jobs_command():
+    """Retry every dead-lettered job from scratch"""
+    click.echo(f"Requeued {get_job_queue().requeue_dead()} jobs")
@@ -0,0 +1,439 @@
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from app.admission import (
+    AdmissionRejected,
+    current_scope,
+    estimate_tokens,
+    get_admission_controller,
+)
+from app.metrics import record_llm_call, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Calls made while count_llm_calls is active, e.g. for one event
+_call_counter = ContextVar("llm_call_counter", default=None)
+
+
+class LLMError(Exception):
+    """Raised when the LLM API returns an error that retries didn't fix"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_duration(value):
+    """
+    Parse OpenAI's rate-limit reset durations such as "1s", "6m0s" or "20ms"
+
+    Args:
+        value (str): The header value
+
+    Returns:
+        float: The duration in seconds, or None if it can't be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers, status_code):
+    """
+    How long the server asked us to wait before retrying, if it said
+
+    Args:
+        headers: The failed response's (case-insensitive) headers
+        status_code (int): The failed response's status code
+
+    Returns:
+        float: Seconds to wait, or None if the response has no hint
+    """
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        seconds = parse_duration(retry_after)
+        if seconds is not None:
+            return seconds
+        try:
+            when = parsedate_to_datetime(retry_after)
+            return max(0.0, when.timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    if status_code == 429:
+        resets = [
+            parse_duration(headers.get(header))
+            for header in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            return max(resets)
+    return None
+
+
+class LLMClientBase:
+    """
+    Configuration, retry policy and call counters shared by the LLM clients
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        connect_timeout=None,
+        read_timeout=None,
+        max_retries=None,
+        backoff_base=None,
+        backoff_max=None,
+        pool_size=None,
+    ):
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.base_url = (
+            base_url or os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        ).rstrip("/")
+        self.timeout = (
+            connect_timeout or float(os.environ.get("LLM_CONNECT_TIMEOUT", "5")),
+            read_timeout or float(os.environ.get("LLM_READ_TIMEOUT", "60")),
+        )
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.environ.get("LLM_MAX_RETRIES", "3"))
+        )
+        self.backoff_base = backoff_base or float(
+            os.environ.get("LLM_BACKOFF_BASE", "0.5")
+        )
+        self.backoff_max = backoff_max or float(os.environ.get("LLM_BACKOFF_MAX", "20"))
+        self.pool_size = pool_size or int(os.environ.get("LLM_POOL_SIZE", "10"))
+
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _headers(self):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+    def _record(self, path, latency, retries, failed, first_token=None):
+        counter = _call_counter.get()
+        if counter is not None:
+            counter[0] += 1
+        record_llm_call(path, latency, retries, failed)
+        with self._lock:
+            stats = self._stats.setdefault(
+                path,
+                {
+                    "calls": 0,
+                    "retries": 0,
+                    "failures": 0,
+                    "total_latency_seconds": 0.0,
+                    "max_latency_seconds": 0.0,
+                },
+            )
+            stats["calls"] += 1
+            stats["retries"] += retries
+            stats["failures"] += 1 if failed else 0
+            stats["total_latency_seconds"] += latency
+            stats["max_latency_seconds"] = max(stats["max_latency_seconds"], latency)
+            if first_token is not None:
+                stats["first_token_samples"] = stats.get("first_token_samples", 0) + 1
+                stats["total_first_token_seconds"] = (
+                    stats.get("total_first_token_seconds", 0.0) + first_token
+                )
+                stats["max_first_token_seconds"] = max(
+                    stats.get("max_first_token_seconds", 0.0), first_token
+                )
+
+    def _admit(self, payload):
+        """
+        Wait for admission control to let a chat completion through
+
+        Returns:
+            Ticket: For ``_settle``, or None when admission control is off
+
+        Raises:
+            LLMError: With status 429 if the call was shed
+        """
+        controller = get_admission_controller()
+        if not controller.enabled:
+            return None
+        try:
+            return controller.admit(current_scope(), estimate_tokens(payload))
+        except AdmissionRejected as e:
+            raise LLMError(str(e), 429)
+
+    async def _admit_async(self, payload):
+        """Like _admit, for the event loop"""
+        controller = get_admission_controller()
+        if not controller.enabled:
+            return None
+        try:
+            return await controller.admit_async(
+                current_scope(), estimate_tokens(payload)
+            )
+        except AdmissionRejected as e:
+            raise LLMError(str(e), 429)
+
+    def _settle(self, ticket, response):
+        # Replace the admission estimate with the tokens the call really used
+        usage = response.get("usage") or {}
+        if ticket is not None and "total_tokens" in usage:
+            get_admission_controller().settle(ticket, usage["total_tokens"])
+
+    def _backoff(self, attempt, headers=None, status_code=None):
+        hint = (
+            retry_after_seconds(headers, status_code) if headers is not None else None
+        )
+        if hint is not None:
+            return min(hint, self.backoff_max)
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _log_retry(self, path, status_code, delay, attempt):
+        logger.warning(
+            f"{path} failed ({status_code or 'connection error'}), "
+            f"retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})"
+        )
+
+    def stats(self):
+        """
+        Snapshot of per-endpoint call, retry and latency counters
+
+        Returns:
+            dict: API path -> counters
+        """
+        with self._lock:
+            snapshot = {path: dict(stats) for path, stats in self._stats.items()}
+        for stats in snapshot.values():
+            stats["avg_latency_seconds"] = (
+                stats["total_latency_seconds"] / stats["calls"]
+                if stats["calls"]
+                else 0.0
+            )
+            if stats.get("first_token_samples"):
+                stats["avg_first_token_seconds"] = (
+                    stats["total_first_token_seconds"] / stats["first_token_samples"]
+                )
+        return snapshot
+
+
+class LLMClient(LLMClientBase):
+    """
+    Pooled HTTP client for the OpenAI API with retries and call counters
+
+    One Session is shared by every caller so TLS connections are kept alive
+    and reused instead of opened per request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _request(self, path, payload, start, stream=False):
+        """
+        Send a request, retrying transient failures until one succeeds
+
+        Returns:
+            tuple: (response, number of retries)
+        """
+        url = f"{self.base_url}{path}"
+        headers = self._headers()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self.session.post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    timeout=self.timeout,
+                    stream=stream,
+                )
+                if response.status_code == 200:
+                    return response, attempt
+                error = LLMError(
+                    f"Error from OpenAI API: {response.text}", response.status_code
+                )
+                retryable = response.status_code in RETRYABLE_STATUS_CODES
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = LLMError(f"Error connecting to OpenAI API: {str(e)}")
+                retryable = True
+
+            if not retryable or attempt >= self.max_retries:
+                self._record(path, time.monotonic() - start, attempt, True)
+                raise error
+
+            if response is not None:
+                delay = self._backoff(attempt, response.headers, response.status_code)
+            else:
+                delay = self._backoff(attempt)
+            self._log_retry(path, error.status_code, delay, attempt)
+            time.sleep(delay)
+            attempt += 1
+
+    def post(self, path, payload):
+        """
+        POST a JSON payload, retrying transient failures
+
+        Args:
+            path (str): The API path, e.g. "/chat/completions"
+            payload (dict): The request body
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            LLMError: If the request still fails after all retries
+        """
+        start = time.monotonic()
+        response, retries = self._request(path, payload, start)
+        self._record(path, time.monotonic() - start, retries, False)
+        data = response.json()
+        record_llm_usage(path, data)
+        return data
+
+    def chat_completion(self, payload):
+        """
+        Call the Chat Completions API
+
+        Args:
+            payload (dict): The request body (model, messages, ...)
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            LLMError: If the request fails after all retries, or admission
+                control sheds it
+        """
+        ticket = self._admit(payload)
+        response = self.post("/chat/completions", payload)
+        self._settle(ticket, response)
+        return response
+
+    def stream_chat_completion(self, payload):
+        """
+        Call the Chat Completions API with streaming and yield text as it arrives
+
+        Retries only happen before the first byte; an error mid-stream is
+        raised to the caller. Time to first token is recorded in the stats.
+
+        Args:
+            payload (dict): The request body (model, messages, ...)
+
+        Yields:
+            str: Content deltas in order
+
+        Raises:
+            LLMError: If the request fails after all retries, or admission
+                control sheds it
+        """
+        # Streamed responses carry no usage, so the admission estimate stands
+        self._admit(payload)
+        path = "/chat/completions"
+        start = time.monotonic()
+        response, retries = self._request(
+            path, dict(payload, stream=True), start, stream=True
+        )
+
+        first_token = None
+        failed = True
+        try:
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    if first_token is None:
+                        first_token = time.monotonic() - start
+                    yield delta
+            failed = False
+        finally:
+            response.close()
+            self._record(
+                f"{path} (stream)",
+                time.monotonic() - start,
+                retries,
+                failed,
+                first_token,
+            )
+
+    def embeddings(self, payload):
+        """
+        Call the Embeddings API
+
+        Args:
+            payload (dict): The request body (model, input)
+
+        Returns:
+            dict: The decoded JSON response
+        """
+        return self.post("/embeddings", payload)
+
+
+@contextmanager
+def count_llm_calls():
+    """
+    Count the LLM calls made inside the block
+
+    Tasks and worker threads started from the block are counted too if they
+    run in a copy of its context (asyncio tasks always do).
+
+    Yields:
+        list: One item, the running count
+    """
+    counter = [0]
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Get the process-wide LLM client, creating it on first use
+
+    Returns:
+        LLMClient: The shared client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
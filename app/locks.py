@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+from sqlalchemy import text
+from app import db
+
+# Postgres advisory lock keys, one per background job that only one worker
+# process at a time should run
+USER_SYNC_LOCK_ID = 0x5AC0_0015
+EMBEDDING_WORKER_LOCK_ID = 0x5AC0_0017
+
+
+@contextmanager
+def advisory_lock(lock_id):
+    """
+    Hold a session-level Postgres advisory lock if no one else does
+
+    The lock lives on its own connection, so the body is free to commit
+    through db.session as often as it likes.
+
+    Args:
+        lock_id (int): The lock key
+
+    Yields:
+        bool: True if the lock was taken, False if another session holds it
+    """
+    with db.engine.connect() as conn:
+        locked = conn.execute(
+            text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id}
+        ).scalar()
+        try:
+            yield locked
+        finally:
+            if locked:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+                conn.commit()
@@ -0,0 +1,306 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, wait
+from datetime import datetime
+from sqlalchemy import func, select, text
+from app import db
+from app.dedup import insert_messages
+
+logger = logging.getLogger(__name__)
+
+# Every batched row carries all of these so they fit one multi-row INSERT
+COLUMNS = (
+    "id",
+    "channel",
+    "text",
+    "timestamp",
+    "created_at",
+    "client_msg_id",
+    "user_id",
+    "bot_id",
+    "is_bot",
+)
+
+PendingMessage = namedtuple(
+    "PendingMessage", ["id", "channel", "bot_id", "is_bot", "text"]
+)
+
+
+class MessageWriter:
+    """
+    Write-behind batcher for Message inserts
+
+    Messages are queued and written by a background thread in multi-row
+    INSERTs, one transaction per batch, once ``batch_size`` rows are waiting
+    or the oldest has waited ``flush_interval`` seconds. Each message takes
+    its ID from the table's sequence when it is queued, so callers and the
+    history buffers can refer to it before it is written.
+
+    With ``durable`` set, ``submit``'s future completes only after the batch
+    commits, so callers that wait on it get the same guarantees as a direct
+    insert while sharing one commit with the rest of the batch. Without it,
+    callers move on straight away, batches commit with synchronous_commit
+    off, and a crash loses whatever hadn't been flushed yet.
+    """
+
+    def __init__(self, flask_app, batch_size=200, flush_interval=0.05, durable=True):
+        self.flask_app = flask_app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durable = durable
+        self._queue = []
+        self._queued_at = None
+        self._pending = {}
+        self._closing = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "flush_seconds": 0.0,
+        }
+
+    def start(self):
+        """Start the flush thread if it isn't running"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            with self.flask_app.app_context():
+                self.engine = db.engine
+            self._closing = False
+            self._thread = threading.Thread(
+                target=self._run, name="message-writer", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def submit(self, values):
+        """
+        Queue a message for the next batch
+
+        Args:
+            values (dict): Column values for the Message row
+
+        Returns:
+            tuple: (the message ID, a Future that resolves to True once the row
+                is committed, or False if it duplicated an existing message)
+        """
+        self.start()
+        row = dict.fromkeys(COLUMNS)
+        row.update(values)
+        row["is_bot"] = bool(row["is_bot"])
+        row["created_at"] = row["created_at"] or datetime.utcnow()
+        row["id"] = self._next_id()
+        written = Future()
+
+        with self._cond:
+            self._queue.append((row, written))
+            if self._queued_at is None:
+                self._queued_at = time.monotonic()
+            self._pending[row["id"]] = PendingMessage(
+                row["id"], row["channel"], row["bot_id"], row["is_bot"], row["text"]
+            )
+            self._stats["submitted"] += 1
+            self._cond.notify()
+        return row["id"], written
+
+    def pending(self, channel, bot_id):
+        """
+        Messages for a (channel, bot) pair that are queued but not yet committed
+
+        Read this before querying the database: a row leaves the pending set
+        only after its batch commits, so it is always visible in one or the
+        other.
+
+        Returns:
+            list: PendingMessage items, newest first
+        """
+        with self._cond:
+            matches = [
+                message
+                for message in self._pending.values()
+                if message.channel == channel and message.bot_id == bot_id
+            ]
+        return sorted(matches, key=lambda message: message.id, reverse=True)
+
+    def flush(self, timeout=None):
+        """Write everything queued so far and wait for it to commit"""
+        with self._cond:
+            futures = [written for _, written in self._queue]
+            if self._queue:
+                self._queued_at = 0.0  # already past the deadline
+                self._cond.notify()
+        wait(futures, timeout=timeout)
+
+    def shutdown(self, timeout=30):
+        """Flush the queue and stop the flush thread"""
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._closing = True
+            self._cond.notify()
+        thread.join(timeout)
+        with self._cond:
+            self._thread = None
+            if self._queue:
+                logger.error(f"{len(self._queue)} messages not written at shutdown")
+
+    def stats(self):
+        """
+        Snapshot of the write-behind counters
+
+        Returns:
+            dict: Queue depth, row and batch counters and average batch size
+        """
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["queued"] = len(self._queue)
+            snapshot["durable"] = self.durable
+        batches = snapshot["batches"]
+        flush_seconds = snapshot.pop("flush_seconds")
+        snapshot["avg_batch"] = (
+            (snapshot["written"] + snapshot["duplicates"]) / batches if batches else 0.0
+        )
+        snapshot["avg_flush_seconds"] = flush_seconds / batches if batches else 0.0
+        return snapshot
+
+    def _next_id(self):
+        # nextval is outside any transaction, so it costs a round trip but no commit
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.nextval(func.pg_get_serial_sequence("message", "id")))
+            ).scalar()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # Wait for a full batch or for the oldest row's deadline
+                while len(self._queue) < self.batch_size and not self._closing:
+                    remaining = self._queued_at + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._queue[: self.batch_size]
+                del self._queue[: self.batch_size]
+                self._queued_at = time.monotonic() if self._queue else None
+            self._flush(batch)
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        try:
+            inserted = self._insert([row for row, _ in batch])
+        except Exception as e:
+            # One bad row (e.g. its bot was just deleted) fails the whole
+            # statement; retry row by row so only that one is lost
+            logger.warning(
+                f"Batch of {len(batch)} messages failed, retrying singly: {e}"
+            )
+            inserted = set()
+            for row, written in batch:
+                try:
+                    inserted |= self._insert([row])
+                except Exception as e:
+                    logger.error(f"Could not write message {row['id']}: {e}")
+                    written.set_exception(e)
+
+        with self._cond:
+            for row, _ in batch:
+                self._pending.pop(row["id"], None)
+            failed = sum(1 for _, written in batch if written.done())
+            self._stats["written"] += len(inserted)
+            self._stats["duplicates"] += len(batch) - len(inserted) - failed
+            self._stats["failed"] += failed
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["flush_seconds"] += time.monotonic() - start
+        for row, written in batch:
+            if not written.done():
+                written.set_result(row["id"] in inserted)
+
+    def _insert(self, rows):
+        with self.engine.begin() as conn:
+            if not self.durable:
+                conn.execute(text("SET LOCAL synchronous_commit = off"))
+            return set(conn.execute(insert_messages(rows)).scalars())
+
+
+def write_behind_enabled():
+    return os.environ.get("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer(flask_app=None):
+    """
+    Get the process-wide message writer, creating it on first use
+
+    Args:
+        flask_app: The Flask application; defaults to the current app
+
+    Returns:
+        MessageWriter: The shared writer
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                if flask_app is None:
+                    from flask import current_app
+
+                    flask_app = current_app._get_current_object()
+                _writer = MessageWriter(
+                    flask_app,
+                    batch_size=int(os.environ.get("MESSAGE_BATCH_SIZE", "200")),
+                    flush_interval=float(
+                        os.environ.get("MESSAGE_FLUSH_INTERVAL", "0.05")
+                    ),
+                    durable=os.environ.get("MESSAGE_WRITE_DURABLE", "true").lower()
+                    == "true",
+                )
+    return _writer
+
+
+def pending_messages(channel, bot_id):
+    """Unwritten messages for a (channel, bot) pair, newest first; see MessageWriter.pending"""
+    if _writer is None:
+        return []
+    return _writer.pending(channel, bot_id)
+
+
+def save_message(values):
+    """
+    Insert a Message row, through the write-behind batcher when it is enabled
+
+    Args:
+        values (dict): Column values for the Message row
+
+    Returns:
+        int: The message ID, or None if it duplicated a message already saved.
+            Without MESSAGE_WRITE_DURABLE the row may not be committed yet
+            and duplicates are only caught by the dedup cache.
+    """
+    if not write_behind_enabled():
+        message_id = db.session.execute(insert_messages([values])).scalar()
+        db.session.commit()
+        return message_id
+
+    writer = get_message_writer()
+    message_id, written = writer.submit(values)
+    if writer.durable and not written.result():
+        return None
+    return message_id
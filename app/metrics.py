@@ -0,0 +1,213 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Under gunicorn every worker writes its samples to files in
+# PROMETHEUS_MULTIPROC_DIR and a scrape of any worker merges them all (see
+# gunicorn.conf.py). Without it, metrics are this process's own.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+if MULTIPROCESS:
+    # Processes not started by gunicorn (e.g. flask job-worker) get no
+    # on_starting hook to create it
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Pipeline stages take milliseconds to seconds; LLM calls up to a minute
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "slackbot_stage_seconds",
+    "Time spent in each stage of processing a Slack event",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "slackbot_stage_errors_total",
+    "Exceptions raised by a stage, by exception class",
+    ["stage", "error"],
+)
+EVENTS = Counter(
+    "slackbot_events_total",
+    "Slack events by what happened to them",
+    ["outcome"],
+)
+LLM_SECONDS = Histogram(
+    "slackbot_llm_request_seconds",
+    "LLM API call latency including retries",
+    ["endpoint"],
+    buckets=LLM_BUCKETS,
+)
+LLM_REQUESTS = Counter(
+    "slackbot_llm_requests_total",
+    "LLM API calls by outcome",
+    ["endpoint", "outcome"],
+)
+LLM_RETRIES = Counter(
+    "slackbot_llm_retries_total",
+    "LLM API retries",
+    ["endpoint"],
+)
+LLM_TOKENS = Counter(
+    "slackbot_llm_tokens_total",
+    "Tokens reported by the LLM API",
+    ["endpoint", "kind"],
+)
+QUEUE_DEPTH = Gauge(
+    "slackbot_queue_depth",
+    "Work waiting in each in-process queue",
+    ["queue"],
+    multiprocess_mode="livesum",
+)
+WORKERS_BUSY = Gauge(
+    "slackbot_event_workers_busy",
+    "Event worker threads processing an event",
+    multiprocess_mode="livesum",
+)
+# With EVENT_PIPELINE=queue, events wait in the event_job table rather than
+# in a process. Every process reads the same counts, so take the max
+EVENT_JOBS = Gauge(
+    "slackbot_event_jobs",
+    "Jobs in the event_job table by status",
+    ["status"],
+    multiprocess_mode="livemax",
+)
+EVENT_JOB_AGE = Gauge(
+    "slackbot_event_job_oldest_queued_seconds",
+    "Age of the oldest queued event_job",
+    multiprocess_mode="livemax",
+)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage, counting the class of any exception it raises
+
+    Args:
+        name (str): The stage label, e.g. "route"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.labels(name, type(e).__name__).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def record_event(outcome):
+    """
+    Count a Slack event by outcome: processed, failed, duplicate, ignored,
+    coalesced (folded into another message's turn), rejected or dropped
+    (event queue full)
+    """
+    EVENTS.labels(outcome).inc()
+
+
+def record_llm_call(path, latency, retries, failed):
+    LLM_SECONDS.labels(path).observe(latency)
+    LLM_REQUESTS.labels(path, "failed" if failed else "ok").inc()
+    if retries:
+        LLM_RETRIES.labels(path).inc(retries)
+
+
+def record_llm_usage(path, response):
+    """Count the tokens a Chat Completions or Embeddings response reports"""
+    usage = response.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.labels(path, kind[: -len("_tokens")]).inc(usage[kind])
+
+
+def update_queue_gauges(app):
+    """Copy the active pipeline's queue depths into the gauges"""
+    from app.admission import get_admission_controller
+    from app.event_queue import get_event_pool
+    from app.message_writer import get_message_writer
+
+    pipeline = os.environ.get("EVENT_PIPELINE", "threaded")
+    if pipeline == "queue":
+        from app.job_queue import get_job_queue
+
+        with app.app_context():
+            jobs = get_job_queue().stats()
+        for status in ("queued", "running", "dead"):
+            EVENT_JOBS.labels(status).set(jobs[status])
+        EVENT_JOB_AGE.set(jobs["oldest_queued_seconds"])
+    elif pipeline == "async":
+        from app.async_pipeline import get_async_pipeline
+
+        QUEUE_DEPTH.labels("events").set(get_async_pipeline(app).stats()["in_flight"])
+    else:
+        pool = get_event_pool().stats()
+        QUEUE_DEPTH.labels("events").set(pool["queue_depth"])
+        WORKERS_BUSY.set(pool["busy_workers"])
+    QUEUE_DEPTH.labels("message_writer").set(get_message_writer(app).stats()["queued"])
+    QUEUE_DEPTH.labels("admission").set(get_admission_controller().stats()["waiting"])
+
+
+def start_gauge_updates(app):
+    """
+    Refresh the queue gauges every METRICS_GAUGE_INTERVAL seconds
+
+    A scrape is answered by whichever worker gets it, so each worker
+    publishes its own depths for the scrape to sum rather than reporting
+    them only when asked.
+
+    Returns:
+        threading.Thread: The updater thread, or None when disabled
+    """
+    interval = float(os.environ.get("METRICS_GAUGE_INTERVAL", "5"))
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            try:
+                update_queue_gauges(app)
+            except Exception as e:
+                logger.warning(f"Could not update queue gauges: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-gauges", daemon=True)
+    thread.start()
+    return thread
+
+
+def _registry():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """
+    The metrics in Prometheus text format
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port):
+    """Serve the metrics on their own port, for processes without the web app"""
+    start_http_server(port, registry=_registry())
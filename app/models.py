@@ -1,5 +1,6 @@
 from app import db
 from pgvector.sqlalchemy import Vector
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
 
@@ -21,6 +22,8 @@ class SlackBot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     bot_id = db.Column(db.String(50), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    # Maximum prompt size in tokens; NULL uses PROMPT_TOKEN_BUDGET
+    token_budget = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     messages = db.relationship(
         "Message", backref="bot", lazy=True, foreign_keys="Message.bot_id"
@@ -37,8 +40,10 @@ class Message(db.Model):
     text = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    # Vector field for future use with embeddings
+    # Filled in by the embedding worker (app/embeddings.py)
     embedding = db.Column(Vector(1536))
+    # MD5 of the text the embedding was made from; NULL means "embed me"
+    embedding_hash = db.Column(db.String(32), nullable=True)
 
     # Add client_msg_id field
     client_msg_id = db.Column(db.String(100), nullable=True)
@@ -50,6 +55,38 @@ class Message(db.Model):
     # Flag to quickly identify message source
     is_bot = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        # Slack redelivers events; these make a retried insert a no-op
+        db.Index(
+            "uq_message_client_msg_id",
+            "client_msg_id",
+            unique=True,
+            postgresql_where=db.text("client_msg_id IS NOT NULL"),
+        ),
+        db.Index(
+            "uq_message_channel_timestamp_user",
+            "channel",
+            "timestamp",
+            unique=True,
+            postgresql_where=db.text("is_bot = false"),
+        ),
+        # A bot's recent history in a channel (ORDER BY created_at DESC LIMIT n
+        # walks this index backwards, so no DESC is needed)
+        db.Index(
+            "ix_message_bot_channel_created_at", "bot_id", "channel", "created_at"
+        ),
+        # Admin message list, newest first
+        db.Index("ix_message_created_at", "created_at"),
+        # Foreign key lookups, e.g. a user's messages or deleting a user
+        db.Index("ix_message_user_id", "user_id"),
+        # Messages the embedding worker hasn't got to yet
+        db.Index(
+            "ix_message_embedding_pending",
+            "id",
+            postgresql_where=db.text("embedding_hash IS NULL"),
+        ),
+    )
+
     def __repr__(self):
         return f"<Message {self.id}: {self.text[:20]}...>"
 
@@ -62,11 +99,116 @@ class Document(db.Model):
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
-    # Vector field for embeddings
+    # Filled in by the embedding worker (app/embeddings.py)
     embedding = db.Column(Vector(1536))
+    # MD5 of the content that was embedded, and when; stale once updated_at
+    # is later than embedded_at and the content hash has changed
+    embedding_hash = db.Column(db.String(32), nullable=True)
+    embedded_at = db.Column(db.DateTime, nullable=True)
 
     # Link to bot owner
     bot_id = db.Column(db.Integer, db.ForeignKey("slack_bot.id"), nullable=False)
+    chunks = db.relationship(
+        "DocumentChunk",
+        backref="document",
+        lazy=True,
+        cascade="all, delete-orphan",
+        order_by="DocumentChunk.chunk_index",
+    )
 
     def __repr__(self):
         return f"<Document {self.title}>"
+
+
+class DocumentChunk(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(
+        db.Integer, db.ForeignKey("document.id", ondelete="CASCADE"), nullable=False
+    )
+    # Denormalized from the document so retrieval filters on one table
+    bot_id = db.Column(db.Integer, db.ForeignKey("slack_bot.id"), nullable=False)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    embedding = db.Column(Vector(1536))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_document_chunk_bot_id", "bot_id"),
+        # Approximate nearest-neighbour index for cosine-distance top-k queries
+        db.Index(
+            "ix_document_chunk_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+    def __repr__(self):
+        return f"<DocumentChunk {self.document_id}:{self.chunk_index}>"
+
+
+class EventJob(db.Model):
+    """A Slack event waiting for a job worker (app/job_queue.py)"""
+
+    __tablename__ = "event_job"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    # Slack's event_id; a redelivered event conflicts and isn't queued twice
+    event_id = db.Column(db.String(100), nullable=True, unique=True)
+    # Jobs for one channel are processed one at a time, in id order
+    channel = db.Column(db.String(100), nullable=True)
+    payload = db.Column(JSONB, nullable=False)
+    # queued -> running -> deleted when done, or dead after the last attempt
+    status = db.Column(db.String(10), nullable=False, server_default="queued")
+    attempts = db.Column(db.Integer, nullable=False, server_default="0")
+    # Not claimed before this, so failed jobs back off
+    available_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, server_default=db.func.now()
+    )
+    # A running job whose worker hasn't extended this is claimed again
+    locked_until = db.Column(db.DateTime(timezone=True), nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, server_default=db.func.now()
+    )
+
+    __table_args__ = (
+        # Claiming scans unfinished jobs in id order, and checks each for an
+        # earlier unfinished job in its channel
+        db.Index(
+            "ix_event_job_pending",
+            "id",
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+        db.Index(
+            "ix_event_job_pending_channel",
+            "channel",
+            "id",
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<EventJob {self.id} {self.status}>"
+
+
+class AdmissionBucket(db.Model):
+    """
+    Token buckets shared by every process (app/admission.py SharedBuckets)
+
+    Levels are stored as of ``updated_at`` and refilled when next read.
+    """
+
+    __tablename__ = "admission_bucket"
+
+    name = db.Column(db.String(50), primary_key=True)
+    requests = db.Column(db.Float, nullable=False)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, server_default=db.func.now()
+    )
+
+    def __repr__(self):
+        return f"<AdmissionBucket {self.name}>"
@@ -0,0 +1,95 @@
+import os
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_, tuple_
+
+
+def page_size(requested=None):
+    """
+    Rows per admin list page
+
+    Args:
+        requested (str, optional): The ``limit`` query parameter
+
+    Returns:
+        int: ADMIN_PAGE_SIZE, or the requested size capped at ADMIN_MAX_PAGE_SIZE
+    """
+    default = int(os.environ.get("ADMIN_PAGE_SIZE", "50"))
+    maximum = int(os.environ.get("ADMIN_MAX_PAGE_SIZE", "500"))
+    try:
+        size = int(requested) if requested else default
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past a row, from its (created_at, id)"""
+    created_at = row.created_at.isoformat() if row.created_at else ""
+    raw = f"{created_at}|{row.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Parse a cursor made by encode_cursor
+
+    Args:
+        cursor (str): The ``cursor`` query parameter
+
+    Returns:
+        tuple: (created_at, id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return (datetime.fromisoformat(created_at) if created_at else None, int(row_id))
+
+
+def keyset_page(query, model, cursor=None, limit=50):
+    """
+    Fetch one page of rows, newest first, without OFFSET
+
+    Rows are ordered by (created_at, id) descending and the cursor resumes
+    after the last row of the previous page, so every page costs the same
+    however deep it is. The extra ``created_at <=`` bound lets Postgres seek
+    with a plain index on created_at.
+
+    Args:
+        query: A query on ``model``, with any filters already applied
+        model: The mapped class, which must have ``created_at`` and ``id``
+        cursor (str, optional): The cursor returned for the previous page
+        limit (int): Rows per page
+
+    Returns:
+        tuple: (rows, cursor for the next page or None on the last page)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if created_at is None:
+            # Rows without a timestamp sort first (NULLS FIRST), then the rest
+            query = query.filter(
+                or_(
+                    and_(model.created_at.is_(None), model.id < row_id),
+                    model.created_at.isnot(None),
+                )
+            )
+        else:
+            query = query.filter(
+                model.created_at <= created_at,
+                tuple_(model.created_at, model.id) < (created_at, row_id),
+            )
+
+    rows = (
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,202 @@
+import os
+import math
+import logging
+from array import array
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Rough tokens-per-character ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Every chat message costs a few tokens of framing on top of its content
+TOKENS_PER_MESSAGE = 4
+
+# Joins retrieved chunks (and any unchunked document text) into one context.
+# The pieces are counted separately, so their cached counts are reused by
+# every query that retrieves them
+CONTEXT_SEPARATOR = "\n\n"
+
+
+def default_token_budget():
+    """Prompt token budget for bots without their own; 0 disables budgeting"""
+    return int(os.environ.get("PROMPT_TOKEN_BUDGET", "8000"))
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    The local tokenizer for a chat model, or None if it can't be loaded
+
+    tiktoken downloads its vocabulary on first use (set TIKTOKEN_CACHE_DIR to
+    ship it with the image); without it, counts fall back to an estimate.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logger.warning(f"No tokenizer for {model}, estimating token counts: {str(e)}")
+        return None
+
+
+def encode(text, model):
+    """
+    Tokenize text
+
+    Args:
+        text (str): The text to tokenize
+        model (str): The chat model whose tokenizer to use
+
+    Returns:
+        array: Token IDs, or None when only an estimate is available
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return None
+    return array("I", encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=int(os.environ.get("PROMPT_TOKEN_CACHE_SIZE", "1024")))
+def encode_document(text, model):
+    """Like encode, but cached, for chunks and documents that rarely change"""
+    return encode(text, model)
+
+
+def count_tokens(text, model, tokens=None):
+    if tokens is None:
+        tokens = encode(text, model)
+    if tokens is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokens)
+
+
+def truncate_tokens(text, model, limit, tokens=None):
+    """
+    Cut text down to at most ``limit`` tokens, keeping the beginning
+
+    Args:
+        text (str): The text to shorten
+        model (str): The chat model whose tokenizer to use
+        limit (int): The maximum number of tokens to keep
+        tokens (array, optional): The already-encoded text
+
+    Returns:
+        str: The shortened text
+    """
+    if limit <= 0:
+        return ""
+    if tokens is None:
+        tokens = encode(text, model)
+    if tokens is None:
+        return text[: limit * CHARS_PER_TOKEN]
+    if len(tokens) <= limit:
+        return text
+    return get_encoding(model).decode(tokens[:limit].tolist())
+
+
+def truncate_context(pieces, piece_tokens, piece_counts, separator, limit, model):
+    """
+    Keep whole context pieces while they fit in ``limit`` tokens, then as
+    much of the next one as is left
+
+    Args:
+        pieces (list): The context pieces, most relevant first
+        piece_tokens (list): Each piece's tokens, or None for estimates
+        piece_counts (list): Each piece's token count
+        separator (int): Tokens in the separator between pieces
+        limit (int): The maximum number of tokens to keep
+        model (str): The chat model whose tokenizer to use
+
+    Returns:
+        str: The pieces that fit, joined back together
+    """
+    kept = []
+    remaining = limit
+    for piece, tokens, count in zip(pieces, piece_tokens, piece_counts):
+        joint = separator if kept else 0
+        if joint + count <= remaining:
+            kept.append(piece)
+            remaining -= joint + count
+            continue
+        if remaining - joint > 0:
+            kept.append(truncate_tokens(piece, model, remaining - joint, tokens))
+        break
+    return CONTEXT_SEPARATOR.join(kept)
+
+
+def fit_prompt(text, context, history_lines, fixed_text, model, budget, messages=4):
+    """
+    Shrink the variable parts of a prompt to fit a token budget
+
+    The fixed instructions always go in. The rest is filled in priority
+    order: the query, then conversation history from newest to oldest, then
+    document context, which is truncated to whatever room is left. Context
+    is counted piece by piece (see CONTEXT_SEPARATOR), so the total can be
+    off by a token or so where pieces meet.
+
+    Args:
+        text (str): The user's query
+        context (str): The context from bot documents
+        history_lines (list): Formatted history lines, newest first
+        fixed_text (list): Instruction strings that are always sent
+        model (str): The chat model whose tokenizer to use
+        budget (int): The maximum prompt size in tokens; 0 or None disables
+        messages (int): How many chat messages the prompt is split into
+
+    Returns:
+        tuple: (text, context, history_lines kept newest first, usage dict
+            with the original and final token counts)
+    """
+    pieces = context.split(CONTEXT_SEPARATOR) if context else []
+    piece_tokens = [encode_document(piece, model) for piece in pieces]
+    piece_counts = [
+        count_tokens(piece, model, tokens)
+        for piece, tokens in zip(pieces, piece_tokens)
+    ]
+    separator = count_tokens(CONTEXT_SEPARATOR, model)
+    fixed = TOKENS_PER_MESSAGE * messages + sum(
+        count_tokens(part, model) for part in fixed_text
+    )
+    query = count_tokens(text, model)
+    history = [count_tokens(line, model) for line in history_lines]
+    context_count = sum(piece_counts) + separator * max(len(pieces) - 1, 0)
+    original = fixed + query + sum(history) + context_count
+    usage = {"original": original, "final": original, "saved": 0}
+    if not budget or original <= budget:
+        return text, context, history_lines, usage
+
+    remaining = max(budget - fixed, 0)
+    room_for_query = remaining
+    if query > remaining:
+        text = truncate_tokens(text, model, remaining)
+        remaining = 0
+    else:
+        remaining -= query
+
+    kept = []
+    for line, tokens in zip(history_lines, history):
+        if tokens > remaining:
+            break
+        kept.append(line)
+        remaining -= tokens
+
+    context = truncate_context(
+        pieces, piece_tokens, piece_counts, separator, remaining, model
+    )
+
+    final = (
+        fixed
+        + min(query, room_for_query)
+        + sum(history[: len(kept)])
+        + min(context_count, remaining)
+    )
+    usage.update(final=final, saved=original - final)
+    return text, context, kept, usage
+
+
+def log_usage(bot_name, budget, usage):
+    logger.info(
+        f"Prompt for {bot_name}: {usage['final']} tokens "
+        f"(budget {budget or 'none'}, saved {usage['saved']})"
+    )
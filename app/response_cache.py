@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from app.vector_router import dot, normalize
+
+
+class SemanticResponseCache:
+    """
+    In-memory cache of bot answers keyed by channel and query embedding
+
+    A lookup matches the most similar previous query asked in the same
+    channel, so a hit skips both the router and the completion without ever
+    repeating an answer, which may quote a private channel, somewhere else.
+    Entries expire after ``ttl`` seconds and are dropped when their bot's
+    documents change. The least recently used entry is evicted once a
+    channel holds ``max_per_channel`` entries or the cache ``max_entries``;
+    the per-channel cap bounds the similarity scan, which runs outside the
+    lock.
+    """
+
+    def __init__(self, max_entries=500, ttl=3600, threshold=0.95, max_per_channel=50):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_per_channel = max_per_channel
+        # channel -> {key: entry}, and key -> channel across all channels,
+        # both in least recently used order
+        self._channels = {}
+        self._order = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def lookup(self, channel_id, query_embedding):
+        """
+        Find a cached answer for a sufficiently similar query in a channel
+
+        Args:
+            channel_id (str): The Slack channel the query was asked in
+            query_embedding (list): The embedding of the user's query
+
+        Returns:
+            tuple: (bot_id, bot_name, answer, similarity), or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = self._channels.get(channel_id, {})
+            for key, entry in list(entries.items()):
+                if now - entry["created_at"] > self.ttl:
+                    self._remove(key)
+                    self._stats["expirations"] += 1
+            candidates = list(entries.items())
+
+        query = normalize(query_embedding) if candidates else None
+        best_key, best_score = None, self.threshold
+        if query is not None:
+            for key, entry in candidates:
+                score = dot(query, entry["embedding"])
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+        with self._lock:
+            # The entry may have been evicted while it was being scored
+            if best_key is None or best_key not in self._order:
+                self._stats["misses"] += 1
+                return None
+            self._channels[channel_id].move_to_end(best_key)
+            self._order.move_to_end(best_key)
+            self._stats["hits"] += 1
+            entry = self._channels[channel_id][best_key]
+            return entry["bot_id"], entry["bot_name"], entry["answer"], best_score
+
+    def store(self, channel_id, bot_id, bot_name, query_embedding, answer):
+        """
+        Remember a bot's answer to a query asked in a channel
+
+        Args:
+            channel_id (str): The Slack channel the query was asked in
+            bot_id (int): The database ID of the bot that answered
+            bot_name (str): The name of the bot
+            query_embedding (list): The embedding of the user's query
+            answer (str): The bot's response
+        """
+        vector = normalize(query_embedding)
+        if vector is None:
+            return
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            entries = self._channels.setdefault(channel_id, OrderedDict())
+            entries[key] = {
+                "bot_id": bot_id,
+                "bot_name": bot_name,
+                "embedding": vector,
+                "answer": answer,
+                "created_at": time.monotonic(),
+            }
+            self._order[key] = channel_id
+            self._stats["stores"] += 1
+            while len(entries) > self.max_per_channel:
+                self._remove(next(iter(entries)))
+                self._stats["evictions"] += 1
+            while len(self._order) > self.max_entries:
+                self._remove(next(iter(self._order)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        # Callers hold the lock
+        channel_id = self._order.pop(key)
+        entries = self._channels[channel_id]
+        del entries[key]
+        if not entries:
+            del self._channels[channel_id]
+
+    def invalidate_bot(self, bot_id):
+        """
+        Drop every cached answer from a bot, e.g. after its documents change
+
+        Args:
+            bot_id (int): The database ID of the bot
+        """
+        if bot_id is None:
+            return
+        bot_id = int(bot_id)
+        with self._lock:
+            stale = [
+                key
+                for entries in self._channels.values()
+                for key, entry in entries.items()
+                if entry["bot_id"] == bot_id
+            ]
+            for key in stale:
+                self._remove(key)
+            self._stats["invalidations"] += len(stale)
+
+    def stats(self):
+        """
+        Snapshot of the cache counters
+
+        Returns:
+            dict: Hit/miss/eviction counters, size and hit rate
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._order)
+            snapshot["channels"] = len(self._channels)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+
+def response_cache_enabled():
+    return os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Get the process-wide response cache, creating it on first use
+
+    Returns:
+        SemanticResponseCache: The shared cache
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = SemanticResponseCache(
+                    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "500")),
+                    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+                    threshold=float(os.environ.get("RESPONSE_CACHE_THRESHOLD", "0.95")),
+                    max_per_channel=int(
+                        os.environ.get("RESPONSE_CACHE_CHANNEL_SIZE", "50")
+                    ),
+                )
+    return _response_cache
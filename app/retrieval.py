@@ -0,0 +1,193 @@
+import os
+import logging
+import click
+from flask.cli import with_appcontext
+from app import db
+from app.models import Document, DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_size():
+    return int(os.environ.get("CHUNK_SIZE", "1000"))
+
+
+def chunk_overlap():
+    return int(os.environ.get("CHUNK_OVERLAP", "200"))
+
+
+def top_k():
+    return int(os.environ.get("RETRIEVAL_TOP_K", "5"))
+
+
+def chunk_text(text, size=None, overlap=None):
+    """
+    Split text into overlapping chunks, preferring to break on whitespace
+
+    Args:
+        text (str): The document text
+        size (int, optional): Maximum characters per chunk
+        overlap (int, optional): Characters shared between neighbouring chunks
+
+    Returns:
+        list: The chunk strings
+    """
+    size = size or chunk_size()
+    overlap = chunk_overlap() if overlap is None else overlap
+    text = text.strip()
+    if not text:
+        return []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Back up to the last whitespace so words aren't split
+            split = text.rfind(" ", start + size // 2, end)
+            if split != -1:
+                end = split
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        # Start the next chunk on a word boundary too
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 and overlap else next_start
+    return chunks
+
+
+def index_document(document, db, logger):
+    """
+    Replace a document's chunks with freshly split and embedded ones
+
+    Args:
+        document (Document): The saved document
+        db: The database session
+        logger: The logger instance
+    """
+    from app.gpt_utils import get_embeddings
+
+    DocumentChunk.query.filter_by(document_id=document.id).delete()
+
+    pieces = chunk_text(document.content)
+    embeddings = get_embeddings(pieces) if pieces else []
+    for index, (piece, embedding) in enumerate(zip(pieces, embeddings)):
+        db.session.add(
+            DocumentChunk(
+                document_id=document.id,
+                bot_id=document.bot_id,
+                chunk_index=index,
+                content=piece,
+                embedding=embedding,
+            )
+        )
+    db.session.commit()
+    logger.info(f"Indexed document {document.id} into {len(pieces)} chunks")
+
+
+def retrieve_chunks(bot_id, query_embedding, k=None):
+    """
+    Find a bot's chunks closest to the query by cosine distance
+
+    Args:
+        bot_id (int): The database ID of the bot
+        query_embedding (list): The embedding of the user's query
+        k (int, optional): How many chunks to return
+
+    Returns:
+        list: The nearest DocumentChunk rows, closest first
+    """
+    return (
+        DocumentChunk.query.filter(
+            DocumentChunk.bot_id == bot_id, DocumentChunk.embedding.isnot(None)
+        )
+        .order_by(DocumentChunk.embedding.cosine_distance(list(query_embedding)))
+        .limit(k or top_k())
+        .all()
+    )
+
+
+def has_chunks(bot_id):
+    """Whether any of a bot's documents have been chunked"""
+    chunk = (
+        DocumentChunk.query.with_entities(DocumentChunk.id)
+        .filter_by(bot_id=bot_id)
+        .first()
+    )
+    return chunk is not None
+
+
+def chunked_document_ids(bot_id=None):
+    """
+    IDs of the documents that have chunks
+
+    Args:
+        bot_id (int, optional): Only look at this bot's documents
+
+    Returns:
+        set: The document IDs
+    """
+    query = db.session.query(DocumentChunk.document_id).distinct()
+    if bot_id is not None:
+        query = query.filter(DocumentChunk.bot_id == bot_id)
+    return {row.document_id for row in query}
+
+
+def unchunked_text(documents, chunked_ids):
+    """The text of the documents that have no chunks, joined as in the full context"""
+    return " ".join(
+        doc.content
+        for doc in documents
+        if doc.id not in chunked_ids and doc.content.strip()
+    )
+
+
+def unchunked_documents(bot_id=None):
+    """
+    Query for documents that have no chunks yet
+
+    Args:
+        bot_id (int, optional): Only look at this bot's documents
+
+    Returns:
+        Query: Matching documents, oldest first
+    """
+    query = Document.query.filter(
+        ~DocumentChunk.query.filter(DocumentChunk.document_id == Document.id).exists()
+    )
+    if bot_id is not None:
+        query = query.filter(Document.bot_id == bot_id)
+    return query.order_by(Document.id)
+
+
+@click.command("chunk-backfill")
+@click.option("--bot-id", type=int, help="Only chunk this bot's documents")
+@click.option("--limit", type=int, help="Stop after this many documents")
+@with_appcontext
+def chunk_backfill_command(bot_id, limit):
+    """Split and embed documents that have no chunks yet"""
+    indexed = failed = 0
+    skip = set()
+    while limit is None or indexed + failed < limit:
+        query = unchunked_documents(bot_id)
+        if skip:
+            query = query.filter(Document.id.notin_(skip))
+        document = query.first()
+        if document is None:
+            break
+        if not document.content.strip():
+            # Nothing to chunk; it contributes no text either way
+            skip.add(document.id)
+            continue
+        try:
+            index_document(document, db, logger)
+            indexed += 1
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"document {document.id}: {str(e)}", err=True)
+            skip.add(document.id)
+            failed += 1
+    click.echo(f"indexed {indexed} documents, {failed} failed")
@@ -1,5 +1,6 @@
 from flask import (
     Blueprint,
+    abort,
     jsonify,
     request,
     render_template,
@@ -13,18 +14,38 @@ from app import db, slack_client
 from flask import current_app
 from app.models import User, SlackBot, Message, Document
 import os
+from datetime import datetime, timedelta
+from sqlalchemy.orm import defer, joinedload, load_only
 from app.gpt_utils import (
     ask_gpt,
+    build_query_context,
     process_bot_responses,
-    get_or_create_user,
-    check_duplicate_message,
 )
 
 from slack_sdk.signature import SignatureVerifier
 import logging
 import json
 import re
-from threading import Thread
+from app.admission import admission_scope, get_admission_controller
+from app.bot_cache import bot_cache_stats, refresh_bot
+from app.coalesce import coalesce_window, conversation_key, get_coalescer
+from app.dashboard import get_dashboard_summary
+from app.dedup import event_keys, get_dedup_cache, select_conflicting_message
+from app.embeddings import embedding_stats
+from app.event_capture import capture_enabled, get_event_recorder
+from app.event_queue import get_event_pool
+from app.fan_out import fan_out_stats
+from app.history import get_conversation_history
+from app.job_queue import get_job_queue, queue_enabled
+from app.llm_client import count_llm_calls, get_llm_client
+from app.metrics import record_event, render_metrics, stage
+from app.message_writer import get_message_writer, save_message
+from app.pagination import keyset_page, page_size
+from app.response_cache import get_response_cache
+from app.retrieval import index_document
+from app.speculation import speculation_stats
+from app.user_directory import get_user_cache, resolve_user_id
+from app.vector_router import confidence_histogram, router_stats
 
 main_bp = Blueprint("main", __name__)
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
@@ -50,6 +71,48 @@ def health():
     return jsonify({"status": "healthy"}), 200
 
 
+@main_bp.route("/metrics")
+def metrics():
+    # Prometheus scrape target; see app/metrics.py
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@main_bp.route("/stats")
+def stats():
+    if os.environ.get("EVENT_PIPELINE", "threaded") == "async":
+        from app.async_pipeline import get_async_pipeline
+
+        pipeline_stats = get_async_pipeline(current_app).stats()
+    elif queue_enabled():
+        pipeline_stats = get_job_queue().stats()
+    else:
+        pipeline_stats = get_event_pool().stats()
+
+    return (
+        jsonify(
+            {
+                "event_queue": pipeline_stats,
+                "admission": get_admission_controller().stats(),
+                "router": router_stats(),
+                "bot_cache": bot_cache_stats(),
+                "capture": get_event_recorder().stats(),
+                "coalescing": get_coalescer().stats(),
+                "dedup": get_dedup_cache().stats(),
+                "embeddings": embedding_stats(),
+                "fan_out": fan_out_stats(),
+                "history": get_conversation_history().stats(),
+                "llm": get_llm_client().stats(),
+                "message_writer": get_message_writer().stats(),
+                "response_cache": get_response_cache().stats(),
+                "speculation": speculation_stats(),
+                "users": get_user_cache().stats(),
+            }
+        ),
+        200,
+    )
+
+
 @main_bp.route("/send-message", methods=["POST"])
 def send_message():
     data = request.get_json()
@@ -88,37 +151,73 @@ def slack_events():
         logger.info("Received challenge request from Slack")
         return jsonify({"challenge": data["challenge"]})
 
+    # Optionally keep the payload for offline replay (benchmarks/replay_capture.py)
+    if capture_enabled():
+        get_event_recorder().record(data, request.headers.get("X-Slack-Retry-Num"))
+
+    # Slack redelivers events it thinks timed out; acknowledge ones this
+    # process has already accepted without touching the database
+    keys = event_keys(data)
+    with stage("dedup"):
+        duplicate = get_dedup_cache().check_and_add(keys)
+    if duplicate:
+        record_event("duplicate")
+        logger.info(
+            f"Duplicate event {data.get('event_id')} "
+            f"(retry {request.headers.get('X-Slack-Retry-Num', 0)}), acknowledging"
+        )
+        return "", 200
+
     # Get the current app instance to pass to the thread
     from flask import current_app
 
     app = current_app._get_current_object()  # Get the actual app object, not the proxy
 
-    # Start a background thread to process the event
+    # Hand the event to the bounded worker pool
     # This allows us to return a 200 response immediately
     def process_event_async(event_data, flask_app):
         try:
             # Process the event with the app context
-            with flask_app.app_context():
+            with flask_app.app_context(), stage("event"):
                 process_slack_event(event_data)
         except Exception as e:
+            record_event("failed")
             logger.error(f"Error processing event: {str(e)}", exc_info=True)
 
-    # Start the background processing with the app instance
-    Thread(target=process_event_async, args=(data, app)).start()
+    # Queue the background processing with the app instance
+    if os.environ.get("EVENT_PIPELINE", "threaded") == "async":
+        from app.async_pipeline import get_async_pipeline
+
+        accepted = get_async_pipeline(app).submit(data)
+    elif queue_enabled():
+        # Stored in Postgres for a job worker (flask job-worker), so the
+        # event survives this process; fails only if the database does
+        accepted = get_job_queue().enqueue(data)
+    else:
+        accepted = get_event_pool().submit(process_event_async, data, app)
+
+    if not accepted:
+        # Queue is full (or, for the job queue, the database is down): either
+        # ask Slack to retry later or ack and drop
+        if os.environ.get("EVENT_QUEUE_FULL_POLICY", "reject") == "drop":
+            record_event("dropped")
+            logger.warning("Event queue full, dropping event")
+            return "", 200
+        record_event("rejected")
+        logger.warning("Event queue full, returning 503")
+        # Let Slack's retry of this event through
+        get_dedup_cache().discard(keys)
+        return "", 503
 
     # Return 200 OK immediately
     return "", 200
 
 
 # Extract the event processing logic into a separate function
-def process_slack_event(event_data):
+def process_slack_event(event_data, redelivered=False, raise_errors=False):
     # Import current_app instead of app
     from flask import current_app
-    from app.gpt_utils import (
-        process_bot_responses,
-        get_or_create_user,
-        check_duplicate_message,
-    )
+    from app.gpt_utils import process_bot_responses
 
     # Use current_app context for database operations
     with current_app.app_context():
@@ -146,35 +245,72 @@ def process_slack_event(event_data):
                 ts = event.get("ts")
                 client_msg_id = event.get("client_msg_id")
 
-                # Check for duplicate messages
-                if check_duplicate_message(channel_id, ts, client_msg_id, logger):
-                    return
-
                 logger.info(
                     f"Received message from user {user_id} in channel {channel_id}: {text}"
                 )
 
                 # Get or create user
-                user = get_or_create_user(user_id, slack_client, db, logger)
+                with stage("user_lookup"):
+                    user_pk = resolve_user_id(user_id, slack_client)
 
                 # Create and save the message with client_msg_id
-                message = Message(
+                values = dict(
                     channel=channel_id,
                     text=text,
                     timestamp=ts,
-                    user_id=user.id,
+                    user_id=user_pk,
                     is_bot=False,
                     client_msg_id=client_msg_id,  # Store the client_msg_id
                 )
-                db.session.add(message)
-                db.session.commit()
+                # A redelivered message conflicts on the unique indexes, so the
+                # duplicate check and the insert are one statement
+                with stage("save_message"):
+                    message_id = save_message(values)
+                if message_id is None and redelivered:
+                    # A job queue retry whose earlier attempt saved the message
+                    # before failing: answer it rather than skip it
+                    message_id = db.session.execute(
+                        select_conflicting_message(values)
+                    ).scalar()
+                if message_id is None:
+                    get_dedup_cache().record_db_conflict()
+                    record_event("duplicate")
+                    logger.info(
+                        f"Duplicate message {client_msg_id or ts}, skipping processing"
+                    )
+                    return
+                message = Message(id=message_id, **values)
                 logger.info(f"Message saved with ID: {message.id}")
 
+                burst = None
+                if coalesce_window() > 0:
+                    # Messages typed in quick succession are answered as one turn
+                    burst = get_coalescer().collect(conversation_key(event), text)
+                    if burst is None:
+                        record_event("coalesced")
+                        logger.info(
+                            f"Message {message.id} joined an open burst, not routing it"
+                        )
+                        return
+                    text = burst.text
+
                 # Use the utility function to process bot responses
-                process_bot_responses(
-                    text, channel_id, message, db, slack_client, logger
-                )
+                scope = admission_scope(channel_id, user_id, event.get("type"))
+                with scope, count_llm_calls() as llm_calls:
+                    process_bot_responses(
+                        text,
+                        channel_id,
+                        message,
+                        db,
+                        slack_client,
+                        logger,
+                        raise_errors=raise_errors,
+                    )
+                if burst is not None:
+                    get_coalescer().record_turn(burst, llm_calls[0])
+                record_event("processed")
             else:
+                record_event("ignored")
                 logger.info(
                     "Ignoring event: not a user message/app_mention or sent by a bot"
                 )
@@ -187,24 +323,70 @@ def process_slack_event(event_data):
 # Dashboard
 @admin_bp.route("/")
 def dashboard():
-    users = User.query.all()
-    bots = SlackBot.query.all()
-    messages = Message.query.order_by(Message.created_at.desc()).limit(10).all()
-    documents = Document.query.order_by(Document.created_at.desc()).limit(10).all()
+    # Aggregates are cached for DASHBOARD_CACHE_TTL; the router histogram is
+    # this process's in-memory counters
     return render_template(
         "admin/dashboard.html",
-        users=users,
-        bots=bots,
-        messages=messages,
-        documents=documents,
+        summary=get_dashboard_summary(),
+        confidence=confidence_histogram(),
     )
 
 
+# Admin list helpers
+def list_page(query, model):
+    """
+    Fetch the page of an admin list selected by the request's cursor and limit
+
+    Args:
+        query: The filtered query to paginate
+        model: The mapped class being listed
+
+    Returns:
+        tuple: (rows, URL of the next page or None, URL of the first page or None)
+    """
+    cursor = request.args.get("cursor")
+    try:
+        rows, next_cursor = keyset_page(
+            query, model, cursor, page_size(request.args.get("limit"))
+        )
+    except ValueError:
+        abort(400, "Invalid cursor")
+
+    args = {key: value for key, value in request.args.items() if key != "cursor"}
+    next_url = (
+        url_for(request.endpoint, cursor=next_cursor, **args) if next_cursor else None
+    )
+    first_url = url_for(request.endpoint, **args) if cursor else None
+    return rows, next_url, first_url
+
+
+def int_arg(name):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, f"{name} must be a number")
+
+
+def date_arg(name):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        abort(400, f"{name} must be a date (YYYY-MM-DD)")
+
+
 # Users CRUD
 @admin_bp.route("/users")
 def list_users():
-    users = User.query.all()
-    return render_template("admin/users/list.html", users=users)
+    users, next_url, first_url = list_page(User.query, User)
+    return render_template(
+        "admin/users/list.html", users=users, next_url=next_url, first_url=first_url
+    )
 
 
 @admin_bp.route("/users/<int:id>", methods=["GET", "POST"])
@@ -221,16 +403,37 @@ def edit_user(id):
 @admin_bp.route("/users/<int:id>/delete", methods=["POST"])
 def delete_user(id):
     user = User.query.get_or_404(id)
+    slack_user_id = user.slack_user_id
     db.session.delete(user)
     db.session.commit()
+    get_user_cache().forget(slack_user_id)
     return redirect(url_for("admin.list_users"))
 
 
 # SlackBots CRUD
+def parse_token_budget(value):
+    # Empty means "use the default budget"
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        abort(400, "token_budget must be a whole number")
+
+
+def bot_changed(bot_id):
+    # Rebuild the bot's cached context and drop answers based on the old one
+    refresh_bot(bot_id)
+    get_response_cache().invalidate_bot(bot_id)
+
+
 @admin_bp.route("/bots")
 def list_bots():
-    bots = SlackBot.query.all()
-    return render_template("admin/bots/list.html", bots=bots)
+    bots, next_url, first_url = list_page(SlackBot.query, SlackBot)
+    return render_template(
+        "admin/bots/list.html", bots=bots, next_url=next_url, first_url=first_url
+    )
 
 
 @admin_bp.route("/bots/<int:id>", methods=["GET", "POST"])
@@ -238,7 +441,9 @@ def edit_bot(id):
     bot = SlackBot.query.get_or_404(id)
     if request.method == "POST":
         bot.name = request.form["name"]
+        bot.token_budget = parse_token_budget(request.form.get("token_budget"))
         db.session.commit()
+        bot_changed(bot.id)
         return redirect(url_for("admin.list_bots"))
     return render_template("admin/bots/edit.html", bot=bot)
 
@@ -248,15 +453,22 @@ def delete_bot(id):
     bot = SlackBot.query.get_or_404(id)
     db.session.delete(bot)
     db.session.commit()
+    bot_changed(id)
+    get_conversation_history().invalidate(bot_id=id)
     return redirect(url_for("admin.list_bots"))
 
 
 @admin_bp.route("/bots/new", methods=["GET", "POST"])
 def new_bot():
     if request.method == "POST":
-        bot = SlackBot(bot_id=request.form["bot_id"], name=request.form["name"])
+        bot = SlackBot(
+            bot_id=request.form["bot_id"],
+            name=request.form["name"],
+            token_budget=parse_token_budget(request.form.get("token_budget")),
+        )
         db.session.add(bot)
         db.session.commit()
+        bot_changed(bot.id)
         return redirect(url_for("admin.list_bots"))
     return render_template("admin/bots/new.html")
 
@@ -264,17 +476,59 @@ def new_bot():
 # Messages CRUD
 @admin_bp.route("/messages")
 def list_messages():
-    messages = Message.query.order_by(Message.created_at.desc()).all()
-    return render_template("admin/messages/list.html", messages=messages)
+    # The sender's name is shown per row; the embedding never is
+    query = Message.query.options(
+        defer(Message.embedding),
+        joinedload(Message.user).load_only(User.username),
+        joinedload(Message.bot).load_only(SlackBot.name),
+    )
+
+    channel = request.args.get("channel", "").strip()
+    if channel:
+        query = query.filter(Message.channel == channel)
+    bot_id = int_arg("bot_id")
+    if bot_id is not None:
+        query = query.filter(Message.bot_id == bot_id)
+    user_id = int_arg("user_id")
+    if user_id is not None:
+        query = query.filter(Message.user_id == user_id)
+    since = date_arg("since")
+    if since is not None:
+        query = query.filter(Message.created_at >= since)
+    until = date_arg("until")
+    if until is not None:
+        # Inclusive of the whole "until" day
+        query = query.filter(Message.created_at < until + timedelta(days=1))
+
+    messages, next_url, first_url = list_page(query, Message)
+    bots = (
+        SlackBot.query.options(load_only(SlackBot.id, SlackBot.name))
+        .order_by(SlackBot.name)
+        .all()
+    )
+    return render_template(
+        "admin/messages/list.html",
+        messages=messages,
+        bots=bots,
+        next_url=next_url,
+        first_url=first_url,
+    )
 
 
 @admin_bp.route("/messages/<int:id>", methods=["GET", "POST"])
 def edit_message(id):
     message = Message.query.get_or_404(id)
     if request.method == "POST":
+        old_channel = message.channel
+        if message.text != request.form["text"]:
+            # Queue it for the embedding worker
+            message.embedding_hash = None
         message.text = request.form["text"]
         message.channel = request.form["channel"]
         db.session.commit()
+        # The message may be buffered as history in either channel
+        get_conversation_history().invalidate(old_channel, message.bot_id)
+        get_conversation_history().invalidate(message.channel, message.bot_id)
         return redirect(url_for("admin.list_messages"))
     return render_template("admin/messages/edit.html", message=message)
 
@@ -282,16 +536,48 @@ def edit_message(id):
 @admin_bp.route("/messages/<int:id>/delete", methods=["POST"])
 def delete_message(id):
     message = Message.query.get_or_404(id)
+    channel, bot_id = message.channel, message.bot_id
     db.session.delete(message)
     db.session.commit()
+    get_conversation_history().invalidate(channel, bot_id)
     return redirect(url_for("admin.list_messages"))
 
 
 # Documents CRUD
+def reindex_document(document):
+    # Chunking needs the embeddings API; a failure shouldn't lose the edit
+    try:
+        index_document(document, db, logger)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error indexing document {document.id}: {str(e)}")
+
+
 @admin_bp.route("/documents")
 def list_documents():
-    documents = Document.query.order_by(Document.created_at.desc()).all()
-    return render_template("admin/documents/list.html", documents=documents)
+    # Only titles are listed, so leave the large columns in the database
+    query = Document.query.options(
+        defer(Document.content),
+        defer(Document.embedding),
+        joinedload(Document.bot).load_only(SlackBot.name),
+    )
+    bot_id = int_arg("bot_id")
+    if bot_id is not None:
+        query = query.filter(Document.bot_id == bot_id)
+
+    documents, next_url, first_url = list_page(query, Document)
+    bots = (
+        SlackBot.query.options(load_only(SlackBot.id, SlackBot.name))
+        .order_by(SlackBot.name)
+        .all()
+    )
+    return render_template(
+        "admin/documents/list.html",
+        documents=documents,
+        bots=bots,
+        next_url=next_url,
+        first_url=first_url,
+    )
 
 
 @admin_bp.route("/documents/new", methods=["GET", "POST"])
@@ -309,6 +595,8 @@ def new_document():
         )
         db.session.add(document)
         db.session.commit()
+        reindex_document(document)
+        bot_changed(document.bot_id)
         return redirect(url_for("admin.list_documents"))
 
     bots = SlackBot.query.all()
@@ -324,10 +612,15 @@ def edit_document(id):
         if len(title) > 200:
             title = title[:197] + "..."
 
+        previous_bot_id = document.bot_id
         document.title = title
         document.content = request.form["content"]
         document.bot_id = request.form["bot_id"]
         db.session.commit()
+        reindex_document(document)
+        bot_changed(document.bot_id)
+        if int(document.bot_id) != previous_bot_id:
+            bot_changed(previous_bot_id)
         return redirect(url_for("admin.list_documents"))
 
     bots = SlackBot.query.all()
@@ -337,8 +630,10 @@ def edit_document(id):
 @admin_bp.route("/documents/<int:id>/delete", methods=["POST"])
 def delete_document(id):
     document = Document.query.get_or_404(id)
+    bot_id = document.bot_id
     db.session.delete(document)
     db.session.commit()
+    bot_changed(bot_id)
     return redirect(url_for("admin.list_documents"))
 
 
@@ -353,7 +648,13 @@ def ask_openai(id):
 
     # Call OpenAI API using our new function
     try:
-        openai_response = ask_gpt(context, bot.name)
+        query = request.form.get("query")
+        if query:
+            # Only send the chunks relevant to the query
+            context = build_query_context(query, bot.id, context, logger)
+            openai_response = ask_gpt(query, context, bot.name)
+        else:
+            openai_response = ask_gpt(context, bot.name)
 
         # Send the result to Slack
         slack_client.chat_postMessage(
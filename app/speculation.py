@@ -0,0 +1,99 @@
+import os
+import threading
+from collections import OrderedDict
+from app.vector_router import score_bots
+
+# Speculation counters, exposed on /stats
+_stats_lock = threading.Lock()
+_stats = {
+    "attempts": 0,
+    "hits": 0,
+    "misses": 0,
+    "failed": 0,
+    "no_guess": 0,
+    "saved_seconds": 0.0,
+}
+
+# The bot that last answered in each channel, least recently answered first
+_last_bots = OrderedDict()
+_last_bots_lock = threading.Lock()
+
+
+def speculation_enabled():
+    return os.environ.get("SPECULATIVE_ANSWERS", "false").lower() == "true"
+
+
+def remember_answer(channel_id, bot_id):
+    """Note which bot last answered in a channel, for the next guess"""
+    max_channels = int(os.environ.get("SPECULATION_MAX_CHANNELS", "10000"))
+    with _last_bots_lock:
+        _last_bots[channel_id] = bot_id
+        _last_bots.move_to_end(channel_id)
+        while len(_last_bots) > max_channels:
+            _last_bots.popitem(last=False)
+
+
+def last_bot(channel_id):
+    with _last_bots_lock:
+        return _last_bots.get(channel_id)
+
+
+def guess_bot(channel_id, all_bots, query_embedding=None):
+    """
+    The bot most likely to be routed to, to start answering before the router decides
+
+    The best embedding score wins when the query embedding is at hand (it
+    only falls through to here when the margin was too small to route on);
+    otherwise the bot that last answered in the channel, since conversations
+    tend to stay with one bot.
+
+    Args:
+        channel_id (str): The Slack channel ID
+        all_bots (list): All CachedBot entries
+        query_embedding (list, optional): The embedding of the user's message
+
+    Returns:
+        int: The guessed bot's ID, or None when there's nothing to go on
+    """
+    if query_embedding is not None:
+        profiles = {bot.id: bot.profile for bot in all_bots if bot.profile is not None}
+        scores = score_bots(query_embedding, profiles)
+        if scores:
+            return scores[0][0]
+
+    bot_id = last_bot(channel_id)
+    if any(bot.id == bot_id for bot in all_bots):
+        return bot_id
+    return None
+
+
+def record_speculation(outcome, saved_seconds=0.0):
+    """
+    Count one speculative answer
+
+    Args:
+        outcome (str): "hits", "misses", "failed" or "no_guess"
+        saved_seconds (float): How much sooner a kept answer was ready than
+            if it had been started after routing
+    """
+    with _stats_lock:
+        if outcome != "no_guess":
+            _stats["attempts"] += 1
+        _stats[outcome] += 1
+        _stats["saved_seconds"] += saved_seconds
+
+
+def speculation_stats():
+    """
+    Snapshot of the speculation counters
+
+    Returns:
+        dict: Attempt/hit/miss counters, hit rate and average latency saved
+            per kept answer
+    """
+    with _stats_lock:
+        snapshot = dict(_stats)
+    attempts, hits = snapshot["attempts"], snapshot["hits"]
+    snapshot["hit_rate"] = hits / attempts if attempts else 0.0
+    snapshot["avg_saved_seconds"] = snapshot["saved_seconds"] / hits if hits else 0.0
+    return snapshot
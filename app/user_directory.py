@@ -0,0 +1,377 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import click
+from flask.cli import with_appcontext
+from slack_sdk.errors import SlackApiError
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import db, slack_client
+from app.locks import USER_SYNC_LOCK_ID, advisory_lock
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Bounded LRU map from Slack user ID to User.id with a TTL
+
+    A Slack user's row never changes ID, so a hit skips the database
+    entirely. Entries expire after ``ttl`` seconds so a user deleted in the
+    admin by another worker process is looked up again eventually.
+    Concurrent misses for the same user share one lookup (see ``load_once``),
+    so a burst of first messages from a new user makes one Slack call.
+    """
+
+    def __init__(self, max_entries=50000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "slack_lookups": 0,
+            "synced": 0,
+        }
+
+    def get(self, slack_user_id):
+        """
+        Look up a user's database ID
+
+        Args:
+            slack_user_id (str): The Slack user ID
+
+        Returns:
+            int: The User.id, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(slack_user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(slack_user_id)
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, slack_user_id, user_id):
+        with self._lock:
+            self._put(slack_user_id, user_id)
+
+    def put_many(self, pairs):
+        """Remember (slack_user_id, user_id) pairs, e.g. after a directory sync"""
+        with self._lock:
+            for slack_user_id, user_id in pairs:
+                self._put(slack_user_id, user_id)
+                self._stats["synced"] += 1
+
+    def forget(self, slack_user_id):
+        """Drop a user, e.g. after it is deleted in the admin"""
+        with self._lock:
+            self._entries.pop(slack_user_id, None)
+
+    def load_once(self, slack_user_id, loader):
+        """
+        Run ``loader`` for a missing user, sharing it with concurrent callers
+
+        The first caller for a Slack user ID runs the loader; callers that
+        arrive while it is running wait for its result (or its exception)
+        instead of starting their own lookup.
+
+        Args:
+            slack_user_id (str): The Slack user ID
+            loader (callable): Returns the User.id; runs in the first caller's thread
+
+        Returns:
+            int: The User.id
+        """
+        with self._lock:
+            call = self._in_flight.get(slack_user_id)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._in_flight[slack_user_id] = call
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = loader()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(slack_user_id, None)
+            call["done"].set()
+
+    def record_coalesced(self):
+        with self._lock:
+            self._stats["coalesced"] += 1
+
+    def record_slack_lookup(self):
+        with self._lock:
+            self._stats["slack_lookups"] += 1
+
+    def stats(self):
+        """
+        Snapshot of the user cache counters
+
+        Returns:
+            dict: Hit/miss/lookup counters, cached user count and hit rate
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+    def _put(self, slack_user_id, user_id):
+        self._entries[slack_user_id] = (user_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(slack_user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """
+    Get the process-wide user cache, creating it on first use
+
+    Returns:
+        UserCache: The shared cache
+    """
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = UserCache(
+                    max_entries=int(os.environ.get("USER_CACHE_SIZE", "50000")),
+                    ttl=float(os.environ.get("USER_CACHE_TTL", "3600")),
+                )
+    return _user_cache
+
+
+def upsert_users(rows):
+    """
+    Build a bulk insert-or-update of User rows keyed on slack_user_id
+
+    Args:
+        rows (list): Dicts with slack_user_id, username and email
+
+    Returns:
+        Insert: An INSERT ... ON CONFLICT DO UPDATE RETURNING id, slack_user_id
+    """
+    table = User.__table__
+    statement = pg_insert(table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.slack_user_id],
+        set_={
+            "username": statement.excluded.username,
+            "email": statement.excluded.email,
+        },
+    ).returning(table.c.id, table.c.slack_user_id)
+
+
+def profile_row(slack_user_id, member):
+    """User column values from a Slack user object (users.info or users.list)"""
+    return {
+        "slack_user_id": slack_user_id,
+        "username": member["name"],
+        "email": (member.get("profile") or {}).get("email"),
+    }
+
+
+def placeholder_row(slack_user_id):
+    """User column values for a user Slack couldn't tell us about"""
+    return {
+        "slack_user_id": slack_user_id,
+        "username": f"user_{slack_user_id}",
+        "email": None,
+    }
+
+
+def fetch_profile(slack_user_id, slack_client):
+    """
+    Fetch one user's profile from Slack
+
+    Args:
+        slack_user_id (str): The Slack user ID
+        slack_client: The Slack client
+
+    Returns:
+        dict: User column values; a placeholder name if Slack can't say
+    """
+    get_user_cache().record_slack_lookup()
+    try:
+        user_info = slack_client.users_info(user=slack_user_id)
+        return profile_row(slack_user_id, user_info["user"])
+    except SlackApiError as e:
+        logger.error(f"Error fetching user info: {e}")
+        return placeholder_row(slack_user_id)
+
+
+def resolve_user_id(slack_user_id, slack_client):
+    """
+    The database ID for a Slack user, creating the user on first contact
+
+    Served from the process-wide cache when possible. On a miss the user is
+    read from the database, and only users the database doesn't know yet
+    cost a Slack call. The new row is committed before returning so other
+    threads can reference it straight away.
+
+    Args:
+        slack_user_id (str): The Slack user ID
+        slack_client: The Slack client
+
+    Returns:
+        int: The User.id
+    """
+    cache = get_user_cache()
+    user_id = cache.get(slack_user_id)
+    if user_id is not None:
+        return user_id
+
+    def load():
+        user_id = db.session.execute(
+            select(User.id).where(User.slack_user_id == slack_user_id)
+        ).scalar()
+        if user_id is None:
+            logger.info(f"User {slack_user_id} not found in database, creating it")
+            # Another worker process may have inserted it meanwhile
+            row = db.session.execute(
+                upsert_users([fetch_profile(slack_user_id, slack_client)])
+            ).first()
+            db.session.commit()
+            user_id = row.id
+        cache.put(slack_user_id, user_id)
+        return user_id
+
+    return cache.load_once(slack_user_id, load)
+
+
+def sync_workspace_users(slack_client, page_size=None):
+    """
+    Bulk-load the Slack workspace directory into the user table
+
+    Pages through users.list and upserts each page in one statement, then
+    primes the cache, so users are known before they first write. Deleted
+    accounts and bot users are skipped. Rate-limited pages are retried after
+    the Retry-After delay Slack asks for.
+
+    Args:
+        slack_client: The Slack client
+        page_size (int, optional): Users per page; defaults to USER_SYNC_PAGE_SIZE
+
+    Returns:
+        int: The number of users upserted
+    """
+    page_size = page_size or int(os.environ.get("USER_SYNC_PAGE_SIZE", "200"))
+    cache = get_user_cache()
+    cursor = None
+    synced = 0
+    while True:
+        try:
+            response = slack_client.users_list(cursor=cursor, limit=page_size)
+        except SlackApiError as e:
+            if e.response.status_code != 429:
+                raise
+            delay = float(e.response.headers.get("Retry-After", "1"))
+            logger.info(f"users.list rate limited, retrying in {delay}s")
+            time.sleep(delay)
+            continue
+
+        # Keyed by ID: one statement can't update the same row twice
+        rows = {
+            member["id"]: profile_row(member["id"], member)
+            for member in response.get("members", [])
+            if not member.get("deleted")
+            and not member.get("is_bot")
+            and member["id"] != "USLACKBOT"
+        }
+        if rows:
+            result = db.session.execute(upsert_users(list(rows.values()))).all()
+            db.session.commit()
+            cache.put_many((row.slack_user_id, row.id) for row in result)
+            synced += len(result)
+
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            return synced
+
+
+def sync_workspace_users_once(slack_client):
+    """
+    Run sync_workspace_users unless another process already is
+
+    Returns:
+        int: The number of users upserted, or None if the sync was skipped
+    """
+    with advisory_lock(USER_SYNC_LOCK_ID) as locked:
+        if not locked:
+            return None
+        return sync_workspace_users(slack_client)
+
+
+def user_sync_interval():
+    """Seconds between background directory syncs; 0 disables them"""
+    return float(os.environ.get("USER_SYNC_INTERVAL", "0"))
+
+
+def start_user_sync(app):
+    """
+    Sync the Slack directory now and then every USER_SYNC_INTERVAL seconds
+
+    Runs in a daemon thread. Each worker process starts one, but the
+    advisory lock lets only one of them sync at a time.
+
+    Returns:
+        threading.Thread: The sync thread, or None when syncing is disabled
+    """
+    interval = user_sync_interval()
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    start = time.monotonic()
+                    synced = sync_workspace_users_once(slack_client)
+                    if synced is not None:
+                        logger.info(
+                            f"Synced {synced} Slack users in "
+                            f"{time.monotonic() - start:.1f}s"
+                        )
+            except Exception as e:
+                logger.error(f"Slack user sync failed: {str(e)}", exc_info=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="user-sync", daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command("sync-users")
+@with_appcontext
+def sync_users_command():
+    """Load the Slack workspace directory into the user table"""
+    start = time.monotonic()
+    synced = sync_workspace_users(slack_client)
+    click.echo(f"Synced {synced} users in {time.monotonic() - start:.1f}s")
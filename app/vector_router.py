@@ -0,0 +1,159 @@
+import os
+import math
+import operator
+import threading
+
+# Routing counters, exposed on /stats
+_stats_lock = threading.Lock()
+_stats = {
+    "vector_routed": 0,
+    "llm_fallback_ambiguous": 0,
+    "llm_fallback_no_profiles": 0,
+    "llm_fallback_error": 0,
+}
+
+
+# Histogram of the confidence of each routing decision, in tenths
+CONFIDENCE_BUCKETS = 10
+_confidence = [0] * CONFIDENCE_BUCKETS
+
+
+def record_route(outcome):
+    """Increment one of the routing counters"""
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def record_confidence(confidence):
+    """
+    Count a routing decision in the confidence histogram
+
+    Args:
+        confidence: The router's confidence (0-1); the LLM router may send
+            anything, so unparseable values are ignored
+    """
+    try:
+        value = min(max(float(confidence), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return
+    bucket = min(int(value * CONFIDENCE_BUCKETS), CONFIDENCE_BUCKETS - 1)
+    with _stats_lock:
+        _confidence[bucket] += 1
+
+
+def confidence_histogram():
+    """
+    Snapshot of the confidence histogram
+
+    Returns:
+        list: One dict per bucket with its range and count, lowest first
+    """
+    with _stats_lock:
+        counts = list(_confidence)
+    return [
+        {
+            "range": f"{i / CONFIDENCE_BUCKETS:.1f}-{(i + 1) / CONFIDENCE_BUCKETS:.1f}",
+            "count": count,
+        }
+        for i, count in enumerate(counts)
+    ]
+
+
+def router_stats():
+    """
+    Snapshot of the routing counters
+
+    Returns:
+        dict: Counters plus the share of messages that needed the LLM router
+    """
+    with _stats_lock:
+        snapshot = dict(_stats)
+    total = sum(snapshot.values())
+    fallbacks = total - snapshot["vector_routed"]
+    snapshot["total"] = total
+    snapshot["fallback_rate"] = fallbacks / total if total else 0.0
+    snapshot["confidence"] = confidence_histogram()
+    return snapshot
+
+
+def margin_threshold():
+    """The minimum top-2 score gap for a vector routing decision to stand"""
+    return float(os.environ.get("VECTOR_ROUTER_MARGIN", "0.05"))
+
+
+def dot(a, b):
+    """Dot product of two equal-length vectors"""
+    return sum(map(operator.mul, a, b))
+
+
+def normalize(vector):
+    """Scale a vector to unit length so dot products are cosine similarities"""
+    norm = math.sqrt(dot(vector, vector))
+    if norm == 0:
+        return None
+    return [x / norm for x in vector]
+
+
+def build_bot_profile(documents):
+    """
+    Build a bot's profile vector from its document embeddings
+
+    Args:
+        documents (list): The bot's Document rows
+
+    Returns:
+        list: The normalized mean embedding, or None if no document is embedded
+    """
+    embeddings = [doc.embedding for doc in documents if doc.embedding is not None]
+    if not embeddings:
+        return None
+
+    total = [0.0] * len(embeddings[0])
+    for embedding in embeddings:
+        for i, value in enumerate(embedding):
+            total[i] += value
+    return normalize(total)
+
+
+def score_bots(query_embedding, profiles):
+    """
+    Rank bots by cosine similarity between the query and each profile
+
+    Args:
+        query_embedding (list): The embedding of the user's message
+        profiles (dict): Bot ID -> normalized profile vector
+
+    Returns:
+        list: (bot_id, score) tuples, best first
+    """
+    query = normalize(query_embedding)
+    if query is None:
+        return []
+    scores = [(bot_id, dot(query, profile)) for bot_id, profile in profiles.items()]
+    return sorted(scores, key=lambda item: item[1], reverse=True)
+
+
+def pick_bot(query_embedding, profiles, threshold=None):
+    """
+    Choose a bot from embedding scores if the decision is unambiguous
+
+    Args:
+        query_embedding (list): The embedding of the user's message
+        profiles (dict): Bot ID -> normalized profile vector
+        threshold (float, optional): Minimum gap between the top two scores
+
+    Returns:
+        tuple: (bot_id, score, margin), with bot_id None when ambiguous
+    """
+    if threshold is None:
+        threshold = margin_threshold()
+
+    scores = score_bots(query_embedding, profiles)
+    if not scores:
+        return None, 0.0, 0.0
+
+    best_id, best_score = scores[0]
+    margin = best_score - scores[1][1] if len(scores) > 1 else best_score
+    if margin < threshold:
+        return None, best_score, margin
+    return best_id, best_score, margin
@@ -0,0 +1,181 @@
+"""
+Compare top-k chunk retrieval with concatenating every document.
+
+Builds a synthetic corpus where each query has one planted "fact" sentence in
+one document, then reports for each strategy:
+
+- recall: share of queries whose context contains the fact
+- context size: characters (and ~tokens) sent to the model per query
+- retrieval latency: p50/p95 time to build the context
+
+Embeddings are deterministic hashed bag-of-words vectors so the benchmark
+needs no API key. Pass --database-url to also run the top-k search through
+pgvector with the HNSW index on a scratch table.
+
+Usage:
+    python benchmarks/retrieval_benchmark.py --documents 200 --queries 100
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.retrieval import chunk_text  # noqa: E402
+
+DIMENSIONS = 1536
+FILLER = (
+    "policy team process office schedule request approval budget review "
+    "meeting project report customer support quarterly planning system "
+    "access training benefits travel expense hardware software onboarding"
+).split()
+
+
+def embed(text):
+    vector = [0.0] * DIMENSIONS
+    for word in text.lower().split():
+        digest = hashlib.md5(word.strip(".,?").encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % DIMENSIONS
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def build_corpus(documents, words_per_document, queries, rng):
+    corpus = [
+        " ".join(rng.choice(FILLER) for _ in range(words_per_document))
+        for _ in range(documents)
+    ]
+    facts = []
+    for i in range(queries):
+        key = f"codeword{i}"
+        fact = f"The {key} for the {rng.choice(FILLER)} is zeta{i}."
+        doc = rng.randrange(documents)
+        words = corpus[doc].split()
+        at = rng.randrange(len(words))
+        corpus[doc] = " ".join(words[:at] + [fact] + words[at:])
+        facts.append((f"What is the {key}?", f"zeta{i}"))
+    return corpus, facts
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(name, recalls, sizes, latencies):
+    print(
+        f"{name:<14} recall={sum(recalls) / len(recalls):.3f} "
+        f"context_chars={statistics.mean(sizes):,.0f} "
+        f"(~{statistics.mean(sizes) / 4:,.0f} tokens) "
+        f"p50={percentile(latencies, 50) * 1000:.2f}ms "
+        f"p95={percentile(latencies, 95) * 1000:.2f}ms"
+    )
+
+
+def run_concatenation(corpus, facts):
+    recalls, sizes, latencies = [], [], []
+    for _, answer in facts:
+        start = time.perf_counter()
+        context = " ".join(corpus)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(answer in context)
+        sizes.append(len(context))
+    report("concatenation", recalls, sizes, latencies)
+
+
+def run_exact_top_k(chunks, facts, k):
+    vectors = [embed(chunk) for chunk in chunks]
+    recalls, sizes, latencies = [], [], []
+    for query, answer in facts:
+        start = time.perf_counter()
+        q = embed(query)
+        scored = sorted(
+            range(len(chunks)),
+            key=lambda i: -sum(a * b for a, b in zip(q, vectors[i])),
+        )[:k]
+        context = "\n\n".join(chunks[i] for i in scored)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(answer in context)
+        sizes.append(len(context))
+    report(f"exact top-{k}", recalls, sizes, latencies)
+
+
+def run_pgvector_top_k(chunks, facts, k, database_url):
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    cur.execute("DROP TABLE IF EXISTS bench_chunk")
+    cur.execute(
+        f"CREATE TABLE bench_chunk (id serial PRIMARY KEY, content text, "
+        f"embedding vector({DIMENSIONS}))"
+    )
+    for chunk in chunks:
+        cur.execute(
+            "INSERT INTO bench_chunk (content, embedding) VALUES (%s, %s)",
+            (chunk, str(embed(chunk))),
+        )
+    cur.execute(
+        "CREATE INDEX ON bench_chunk USING hnsw (embedding vector_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64)"
+    )
+    cur.execute("ANALYZE bench_chunk")
+
+    recalls, sizes, latencies = [], [], []
+    for query, answer in facts:
+        start = time.perf_counter()
+        cur.execute(
+            "SELECT content FROM bench_chunk ORDER BY embedding <=> %s LIMIT %s",
+            (str(embed(query)), k),
+        )
+        context = "\n\n".join(row[0] for row in cur.fetchall())
+        latencies.append(time.perf_counter() - start)
+        recalls.append(answer in context)
+        sizes.append(len(context))
+    report(f"pgvector top-{k}", recalls, sizes, latencies)
+
+    cur.execute("DROP TABLE bench_chunk")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--words", type=int, default=800)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--database-url")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus, facts = build_corpus(args.documents, args.words, args.queries, rng)
+    chunks = [
+        chunk
+        for document in corpus
+        for chunk in chunk_text(document, args.chunk_size, args.chunk_overlap)
+    ]
+    print(
+        f"{args.documents} documents, {len(chunks)} chunks, "
+        f"{sum(len(d) for d in corpus):,} characters, {len(facts)} queries"
+    )
+
+    run_concatenation(corpus, facts)
+    run_exact_top_k(chunks, facts, args.top_k)
+    if args.database_url:
+        run_pgvector_top_k(chunks, facts, args.top_k, args.database_url)
+
+
+if __name__ == "__main__":
+    main()
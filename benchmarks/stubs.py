@@ -0,0 +1,218 @@
+"""
+Local stand-ins for the OpenAI and Slack Web APIs used by the benchmarks.
+
+Both servers answer just enough of their API for the event pipeline to run,
+after an artificial latency, and fail a configurable share of requests with
+a 500 (OpenAI) or an ``ok: false`` body (Slack). Point the app at them with
+OPENAI_BASE_URL and SLACK_API_URL.
+
+``start_stubs_process`` runs both in a child process, so their threads,
+sockets and memory don't show up in the measurements of the process under
+test.
+"""
+
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+DIMENSIONS = 1536
+
+
+def fake_embedding(text):
+    """Deterministic hashed bag-of-words vector, so similar text scores high"""
+    vector = [0.0] * DIMENSIONS
+    for word in text.lower().split():
+        digest = hashlib.md5(word.encode()).digest()
+        vector[int.from_bytes(digest[:4], "little") % DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler, latency, error_rate, port=0):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        body = json.loads(self._read_body() or b"{}")
+        time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self._send_json(500, {"error": {"message": "stub failure"}})
+            return
+
+        if self.path.endswith("/embeddings"):
+            inputs = body.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json(
+                200,
+                {
+                    "data": [
+                        {"index": i, "embedding": fake_embedding(text)}
+                        for i, text in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": 8, "total_tokens": 8},
+                },
+            )
+            return
+
+        if body.get("response_format"):
+            # Router call: pick the first bot listed in the prompt
+            prompt = body["messages"][0]["content"]
+            bot_id = int(prompt.split("- Bot ", 1)[1].split(" ", 1)[0])
+            content = json.dumps(
+                {"bot_id": bot_id, "bot_name": "stub", "confidence": 1}
+            )
+        else:
+            content = f"Stub answer to: {body['messages'][-1]['content']}"
+        self._send_json(
+            200,
+            {
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {
+                    "prompt_tokens": 200,
+                    "completion_tokens": 40,
+                    "total_tokens": 240,
+                },
+            },
+        )
+
+
+class _SlackHandler(_Handler):
+    def _handle(self):
+        path, _, query = self.path.partition("?")
+        method = path.rstrip("/").rsplit("/", 1)[-1]
+        raw = self._read_body().decode()
+        params = parse_qs(query)
+        if raw and not raw.startswith("{"):
+            params.update(parse_qs(raw))
+        time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self._send_json(200, {"ok": False, "error": "stub_failure"})
+            return
+
+        if method == "users.info":
+            user = (params.get("user") or ["U000"])[0]
+            self._send_json(
+                200,
+                {"ok": True, "user": {"id": user, "name": user.lower(), "profile": {}}},
+            )
+        elif method == "users.list":
+            self._send_json(
+                200,
+                {"ok": True, "members": [], "response_metadata": {"next_cursor": ""}},
+            )
+        else:
+            self._send_json(200, {"ok": True, "ts": f"{time.time():.6f}"})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+def start_openai_stub(latency=0.5, error_rate=0.0, port=0):
+    """Start a Chat Completions/Embeddings stand-in in a background thread"""
+    return _StubServer(_OpenAIHandler, latency, error_rate, port).start()
+
+
+def start_slack_stub(latency=0.1, error_rate=0.0, port=0):
+    """Start a Slack Web API stand-in in a background thread"""
+    return _StubServer(_SlackHandler, latency, error_rate, port).start()
+
+
+def _serve_stubs(conn, llm_latency, slack_latency, llm_error_rate, slack_error_rate):
+    openai_stub = start_openai_stub(llm_latency, llm_error_rate)
+    slack_stub = start_slack_stub(slack_latency, slack_error_rate)
+    conn.send((openai_stub.url, slack_stub.url))
+    try:
+        conn.recv()
+    except EOFError:
+        return
+    conn.send(
+        {
+            "openai": {"requests": openai_stub.requests, "errors": openai_stub.errors},
+            "slack": {"requests": slack_stub.requests, "errors": slack_stub.errors},
+        }
+    )
+
+
+def start_stubs_process(
+    llm_latency=0.5, slack_latency=0.1, llm_error_rate=0.0, slack_error_rate=0.0
+):
+    """
+    Run the OpenAI and Slack stand-ins in a child process
+
+    Returns:
+        tuple: (OpenAI base URL, Slack base URL, stop) where ``stop()`` shuts
+            the process down and returns each stub's request and error counts
+    """
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve_stubs,
+        args=(child_conn, llm_latency, slack_latency, llm_error_rate, slack_error_rate),
+        daemon=True,
+    )
+    process.start()
+    openai_url, slack_url = conn.recv()
+
+    def stop():
+        conn.send(None)
+        counts = conn.recv()
+        process.terminate()
+        process.join(5)
+        return counts
+
+    return openai_url, slack_url, stop
@@ -0,0 +1,27 @@
+import os
+import shutil
+
+# The asyncio pipeline runs its own event loop on an OS thread, which gevent's
+# monkey-patching breaks, so it gets plain threaded workers
+_default_worker_class = (
+    "gthread" if os.environ.get("EVENT_PIPELINE", "threaded") == "async" else "gevent"
+)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS") or _default_worker_class
+if worker_class == "gthread":
+    threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+
+def on_starting(server):
+    # Samples left by a previous run would be merged into this one's metrics
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop a dead worker's live gauges; its counters and histograms are kept
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,47 @@
+"""embedding tracking
+
+Columns the embedding worker uses to find rows whose vectors are missing
+or out of date: an MD5 of the text that was embedded, and for documents
+when that happened (compared with updated_at). Messages that still need
+an embedding are found through a partial index, so the worker's scan
+stays cheap once the table has been backfilled.
+
+Revision ID: 2f8d6b1c4a97
+Revises: e5a04c7b9f12
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "2f8d6b1c4a97"
+down_revision = "e5a04c7b9f12"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "message", sa.Column("embedding_hash", sa.String(length=32), nullable=True)
+    )
+    op.add_column(
+        "document", sa.Column("embedding_hash", sa.String(length=32), nullable=True)
+    )
+    op.add_column("document", sa.Column("embedded_at", sa.DateTime(), nullable=True))
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_message_embedding_pending "
+            "ON message (id) WHERE embedding_hash IS NULL"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_message_embedding_pending")
+    op.drop_column("document", "embedded_at")
+    op.drop_column("document", "embedding_hash")
+    op.drop_column("message", "embedding_hash")
@@ -0,0 +1,149 @@
+"""initial schema
+
+Baseline for databases that were created with db.create_all() before the
+app used migrations: every table and index is only created if it is
+missing, and the client_msg_id column that init_db.py used to add by hand
+is added here instead.
+
+Revision ID: 4b2d8e61f0a3
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision = "4b2d8e61f0a3"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "user" not in tables:
+        op.create_table(
+            "user",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("slack_user_id", sa.String(length=50), nullable=False),
+            sa.Column("username", sa.String(length=100), nullable=False),
+            sa.Column("email", sa.String(length=120), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("slack_user_id"),
+        )
+
+    if "slack_bot" not in tables:
+        op.create_table(
+            "slack_bot",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("bot_id", sa.String(length=50), nullable=False),
+            sa.Column("name", sa.String(length=100), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("bot_id"),
+        )
+
+    if "message" not in tables:
+        op.create_table(
+            "message",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("channel", sa.String(length=100), nullable=False),
+            sa.Column("text", sa.Text(), nullable=False),
+            sa.Column("timestamp", sa.String(length=50), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("embedding", Vector(1536), nullable=True),
+            sa.Column("client_msg_id", sa.String(length=100), nullable=True),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("bot_id", sa.Integer(), nullable=True),
+            sa.Column("is_bot", sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(["bot_id"], ["slack_bot.id"]),
+            sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    else:
+        columns = [col["name"] for col in inspector.get_columns("message")]
+        if "client_msg_id" not in columns:
+            op.add_column(
+                "message",
+                sa.Column("client_msg_id", sa.String(length=100), nullable=True),
+            )
+
+    # Databases adopted from db.create_all() may already hold redelivered
+    # copies of a user message; keep the first of each so the indexes below
+    # can be built
+    op.execute(
+        "DELETE FROM message AS m USING message AS kept "
+        "WHERE m.client_msg_id = kept.client_msg_id AND m.id > kept.id"
+    )
+    op.execute(
+        "DELETE FROM message AS m USING message AS kept "
+        "WHERE m.is_bot = false AND kept.is_bot = false "
+        "AND m.channel = kept.channel AND m.timestamp = kept.timestamp "
+        "AND m.id > kept.id"
+    )
+
+    # Slack redelivers events; these make a retried insert a no-op
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_message_client_msg_id "
+        "ON message (client_msg_id) WHERE client_msg_id IS NOT NULL"
+    )
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_message_channel_timestamp_user "
+        "ON message (channel, timestamp) WHERE is_bot = false"
+    )
+
+    if "document" not in tables:
+        op.create_table(
+            "document",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("title", sa.String(length=200), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.Column("embedding", Vector(1536), nullable=True),
+            sa.Column("bot_id", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["bot_id"], ["slack_bot.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if "document_chunk" not in tables:
+        op.create_table(
+            "document_chunk",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("document_id", sa.Integer(), nullable=False),
+            sa.Column("bot_id", sa.Integer(), nullable=False),
+            sa.Column("chunk_index", sa.Integer(), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("embedding", Vector(1536), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(
+                ["document_id"], ["document.id"], ondelete="CASCADE"
+            ),
+            sa.ForeignKeyConstraint(["bot_id"], ["slack_bot.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_document_chunk_bot_id", "document_chunk", ["bot_id"])
+        op.create_index(
+            "ix_document_chunk_embedding_hnsw",
+            "document_chunk",
+            ["embedding"],
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        )
+
+
+def downgrade():
+    op.drop_table("document_chunk")
+    op.drop_table("document")
+    op.drop_table("message")
+    op.drop_table("slack_bot")
+    op.drop_table("user")
@@ -0,0 +1,72 @@
+"""event job queue
+
+A durable queue of Slack events for EVENT_PIPELINE=queue: web workers
+insert a row per event and job workers claim them with SELECT ... FOR
+UPDATE SKIP LOCKED (see app/job_queue.py). Partial indexes cover only
+unfinished jobs, so claiming stays cheap however many dead-lettered jobs
+are kept.
+
+Revision ID: 7a3e9d2c5b10
+Revises: 2f8d6b1c4a97
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "7a3e9d2c5b10"
+down_revision = "2f8d6b1c4a97"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "event_job",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("event_id", sa.String(length=100), nullable=True),
+        sa.Column("channel", sa.String(length=100), nullable=True),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "status", sa.String(length=10), server_default="queued", nullable=False
+        ),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "available_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("locked_by", sa.String(length=100), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("event_id"),
+    )
+    op.create_index(
+        "ix_event_job_pending",
+        "event_job",
+        ["id"],
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+    op.create_index(
+        "ix_event_job_pending_channel",
+        "event_job",
+        ["channel", "id"],
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_event_job_pending_channel", table_name="event_job")
+    op.drop_index("ix_event_job_pending", table_name="event_job")
+    op.drop_table("event_job")
@@ -0,0 +1,41 @@
+"""message query indexes
+
+Indexes for the Message hot paths: a bot's recent history in a channel
+(prompt building), the admin list sorted by created_at, and user_id
+lookups. They are built CONCURRENTLY so an existing, busy message table
+keeps accepting inserts while they build.
+
+Revision ID: 9c71a5e3d2b8
+Revises: 4b2d8e61f0a3
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9c71a5e3d2b8"
+down_revision = "4b2d8e61f0a3"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_message_bot_channel_created_at": "bot_id, channel, created_at",
+    "ix_message_created_at": "created_at",
+    "ix_message_user_id": "user_id",
+}
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON message ({columns})"
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,40 @@
+"""admission bucket
+
+The global LLM rate-limit buckets, kept in one row that every web and job
+worker process locks while drawing from it (see app/admission.py), so the
+organization quota holds however many processes run.
+
+Revision ID: c4e8a1f6b2d9
+Revises: 7a3e9d2c5b10
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c4e8a1f6b2d9"
+down_revision = "7a3e9d2c5b10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "admission_bucket",
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("requests", sa.Float(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("admission_bucket")
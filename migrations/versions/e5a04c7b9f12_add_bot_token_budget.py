@@ -0,0 +1,24 @@
+"""add bot token budget
+
+Revision ID: e5a04c7b9f12
+Revises: 9c71a5e3d2b8
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e5a04c7b9f12"
+down_revision = "9c71a5e3d2b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("slack_bot", sa.Column("token_budget", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("slack_bot", "token_budget")